@@ -4,6 +4,8 @@ AWS Batch processor for TotalSegmentator
 Processes NIFTI and DICOM files, generates 3D meshes, and uploads to S3
 """
 
+from startup import timeline
+
 import os
 import sys
 import json
@@ -11,12 +13,11 @@ import time
 import shutil
 import subprocess
 import tempfile
+from decimal import Decimal
 from pathlib import Path
 from typing import Dict, Any
 
 import boto3
-import nibabel as nib
-import numpy as np
 
 try:
     import pydicom
@@ -24,13 +25,16 @@ try:
 except ImportError:
     HAS_PYDICOM = False
     print("[batch] WARNING: pydicom not installed, DICOM metadata detection disabled")
+# nibabel, scipy, skimage and the mesh backends (via preflight/mesh_processing) are imported
+# where they are first needed, so they do not delay the start of the input download
+from totalseg_runner import Segmentation, TotalSegmentatorRunner
+import s3_transfer
+import weights
+from progress import ProgressReporter
+from telemetry import StageTelemetry
+from profiling import StageProfiler
+from job_queue import open_queue, LeaseKeeper
 
-from mesh_processing import (
-    mask_to_mesh,
-    export_obj_with_submeshes,
-)
-
-s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
 
 # Get environment variables
@@ -43,6 +47,35 @@ DEVICE = os.environ.get('DEVICE', 'gpu')
 FAST = os.environ.get('FAST', 'true').lower() == 'true'
 REDUCTION_PERCENT = int(os.environ.get('REDUCTION_PERCENT', '90'))
 TASK_OVERRIDE = os.environ.get('TASK_OVERRIDE', '')  # Force specific task if set
+# Upper bound for the TotalSegmentator CLI run so a pathological input cannot hold a GPU forever
+# (the in-process backend is bounded by the Batch attempt timeout instead)
+TOTALSEG_TIMEOUT_SEC = int(os.environ.get('TOTALSEG_TIMEOUT_SEC', '3600'))
+# Resampling/saving threads; preflight bounds the input size, so these can be raised safely
+NR_THR_RESAMP = os.environ.get('NR_THR_RESAMP', '1')
+NR_THR_SAVING = os.environ.get('NR_THR_SAVING', '1')
+# Result deduplication index (set by the process Lambda)
+DEDUP_KEY = os.environ.get('DEDUP_KEY', '')
+RESULTS_INDEX_TABLE = os.environ.get('RESULTS_INDEX_TABLE', '')
+# Index entries expire before the bucket lifecycle (90 days) removes the artifacts
+RESULTS_INDEX_TTL_DAYS = int(os.environ.get('RESULTS_INDEX_TTL_DAYS', '80'))
+# Worker mode: 'single' processes the job described by the env vars above,
+# 'queue' long-polls JOB_QUEUE_URL and processes jobs back to back
+WORKER_MODE = os.environ.get('WORKER_MODE', 'single')
+JOB_QUEUE_URL = os.environ.get('JOB_QUEUE_URL', '')
+WORKER_IDLE_TIMEOUT_SEC = int(os.environ.get('WORKER_IDLE_TIMEOUT_SEC', '300'))
+WORKER_MAX_JOBS = int(os.environ.get('WORKER_MAX_JOBS', '0'))  # 0 = unlimited
+# Batch attempt timeout of this worker (0 = none) and the time one job may take; no job is
+# started later than WORKER_MAX_LIFETIME_SEC - WORKER_JOB_RESERVE_SEC so none is killed midway
+WORKER_MAX_LIFETIME_SEC = int(os.environ.get('WORKER_MAX_LIFETIME_SEC', '0'))
+WORKER_JOB_RESERVE_SEC = int(os.environ.get('WORKER_JOB_RESERVE_SEC', '7200'))
+QUEUE_VISIBILITY_TIMEOUT_SEC = int(os.environ.get('QUEUE_VISIBILITY_TIMEOUT_SEC', '900'))
+# maxReceiveCount of WorkerJobQueue's redrive policy: on the last delivery of a message whose
+# earlier attempts crashed a worker, the study is marked failed instead of being run again
+QUEUE_MAX_RECEIVES = int(os.environ.get('QUEUE_MAX_RECEIVES', '3'))
+# Packed mode: JSON list of job descriptors (small studies grouped by the process Lambda)
+JOBS_JSON = os.environ.get('JOBS_JSON', '')
+# Opt-in profiling of selected stages, e.g. 'mesh,export' or 'all,memory' (see profiling.py)
+PROFILE = os.environ.get('PROFILE', '')
 
 
 # TotalSegmentator task selection based on DICOM metadata
@@ -51,6 +84,12 @@ DENTAL_KEYWORDS = ['dental', 'diente', 'dientes', 'teeth', 'tooth', 'maxil', 'ma
 HEAD_NECK_KEYWORDS = ['head', 'neck', 'cabeza', 'cuello', 'craneal', 'cranium', 'skull', 'face', 'facial', 'sinus', 'orbit']
 
 
+# Created once per container so the in-process backend keeps model weights loaded between runs
+runner = TotalSegmentatorRunner(nr_thr_resamp=NR_THR_RESAMP, nr_thr_saving=NR_THR_SAVING,
+                                timeout=TOTALSEG_TIMEOUT_SEC)
+timeline.mark('imports')
+
+
 def detect_totalsegmentator_task(dicom_path: Path) -> str:
     """
     Detect the appropriate TotalSegmentator task based on DICOM metadata.
@@ -113,7 +152,53 @@ def detect_totalsegmentator_task(dicom_path: Path) -> str:
         return 'total'
 
 
-def update_job_status(status: str, message: str = None, error: str = None, artifacts: Dict = None):
+def to_dynamodb_value(value: Any) -> Any:
+    """Recursively convert floats to Decimal (boto3 rejects float attributes)"""
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: to_dynamodb_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_dynamodb_value(v) for v in value]
+    return value
+
+
+def job_from_env() -> Dict[str, Any]:
+    """Job descriptor for the single-job mode (one Batch job per study)"""
+    return {
+        'jobId': JOB_ID,
+        's3Bucket': S3_BUCKET,
+        's3InputKey': S3_INPUT_KEY,
+        's3OutputPrefix': S3_OUTPUT_PREFIX,
+        'device': DEVICE,
+        'fast': FAST,
+        'reductionPercent': REDUCTION_PERCENT,
+        'taskOverride': TASK_OVERRIDE,
+        'dedupKey': DEDUP_KEY,
+        'profile': PROFILE,
+    }
+
+
+def job_from_message(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Job descriptor from a queue message; missing fields fall back to the container defaults"""
+    if not isinstance(body, dict):
+        raise ValueError(f"expected a JSON object, got {type(body).__name__}")
+    job_id = body['jobId']
+    return {
+        'jobId': job_id,
+        's3Bucket': body.get('s3Bucket', S3_BUCKET),
+        's3InputKey': body['s3InputKey'],
+        's3OutputPrefix': body.get('s3OutputPrefix', f'results/{job_id}/'),
+        'device': body.get('device', DEVICE),
+        'fast': str(body.get('fast', FAST)).lower() == 'true',
+        'reductionPercent': int(body.get('reductionPercent', REDUCTION_PERCENT)),
+        'taskOverride': body.get('taskOverride', ''),
+        'dedupKey': body.get('dedupKey', ''),
+        'profile': body.get('profile', ''),
+    }
+
+
+def update_job_status(job_id: str, status: str, message: str = None, error: str = None, artifacts: Dict = None):
     """Update job status in DynamoDB"""
     try:
         table = dynamodb.Table(DYNAMODB_TABLE)
@@ -127,7 +212,8 @@ def update_job_status(status: str, message: str = None, error: str = None, artif
         if status == 'processing':
             update_expr += ', startedAt = :now'
         elif status == 'completed':
-            update_expr += ', completedAt = :now'
+            update_expr += ', completedAt = :now, progress = :full'
+            expr_values[':full'] = 100
             if artifacts:
                 update_expr += ', artifacts = :artifacts'
                 expr_values[':artifacts'] = artifacts
@@ -141,7 +227,7 @@ def update_job_status(status: str, message: str = None, error: str = None, artif
             expr_values[':message'] = message
         
         table.update_item(
-            Key={'jobId': JOB_ID},
+            Key={'jobId': job_id},
             UpdateExpression=update_expr,
             ExpressionAttributeNames=expr_names,
             ExpressionAttributeValues=expr_values
@@ -151,30 +237,68 @@ def update_job_status(status: str, message: str = None, error: str = None, artif
         print(f"[batch] Error updating DynamoDB: {e}")
 
 
-def create_combined_label_map(seg_dir: Path, output_path: Path) -> Dict[str, int]:
-    """Combines individual NIFTI masks into a single label map and returns name->id map"""
-    print("[batch] Creating combined label map...")
-    label_map = {}
+def record_job_fields(job_id: str, fields: Dict[str, Any]):
+    """Set extra attributes on the job record without touching its status"""
     try:
-        nii_files = sorted([p for p in seg_dir.glob('*.nii*')])
-        if not nii_files: return {}
+        table = dynamodb.Table(DYNAMODB_TABLE)
+        update_expr = 'SET updatedAt = :now'
+        expr_names = {}
+        expr_values = {':now': int(time.time())}
+        for i, (field, value) in enumerate(fields.items()):
+            update_expr += f', #f{i} = :f{i}'
+            expr_names[f'#f{i}'] = field
+            expr_values[f':f{i}'] = to_dynamodb_value(value)
         
-        # Load reference image info
-        ref = nib.load(str(nii_files[0]))
-        combined = np.zeros(ref.shape, dtype=np.uint8)
-        affine = ref.affine
+        table.update_item(
+            Key={'jobId': job_id},
+            UpdateExpression=update_expr,
+            ExpressionAttributeNames=expr_names,
+            ExpressionAttributeValues=expr_values
+        )
+    except Exception as e:
+        print(f"[batch] Error updating DynamoDB: {e}")
+
+
+def register_results(job: Dict[str, Any], artifacts: Dict[str, str]):
+    """Record the artifacts under the job's dedup key so identical uploads can reuse them"""
+    if not job.get('dedupKey') or not RESULTS_INDEX_TABLE:
+        return
+    try:
+        now = int(time.time())
+        dynamodb.Table(RESULTS_INDEX_TABLE).put_item(Item={
+            'dedupKey': job['dedupKey'],
+            'sourceJobId': job['jobId'],
+            'artifacts': artifacts,
+            'createdAt': now,
+            'expiresAt': now + RESULTS_INDEX_TTL_DAYS * 24 * 60 * 60
+        })
+        print(f"[batch] Registered results under {job['dedupKey']}")
+    except Exception as e:
+        print(f"[batch] Error registering results: {e}")
+
+
+def upload_profiles(job_id: str, profiler: StageProfiler, profile_dir: Path, bucket: str, output_prefix: str):
+    """Upload PROFILE output under <output prefix>profile/ and list it on the job record"""
+    try:
+        uploads = [(path, bucket, f"{output_prefix}profile/{path.name}") for path in profiler.dump(profile_dir)]
+        s3_transfer.upload_many(uploads)
+        record_job_fields(job_id, {'profiles': [f"s3://{bucket}/{key}" for _, _, key in uploads]})
+    except Exception as e:
+        # Profiling is diagnostic only; a failed upload must not fail the job
+        print(f"[batch] Error uploading profiles: {e}")
+
+
+def create_combined_label_map(segmentation: Segmentation, output_path: Path) -> Dict[str, int]:
+    """Combines individual masks into a single label map and returns name->id map"""
+    print("[batch] Creating combined label map...")
+    import nibabel as nib
+    try:
+        combined, label_map = segmentation.label_volume()
+        if combined is None or not label_map:
+            return {}
         
-        for i, nii in enumerate(nii_files):
-             name = nii.name.replace('.nii.gz', '').replace('.nii', '')
-             label_id = i + 1
-             label_map[name] = label_id
-             
-             # Load mask data
-             data = nib.load(str(nii)).get_fdata()
-             combined[data > 0.5] = label_id
-             
         # Save combined
-        new_img = nib.Nifti1Image(combined, affine)
+        new_img = nib.Nifti1Image(combined, segmentation.affine)
         nib.save(new_img, str(output_path))
         print(f"[batch] Created combined label map with {len(label_map)} structures")
         return label_map
@@ -183,14 +307,21 @@ def create_combined_label_map(seg_dir: Path, output_path: Path) -> Dict[str, int
         return {}
 
 
-def main():
-    """Main processing function"""
-    print(f"[batch] Starting job {JOB_ID}")
-    print(f"[batch] Input: s3://{S3_BUCKET}/{S3_INPUT_KEY}")
-    print(f"[batch] Output: s3://{S3_BUCKET}/{S3_OUTPUT_PREFIX}")
+def process_job(job: Dict[str, Any]) -> int:
+    """Process one study end to end; returns 0 on success, 1 on failure"""
+    job_id = job['jobId']
+    bucket = job['s3Bucket']
+    input_key = job['s3InputKey']
+    output_prefix = job['s3OutputPrefix']
+    print(f"[batch] Starting job {job_id}")
+    print(f"[batch] Input: s3://{bucket}/{input_key}")
+    print(f"[batch] Output: s3://{bucket}/{output_prefix}")
     
     # Update status to processing
-    update_job_status('processing', 'AI is processing your study...')
+    update_job_status(job_id, 'processing', 'AI is processing your study...')
+    progress = ProgressReporter(job_id, record_job_fields)
+    profiler = StageProfiler(job.get('profile', ''))
+    telemetry = StageTelemetry(job_id, profiler if profiler.enabled else None)
     
     try:
         # Create temporary directory
@@ -203,12 +334,17 @@ def main():
             output_dir.mkdir(parents=True, exist_ok=True)
             
             # Download input from S3 preserving original filename
-            original_filename = Path(S3_INPUT_KEY).name
+            original_filename = Path(input_key).name
             download_path = work_dir / original_filename
             
             print(f"[batch] Downloading input file: {original_filename}")
-            s3.download_file(S3_BUCKET, S3_INPUT_KEY, str(download_path))
+            progress.update('downloading')
+            with telemetry.stage('download'):
+                transfers = [s3_transfer.download(bucket, input_key, download_path,
+                                                  on_progress=progress.callback('downloading'))]
             print(f"[batch] Downloaded {download_path.stat().st_size / 1024 / 1024:.1f} MB")
+            timeline.mark('input_downloaded')
+            progress.update('preparing')
             
             # Check if input is DICOM - convert to NIfTI using dcm2niix
             # dcm2niix is more robust than TotalSegmentator's internal dicom2nifti
@@ -240,7 +376,8 @@ def main():
                     str(dicom_dir)
                 ]
                 print(f"[batch] Running: {' '.join(dcm2niix_cmd)}")
-                dcm_result = subprocess.run(dcm2niix_cmd, capture_output=True, text=True)
+                with telemetry.stage('dcm2niix'):
+                    dcm_result = subprocess.run(dcm2niix_cmd, capture_output=True, text=True)
                 print(dcm_result.stdout)
                 if dcm_result.stderr:
                     print(f"[batch] dcm2niix stderr: {dcm_result.stderr}")
@@ -256,81 +393,78 @@ def main():
                 # Reorient to RAS (canonical orientation) for TotalSegmentator
                 # This ensures consistent orientation regardless of DICOM source
                 print(f"[batch] Reorienting to RAS (canonical orientation)...")
-                img = nib.load(str(converted_nifti))
-                canonical_img = nib.as_closest_canonical(img)
+                with telemetry.stage('reorient'):
+                    import nibabel as nib
+                    img = nib.load(str(converted_nifti))
+                    canonical_img = nib.as_closest_canonical(img)
                 
-                # Check current orientation
-                orig_ornt = nib.orientations.io_orientation(img.affine)
-                new_ornt = nib.orientations.io_orientation(canonical_img.affine)
-                orig_axcodes = nib.orientations.ornt2axcodes(orig_ornt)
-                new_axcodes = nib.orientations.ornt2axcodes(new_ornt)
-                print(f"[batch] Orientation: {orig_axcodes} -> {new_axcodes}")
+                    # Check current orientation
+                    orig_ornt = nib.orientations.io_orientation(img.affine)
+                    new_ornt = nib.orientations.io_orientation(canonical_img.affine)
+                    orig_axcodes = nib.orientations.ornt2axcodes(orig_ornt)
+                    new_axcodes = nib.orientations.ornt2axcodes(new_ornt)
+                    print(f"[batch] Orientation: {orig_axcodes} -> {new_axcodes}")
                 
-                # Save reoriented image
-                reoriented_path = nifti_dir / 'reoriented.nii.gz'
-                nib.save(canonical_img, str(reoriented_path))
+                    # Save reoriented image
+                    reoriented_path = nifti_dir / 'reoriented.nii.gz'
+                    nib.save(canonical_img, str(reoriented_path))
                 input_path = reoriented_path
                 print(f"[batch] Saved reoriented NIfTI: {input_path.name}")
             else:
                 input_path = download_path
             
             # Determine final task (env override takes precedence)
-            final_task = TASK_OVERRIDE if TASK_OVERRIDE else detected_task
+            final_task = job['taskOverride'] if job['taskOverride'] else detected_task
             print(f"[batch] Using TotalSegmentator task: '{final_task}'")
             
-            # Run TotalSegmentator with appropriate task
-            cmd = [
-                'TotalSegmentator',
-                '-i', str(input_path),
-                '-o', str(seg_dir),
-                '--nr_thr_resamp', '1',  # Reduce memory usage
-                '--nr_thr_saving', '1',  # Reduce memory usage
-            ]
-            
-            # Add task-specific options
-            if final_task != 'total':
-                cmd.extend(['--task', final_task])
-            
-            if DEVICE == 'cpu':
-                os.environ['CUDA_VISIBLE_DEVICES'] = ''
-            else:
-                cmd.extend(['-d', 'gpu'])  # Explicitly use GPU
+            # Preflight: resample oversized / sub-millimetre NIfTI inputs before inference (zips pass through)
+            from preflight import run_preflight
+            with telemetry.stage('preflight'):
+                input_path, preflight = run_preflight(input_path, work_dir, task=final_task)
+            record_job_fields(job_id, {'preflight': preflight})
             
+            # Run TotalSegmentator with appropriate task
             # Fast mode only for 'total' task (other tasks may not support it or it's not beneficial)
-            if FAST and final_task == 'total':
-                cmd.append('--fast')
-            
-            print(f"[batch] Running TotalSegmentator: {' '.join(cmd)}")
-            start_time = time.time()
+            device = 'cpu' if job['device'] == 'cpu' else 'gpu'
+            if not timeline.closed:
+                record_job_fields(job_id, {'startup': timeline.close()})
             
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            print(result.stdout)
-            
-            elapsed = time.time() - start_time
-            print(f"[batch] TotalSegmentator completed in {elapsed:.1f}s")
+            progress.update('segmenting')
+            with telemetry.stage('inference'):
+                segmentation = runner.run(input_path, seg_dir, task=final_task, fast=job['fast'], device=device,
+                                          on_progress=progress.callback('segmenting'))
             
             # Create combined label map for 2D overlay
             label_map_path = output_dir / 'segmentations.nii.gz'
-            label_map_dict = create_combined_label_map(seg_dir, label_map_path)
+            with telemetry.stage('label_map'):
+                label_map_dict = create_combined_label_map(segmentation, label_map_path)
 
             # Convert segmentations to meshes
+            from mesh_processing import mask_array_to_mesh, export_obj_with_submeshes
             print("[batch] Converting segmentations to 3D meshes...")
-            nii_files = sorted([p for p in seg_dir.glob('*.nii*') if p.is_file()])
-            print(f"[batch] Found {len(nii_files)} segmentation files")
+            structure_names = segmentation.names()
+            print(f"[batch] Found {len(structure_names)} segmentation classes")
+            progress.update('meshing')
             
             meshes = []
             names = []
             
-            for i, nii in enumerate(nii_files):
-                name = nii.name.replace('.nii.gz', '').replace('.nii', '')
-                print(f"[batch] Processing {i+1}/{len(nii_files)}: {name}")
+            for i, (name, mask) in enumerate(segmentation.iter_masks()):
+                print(f"[batch] Processing {i+1}: {name}")
+                progress.update('meshing', i / max(len(structure_names), 1),
+                                f"Building 3D models ({i + 1} of {len(structure_names)})...")
                 
-                mesh = mask_to_mesh(nii)
+                try:
+                    with telemetry.stage('mesh', structure=name):
+                        mesh = mask_array_to_mesh(mask, segmentation.spacing)
+                except Exception as e:
+                    print(f"[batch] Mesh generation failed for {name}: {e}")
+                    mesh = None
                 if mesh is None:
                     print(f"[batch] Skipping {name} (empty mesh)")
                     continue
                 
-                # Note: Decimation and smoothing are already handled inside mask_to_mesh -> clean_mesh
+                # Note: Decimation and smoothing are already handled inside mask_array_to_mesh -> clean_mesh
                 
                 meshes.append(mesh)
                 names.append(name)
@@ -339,22 +473,26 @@ def main():
                 raise ValueError("No valid meshes generated from segmentations")
             
             print(f"[batch] Exporting {len(meshes)} meshes to OBJ format...")
-            obj_path, mtl_path, json_path = export_obj_with_submeshes(meshes, names, output_dir, label_map=label_map_dict)
+            with telemetry.stage('export'):
+                obj_path, mtl_path, json_path = export_obj_with_submeshes(meshes, names, output_dir, label_map=label_map_dict)
             
             # Create zip archive (using zipfile directly to support ZIP64)
             import zipfile
             print("[batch] Creating zip archive...")
             zip_path = output_dir / 'result.zip'
-            with zipfile.ZipFile(str(zip_path), 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            with telemetry.stage('zip'), \
+                    zipfile.ZipFile(str(zip_path), 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
                 zf.write(obj_path, 'Result.obj')
                 zf.write(mtl_path, 'materials.mtl')
                 zf.write(json_path, 'Result.json')
                 if label_map_path.exists():
                     zf.write(label_map_path, 'segmentations.nii.gz')
             
-            # Upload results to S3
+            # Upload results to S3 (all artifacts in parallel)
             print("[batch] Uploading results to S3...")
+            progress.update('uploading')
             artifacts = {}
+            uploads = []
             
             for local_path, artifact_name in [
                 (obj_path, 'Result.obj'),
@@ -365,25 +503,45 @@ def main():
             ]:
                 if not local_path.exists(): continue
 
-                s3_key = f"{S3_OUTPUT_PREFIX}{artifact_name}"
-                file_size = Path(local_path).stat().st_size / 1024 / 1024
-                print(f"[batch] Uploading {artifact_name} ({file_size:.1f} MB)...")
-                
-                s3.upload_file(str(local_path), S3_BUCKET, s3_key)
-                artifacts[artifact_name.split('.')[0]] = f"s3://{S3_BUCKET}/{s3_key}"
+                s3_key = f"{output_prefix}{artifact_name}"
+                uploads.append((local_path, bucket, s3_key))
+                artifacts[artifact_name.split('.')[0]] = f"s3://{bucket}/{s3_key}"
+            
+            with telemetry.stage('upload'):
+                transfers.extend(s3_transfer.upload_many(uploads, on_progress=progress.callback('uploading')))
+            
+            # Stage timings as an artifact next to the results (the record keeps the per-stage totals)
+            timings_path = output_dir / 'timings.json'
+            telemetry.write_json(timings_path)
+            timings_key = f"{output_prefix}timings.json"
+            s3_transfer.upload(timings_path, bucket, timings_key)
+            artifacts['timings'] = f"s3://{bucket}/{timings_key}"
+            record_job_fields(job_id, {'transfers': transfers, 'timings': telemetry.summary()})
+            
+            if profiler.enabled:
+                upload_profiles(job_id, profiler, work_dir / 'profile', bucket, output_prefix)
             
             print(f"[batch] All artifacts uploaded successfully")
             
             # Update DynamoDB with completion status
-            update_job_status('completed', '3D models ready to view', artifacts=artifacts)
+            update_job_status(job_id, 'completed', '3D models ready to view', artifacts=artifacts)
+            register_results(job, artifacts)
             
-            print(f"[batch] Job {JOB_ID} completed successfully!")
+            print(f"[batch] Job {job_id} completed successfully!")
             return 0
             
+    except subprocess.TimeoutExpired:
+        error_msg = f"TotalSegmentator exceeded the {TOTALSEG_TIMEOUT_SEC}s time limit"
+        print(f"[batch] ERROR: {error_msg}")
+        record_job_fields(job_id, {'timings': telemetry.summary()})
+        update_job_status(job_id, 'failed', error=error_msg)
+        return 1
+        
     except subprocess.CalledProcessError as e:
         error_msg = f"TotalSegmentator failed: {e.stderr}"
         print(f"[batch] ERROR: {error_msg}")
-        update_job_status('failed', error=error_msg)
+        record_job_fields(job_id, {'timings': telemetry.summary()})
+        update_job_status(job_id, 'failed', error=error_msg)
         return 1
         
     except Exception as e:
@@ -391,8 +549,129 @@ def main():
         print(f"[batch] ERROR: {error_msg}")
         import traceback
         traceback.print_exc()
-        update_job_status('failed', error=error_msg)
+        record_job_fields(job_id, {'timings': telemetry.summary()})
+        update_job_status(job_id, 'failed', error=error_msg)
+        return 1
+
+
+def _queue_pending(queue) -> int:
+    try:
+        return queue.pending()
+    except Exception as e:
+        print(f"[worker] Queue depth check failed: {e}")
+        return 0
+
+
+def run_worker() -> int:
+    """
+    Queue-consumer mode: keep the container (CUDA context, loaded models) warm
+    and process queued jobs back to back until the queue stays empty for
+    WORKER_IDLE_TIMEOUT_SEC
+    """
+    if not JOB_QUEUE_URL:
+        print("[worker] JOB_QUEUE_URL is required in queue mode")
         return 1
+    
+    queue = open_queue(JOB_QUEUE_URL, visibility_timeout=QUEUE_VISIBILITY_TIMEOUT_SEC)
+    print(f"[worker] Polling {JOB_QUEUE_URL} (idle timeout {WORKER_IDLE_TIMEOUT_SEC}s)")
+    
+    processed, failed = 0, 0
+    started = idle_since = time.time()
+    while True:
+        if WORKER_MAX_JOBS and processed >= WORKER_MAX_JOBS:
+            print(f"[worker] Reached WORKER_MAX_JOBS={WORKER_MAX_JOBS}")
+            break
+        if WORKER_MAX_LIFETIME_SEC and time.time() - started > WORKER_MAX_LIFETIME_SEC - WORKER_JOB_RESERVE_SEC:
+            print(f"[worker] Too close to the {WORKER_MAX_LIFETIME_SEC}s attempt timeout for another job, exiting")
+            break
+        
+        remaining_idle = WORKER_IDLE_TIMEOUT_SEC - (time.time() - idle_since)
+        if remaining_idle <= 0:
+            # The process Lambda sees this worker as running until it exits, so a job sent
+            # during the last receive would otherwise wait for the next scheduled check
+            if _queue_pending(queue):
+                print("[worker] Idle timeout reached but messages are waiting, continuing")
+                idle_since = time.time()
+                continue
+            print(f"[worker] Idle for {WORKER_IDLE_TIMEOUT_SEC}s, exiting")
+            break
+        
+        message = queue.receive(wait_seconds=int(min(20, max(1, remaining_idle))))
+        if message is None:
+            continue
+        
+        try:
+            job = job_from_message(message.body)
+        except (KeyError, ValueError, TypeError) as e:
+            print(f"[worker] Dropping malformed message {message.body!r}: {e}")
+            queue.delete(message)
+            continue
+        
+        # process_job never raises, so a message seen again means a worker died while running it.
+        # Give up on the last delivery rather than let it reach the DLQ with the record still
+        # 'processing' (batch-events does not track queue workers)
+        if QUEUE_MAX_RECEIVES and message.receive_count >= QUEUE_MAX_RECEIVES:
+            print(f"[worker] Job {job['jobId']} was received {message.receive_count} times, marking it failed")
+            update_job_status(job['jobId'], 'failed',
+                              error=f"Worker stopped while processing this study ({message.receive_count - 1} attempts)")
+            queue.delete(message)
+            failed += 1
+            continue
+        
+        # Keep the message invisible while the job runs; delete it only once the job record is final
+        with LeaseKeeper(queue, message, interval=QUEUE_VISIBILITY_TIMEOUT_SEC / 3):
+            result = process_job(job)
+        queue.delete(message)
+        
+        processed += 1
+        failed += result
+        idle_since = time.time()
+        print(f"[worker] {processed} job(s) processed, {failed} failed")
+    
+    return 0
+
+
+def run_jobs(jobs) -> int:
+    """
+    Process the given jobs back to back in this container. Used for a single
+    study and for packs of small studies, which share one container start and
+    one warm model; each job's status is updated on its own record.
+    """
+    failed = 0
+    for i, job in enumerate(jobs):
+        if len(jobs) > 1:
+            print(f"[pack] Job {i + 1}/{len(jobs)}: {job['jobId']}")
+        failed += process_job(job)
+    if len(jobs) > 1:
+        print(f"[pack] {len(jobs) - failed}/{len(jobs)} job(s) succeeded")
+    return 1 if failed else 0
+
+
+def main():
+    """Main processing function"""
+    if WORKER_MODE == 'queue':
+        jobs = []
+    elif JOBS_JSON:
+        jobs = [job_from_message(body) for body in json.loads(JOBS_JSON)]
+    else:
+        jobs = [job_from_env()]
+    
+    # Fail fast on missing/corrupt baked weights rather than downloading them mid-job
+    try:
+        record = weights.verify()
+    except weights.WeightsError as e:
+        print(f"[batch] ERROR: {e}")
+        for job in jobs:
+            update_job_status(job['jobId'], 'failed', error=f"Worker model weights invalid: {e}")
+        return 1
+    timeline.mark('weights_verified' if record.get('verified') else 'weights_unverified')
+    
+    # Import TotalSegmentator/torch in the background while the first input downloads
+    runner.start_warm_up()
+    
+    if WORKER_MODE == 'queue':
+        return run_worker()
+    return run_jobs(jobs)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Job queues for the long-running Batch worker
+SQS in production, a SQLite file as a local stand-in for testing
+"""
+
+import json
+import time
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+
+class QueueMessage:
+    """
+    A received job descriptor plus the handle needed to ack or extend it.
+    body is whatever the message held (not necessarily a dict); receive_count
+    counts this delivery, so it is 1 the first time a message is received.
+    """
+
+    def __init__(self, body: Any, receipt: str, receive_count: int = 1):
+        self.body = body
+        self.receipt = receipt
+        self.receive_count = receive_count
+
+
+def _parse_body(raw: str) -> Any:
+    """Decoded JSON body, or the raw text when it is not JSON (rejected by the worker)"""
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+
+class SQSJobQueue:
+    """Long-polling consumer/producer for an SQS queue of job descriptors"""
+
+    def __init__(self, queue_url: str, visibility_timeout: int = 900):
+        import boto3
+        self.queue_url = queue_url
+        self.visibility_timeout = visibility_timeout
+        self.sqs = boto3.client('sqs')
+
+    def send(self, body: Dict[str, Any]):
+        self.sqs.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(body))
+
+    def receive(self, wait_seconds: int = 20) -> Optional[QueueMessage]:
+        resp = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=1,
+            WaitTimeSeconds=min(wait_seconds, 20),
+            VisibilityTimeout=self.visibility_timeout,
+            AttributeNames=['ApproximateReceiveCount'],
+        )
+        messages = resp.get('Messages', [])
+        if not messages:
+            return None
+        msg = messages[0]
+        receive_count = int(msg.get('Attributes', {}).get('ApproximateReceiveCount', 1))
+        return QueueMessage(_parse_body(msg['Body']), msg['ReceiptHandle'], receive_count)
+
+    def extend(self, message: QueueMessage):
+        self.sqs.change_message_visibility(
+            QueueUrl=self.queue_url,
+            ReceiptHandle=message.receipt,
+            VisibilityTimeout=self.visibility_timeout,
+        )
+
+    def delete(self, message: QueueMessage):
+        self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message.receipt)
+
+    def pending(self) -> int:
+        """Approximate number of messages waiting to be received (in-flight ones are not counted)"""
+        resp = self.sqs.get_queue_attributes(QueueUrl=self.queue_url,
+                                             AttributeNames=['ApproximateNumberOfMessages'])
+        return int(resp.get('Attributes', {}).get('ApproximateNumberOfMessages', 0))
+
+
+class LocalJobQueue:
+    """
+    SQLite-backed queue with the same lease semantics as SQS:
+    a received message is hidden until its lease expires or it is deleted.
+    """
+
+    def __init__(self, path: str, visibility_timeout: int = 900, poll_interval: float = 0.5):
+        self.path = str(path)
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS messages ('
+                'id TEXT PRIMARY KEY, body TEXT NOT NULL, enqueued_at REAL NOT NULL, '
+                'visible_at REAL NOT NULL, receipt TEXT, receives INTEGER NOT NULL DEFAULT 0)'
+            )
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(messages)')]
+            if 'receives' not in columns:  # queue file created before receive counts were tracked
+                conn.execute('ALTER TABLE messages ADD COLUMN receives INTEGER NOT NULL DEFAULT 0')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level='IMMEDIATE')
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def send(self, body: Dict[str, Any]):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('INSERT INTO messages (id, body, enqueued_at, visible_at) VALUES (?, ?, ?, ?)',
+                         (uuid.uuid4().hex, json.dumps(body), now, now))
+
+    def receive(self, wait_seconds: int = 20) -> Optional[QueueMessage]:
+        deadline = time.time() + wait_seconds
+        while True:
+            now = time.time()
+            with self._connect() as conn:
+                row = conn.execute('SELECT id, body, receives FROM messages WHERE visible_at <= ? '
+                                   'ORDER BY enqueued_at LIMIT 1', (now,)).fetchone()
+                if row:
+                    receipt = f"{row[0]}:{uuid.uuid4().hex}"
+                    conn.execute('UPDATE messages SET visible_at = ?, receipt = ?, receives = receives + 1 '
+                                 'WHERE id = ?', (now + self.visibility_timeout, receipt, row[0]))
+                    return QueueMessage(_parse_body(row[1]), receipt, row[2] + 1)
+            if now >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def extend(self, message: QueueMessage):
+        with self._connect() as conn:
+            conn.execute('UPDATE messages SET visible_at = ? WHERE receipt = ?',
+                         (time.time() + self.visibility_timeout, message.receipt))
+
+    def delete(self, message: QueueMessage):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM messages WHERE receipt = ?', (message.receipt,))
+
+    def pending(self) -> int:
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM messages WHERE visible_at <= ?', (time.time(),)).fetchone()[0]
+
+    def depth(self) -> int:
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+
+def open_queue(url: str, visibility_timeout: int = 900):
+    """SQS for https:// URLs, LocalJobQueue for sqlite:///path or a plain file path"""
+    if url.startswith('https://'):
+        return SQSJobQueue(url, visibility_timeout)
+    if url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return LocalJobQueue(url, visibility_timeout)
+
+
+class LeaseKeeper:
+    """Extends a message's visibility in the background while its job is running"""
+
+    def __init__(self, queue, message: QueueMessage, interval: float):
+        self.queue = queue
+        self.message = message
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.queue.extend(self.message)
+            except Exception as e:
+                print(f"[queue] Failed to extend lease: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join(timeout=5)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Input preflight for the Batch worker
+Reads the NIfTI header and, when the volume is too large or too finely sampled,
+resamples it to a coarser grid before TotalSegmentator runs
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+import nibabel as nib
+from nibabel.affines import rescale_affine
+from scipy import ndimage
+
+
+# Thresholds (env-configurable so they can be tuned from the job definition)
+MAX_VOXELS = int(os.environ.get('PREFLIGHT_MAX_VOXELS', str(512 * 512 * 800)))
+MIN_SPACING_MM = float(os.environ.get('PREFLIGHT_MIN_SPACING_MM', '0.5'))
+TARGET_SPACING_MM = float(os.environ.get('PREFLIGHT_TARGET_SPACING_MM', '1.0'))
+ENABLED = os.environ.get('PREFLIGHT_RESAMPLE', 'true').lower() == 'true'
+
+# Dental CBCTs are sub-millimetre by design and the 'teeth' model needs that
+# resolution, so only the voxel budget applies to them
+SPACING_EXEMPT_TASKS = {'teeth'}
+
+# Anything else (e.g. a zipped DICOM series) goes to TotalSegmentator untouched
+NIFTI_SUFFIXES = ('.nii', '.nii.gz')
+
+
+def read_header(nii_path: Path) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+    """Return (shape, spacing) of the first three axes without loading voxel data"""
+    img = nib.load(str(nii_path))
+    shape = tuple(int(s) for s in img.shape[:3])
+    spacing = tuple(float(z) for z in img.header.get_zooms()[:3])
+    return shape, spacing
+
+
+def plan_resampling(shape: Tuple[int, ...], spacing: Tuple[float, ...], task: str = 'total',
+                    max_voxels: int = MAX_VOXELS, min_spacing: float = MIN_SPACING_MM,
+                    target_spacing: float = TARGET_SPACING_MM) -> Dict[str, Any]:
+    """
+    Decide whether a volume needs resampling and to which grid.
+
+    Axes finer than min_spacing are coarsened to target_spacing; if the volume
+    is still above the voxel budget, all axes are scaled by the same factor
+    until it fits.
+    """
+    voxels = int(np.prod(shape))
+    reasons: List[str] = []
+    new_spacing = np.asarray(spacing, dtype=np.float64)
+
+    if task not in SPACING_EXEMPT_TASKS and min(spacing) < min_spacing:
+        reasons.append('spacing')
+        new_spacing = np.where(new_spacing < min_spacing, np.maximum(new_spacing, target_spacing), new_spacing)
+
+    new_shape = np.maximum(1, np.round(np.asarray(shape) * np.asarray(spacing) / new_spacing)).astype(int)
+
+    if int(np.prod(new_shape)) > max_voxels:
+        reasons.append('voxels')
+        factor = (np.prod(new_shape) / float(max_voxels)) ** (1.0 / 3.0)
+        new_spacing = new_spacing * factor
+        new_shape = np.maximum(1, np.floor(np.asarray(shape) * np.asarray(spacing) / new_spacing)).astype(int)
+
+    return {
+        'resample': bool(reasons),
+        'reasons': reasons,
+        'task': task,
+        'originalShape': [int(s) for s in shape],
+        'originalSpacing': [round(float(z), 4) for z in spacing],
+        'originalVoxels': voxels,
+        'targetShape': [int(s) for s in new_shape],
+        'targetSpacing': [round(float(z), 4) for z in new_spacing],
+        'targetVoxels': int(np.prod(new_shape)),
+    }
+
+
+def resample_volume(nii_path: Path, out_path: Path, target_shape: List[int]) -> Path:
+    """
+    Resample a NIfTI volume to target_shape with trilinear interpolation.
+    The affine is rescaled around the volume centre so world coordinates match.
+    """
+    img = nib.load(str(nii_path))
+    data = img.get_fdata(dtype=np.float32)
+    if data.ndim > 3:
+        data = data[..., 0]
+
+    factors = [t / float(s) for t, s in zip(target_shape, data.shape)]
+    resampled = ndimage.zoom(data, factors, order=1, prefilter=False, grid_mode=True, mode='nearest')
+    del data
+
+    new_zooms = [float(z) / f for z, f in zip(img.header.get_zooms()[:3], factors)]
+    affine = rescale_affine(img.affine, img.shape[:3], new_zooms, resampled.shape)
+
+    on_disk_dtype = img.header.get_data_dtype()
+    if np.issubdtype(on_disk_dtype, np.integer):
+        resampled = np.rint(resampled).astype(on_disk_dtype)
+
+    new_img = nib.Nifti1Image(resampled, affine)
+    new_img.header.set_xyzt_units(*img.header.get_xyzt_units())
+    nib.save(new_img, str(out_path))
+    return out_path
+
+
+def run_preflight(nii_path: Path, work_dir: Path, task: str = 'total') -> Tuple[Path, Dict[str, Any]]:
+    """
+    Inspect the input and resample it if needed.
+    Returns the path TotalSegmentator should read and the decision record.
+    """
+    if not nii_path.name.lower().endswith(NIFTI_SUFFIXES):
+        print(f"[preflight] Skipped: {nii_path.name} is not NIfTI")
+        return nii_path, {'resample': False, 'skipped': 'not-nifti', 'task': task}
+    start = time.time()
+    shape, spacing = read_header(nii_path)
+    decision = plan_resampling(shape, spacing, task=task)
+    decision['enabled'] = ENABLED
+    print(f"[preflight] Input {decision['originalShape']} @ {decision['originalSpacing']} mm "
+          f"({decision['originalVoxels'] / 1e6:.1f} Mvox)")
+
+    output_path = nii_path
+    if decision['resample'] and ENABLED:
+        print(f"[preflight] Resampling ({', '.join(decision['reasons'])}) to "
+              f"{decision['targetShape']} @ {decision['targetSpacing']} mm")
+        output_path = resample_volume(nii_path, work_dir / 'preflight_resampled.nii.gz', decision['targetShape'])
+    elif decision['resample']:
+        print("[preflight] Resampling recommended but disabled (PREFLIGHT_RESAMPLE=false)")
+        decision['resample'] = False
+    else:
+        print("[preflight] Input within limits, no resampling needed")
+
+    decision['elapsedSec'] = round(time.time() - start, 2)
+    print(f"[preflight] Completed in {decision['elapsedSec']:.1f}s")
+    return output_path, decision
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Opt-in profiling of pipeline stages (PROFILE job parameter)
+PROFILE is a comma-separated list of stage names as recorded by telemetry
+(e.g. 'mesh,export', or 'all'), optionally with:
+  sampling  stack sampling only (low overhead), no cProfile
+  memory    tracemalloc allocation diff per stage call
+Each profiled stage produces <stage>.prof (cProfile, for snakeviz/pstats),
+<stage>.txt (top functions by cumulative time) and <stage>.folded (sampled
+stacks in collapsed format for flamegraph.pl / speedscope)
+"""
+
+import io
+import os
+import sys
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PROFILE_SAMPLE_MS = float(os.environ.get('PROFILE_SAMPLE_MS', '5'))
+MEMORY_TOP_LINES = 25
+REPORT_TOP_FUNCTIONS = 60
+MODIFIERS = {'all', 'sampling', 'memory'}
+
+
+class _StackSampler:
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, thread_id: int, counts: Counter, interval: float):
+        self.thread_id = thread_id
+        self.counts = counts
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class StageProfiler:
+    """Profiles the stages named in a PROFILE spec; a no-op for an empty spec"""
+
+    def __init__(self, spec: str = ''):
+        tokens = {t.strip().lower() for t in (spec or '').split(',') if t.strip()}
+        self.stages = tokens - MODIFIERS
+        self.all = 'all' in tokens
+        self.sampling_only = 'sampling' in tokens
+        self.memory = 'memory' in tokens
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._samples: Dict[str, Counter] = {}
+        self._memory: Dict[str, List[str]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.all or bool(self.stages)
+
+    def wants(self, stage: str) -> bool:
+        return self.all or stage in self.stages
+
+    @contextmanager
+    def profile(self, stage: str, label: Optional[str] = None):
+        """Profile the enclosed block; repeated calls for one stage (per-structure mesh) accumulate"""
+        if not self.wants(stage):
+            yield
+            return
+
+        before = None
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+
+        counts = self._samples.setdefault(stage, Counter())
+        profiler = None if self.sampling_only else self._profiles.setdefault(stage, cProfile.Profile())
+        with _StackSampler(threading.get_ident(), counts, PROFILE_SAMPLE_MS / 1000):
+            if profiler:
+                profiler.enable()
+            try:
+                yield
+            finally:
+                if profiler:
+                    profiler.disable()
+
+        if before is not None:
+            self._record_memory(stage, label, before)
+
+    def _record_memory(self, stage: str, label: Optional[str], before):
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        lines = [f"== {stage}{f' [{label}]' if label else ''}: peak traced {peak / 1024 / 1024:.1f} MB"]
+        for stat in after.compare_to(before, 'lineno')[:MEMORY_TOP_LINES]:
+            lines.append(str(stat))
+        self._memory.setdefault(stage, []).append('\n'.join(lines))
+
+    def dump(self, out_dir: Path) -> List[Path]:
+        """Write every collected profile into out_dir; returns the files written"""
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+        for stage, profiler in self._profiles.items():
+            prof_path = out_dir / f'{stage}.prof'
+            profiler.dump_stats(str(prof_path))
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(REPORT_TOP_FUNCTIONS)
+            (out_dir / f'{stage}.txt').write_text(report.getvalue())
+            written += [prof_path, out_dir / f'{stage}.txt']
+        for stage, counts in self._samples.items():
+            if not counts:
+                continue
+            folded_path = out_dir / f'{stage}.folded'
+            folded_path.write_text(''.join(f'{stack} {n}\n' for stack, n in counts.most_common()))
+            written.append(folded_path)
+        for stage, sections in self._memory.items():
+            memory_path = out_dir / f'{stage}.memory.txt'
+            memory_path.write_text('\n\n'.join(sections) + '\n')
+            written.append(memory_path)
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        print(f"[profile] Wrote {len(written)} profile files to {out_dir}")
+        return written
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Job progress reporting for the Batch worker
+Each stage owns a slice of the overall 0-100 range; stage-local fractions are
+mapped into it and written to the job record at most once per
+PROGRESS_INTERVAL_SEC, so the UI sees live progress without a write per log line
+"""
+
+import os
+import time
+import threading
+from typing import Callable, Dict, Any, Optional, Tuple
+
+PROGRESS_INTERVAL_SEC = float(os.environ.get('PROGRESS_INTERVAL_SEC', '5'))
+
+# stage -> (start %, end %, message shown to the user)
+STAGES: Dict[str, Tuple[int, int, str]] = {
+    'downloading': (0, 10, 'Downloading your study...'),
+    'preparing': (10, 15, 'Preparing the volume...'),
+    'segmenting': (15, 75, 'AI is segmenting your study...'),
+    'meshing': (75, 90, 'Building 3D models...'),
+    'uploading': (90, 100, 'Uploading results...'),
+}
+
+
+class ProgressReporter:
+    """Throttled progress writer for one job; safe to call from transfer/reader threads"""
+
+    def __init__(self, job_id: str, write: Callable[[str, Dict[str, Any]], None],
+                 interval: float = PROGRESS_INTERVAL_SEC):
+        self.job_id = job_id
+        self.write = write
+        self.interval = interval
+        self.stage = None
+        self.percent = 0
+        self.detail = None
+        self._written = None
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, stage: str, fraction: Optional[float] = None, detail: Optional[str] = None):
+        """Report progress within a stage (fraction 0-1, None keeps the stage start)"""
+        start, end, _ = STAGES[stage]
+        fraction = min(max(fraction or 0.0, 0.0), 1.0)
+        with self._lock:
+            # Never move backwards (e.g. a second TotalSegmentator part restarting its bar)
+            percent = max(int(start + (end - start) * fraction), self.percent if stage == self.stage else start)
+            # Stage changes are written at once (a handful per job); in-stage updates are throttled
+            due = stage != self.stage or time.time() - self._last_write >= self.interval
+            self.stage, self.percent, self.detail = stage, percent, detail
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the current state now if it changed since the last write"""
+        with self._lock:
+            if self.stage is None:
+                return
+            state = (self.stage, self.percent, self.detail)
+            if state == self._written:
+                return
+            self._written = state
+            self._last_write = time.time()
+        fields = {
+            'stage': state[0],
+            'progress': state[1],
+            'message': state[2] or STAGES[state[0]][2],
+        }
+        self.write(self.job_id, fields)
+        print(f"[progress] {self.job_id}: {state[0]} {state[1]}%")
+
+    def callback(self, stage: str) -> Callable[[float, Optional[str]], None]:
+        """update() bound to one stage, for runners and transfers that report a fraction"""
+        return lambda fraction, detail=None: self.update(stage, fraction, detail)
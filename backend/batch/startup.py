@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Startup timeline for the worker entry points
+Marks are measured from process start (read from /proc when available), so
+interpreter start-up and imports are included in time-to-first-voxel
+"""
+
+import os
+import time
+from typing import Dict, Any, List, Tuple
+
+
+def _process_start_time() -> float:
+    """Wall-clock time the current process started (Linux), else now"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 is start time in clock ticks since boot; comm (field 2) may contain spaces
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+class StartupTimeline:
+    """Ordered (event, seconds since process start) marks; closed once the first job reaches inference"""
+
+    def __init__(self, origin: float = None):
+        self.origin = origin if origin is not None else _process_start_time()
+        self.marks: List[Tuple[str, float]] = []
+        self.closed = False
+
+    def mark(self, event: str):
+        if self.closed:
+            return
+        elapsed = time.time() - self.origin
+        self.marks.append((event, round(elapsed, 3)))
+        print(f"[startup] +{elapsed:.2f}s {event}")
+
+    def close(self, event: str = 'first_voxel') -> Dict[str, Any]:
+        """Record the final mark and return the summary"""
+        self.mark(event)
+        self.closed = True
+        return self.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'marks': dict(self.marks),
+            'timeToFirstVoxelSec': self.marks[-1][1] if self.closed and self.marks else None,
+        }
+
+
+# Created at first import, i.e. as early as the entry point imports it
+timeline = StartupTimeline()
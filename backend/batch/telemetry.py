@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing and resource telemetry for the Batch worker
+Each stage records wall time, CPU time (this process plus reaped children such
+as dcm2niix or the TotalSegmentator CLI), peak RSS and bytes read/written, and
+emits a CloudWatch Embedded Metric Format line so regressions can be found by
+stage and by structure
+"""
+
+import os
+import json
+import time
+import resource
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Any, List, Optional
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'IrisOculus/Batch')
+EMIT_EMF = os.environ.get('EMIT_EMF', 'true').lower() == 'true'
+
+
+def _cpu_seconds() -> float:
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _io_bytes() -> Dict[str, int]:
+    """rchar/wchar from /proc/self/io (includes network and reaped children); zeros elsewhere"""
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(':', 1) for line in f.read().splitlines())
+        return {'read': int(fields['rchar']), 'written': int(fields['wchar'])}
+    except (OSError, KeyError, ValueError):
+        return {'read': 0, 'written': 0}
+
+
+def _reset_peak_rss() -> bool:
+    """Reset VmHWM so the next reading is this stage's peak (Linux >= 4.0)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    # ru_maxrss is in KB on Linux; lifetime peak when VmHWM is unavailable
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _children_peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+class StageTelemetry:
+    """Collects stage records for one job"""
+
+    def __init__(self, job_id: str, profiler=None):
+        self.job_id = job_id
+        # Optional profiling.StageProfiler wrapped around the stages it selects
+        self.profiler = profiler
+        self.started = time.time()
+        self.stages: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def stage(self, name: str, structure: Optional[str] = None):
+        """Measure the enclosed block; the record is kept even if it raises"""
+        _reset_peak_rss()
+        io_start = _io_bytes()
+        child_rss_start = _children_peak_rss_mb()
+        cpu_start = _cpu_seconds()
+        wall_start = time.perf_counter()
+        failed = False
+        profiling = self.profiler.profile(name, structure) if self.profiler else nullcontext()
+        try:
+            with profiling:
+                yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            io_end = _io_bytes()
+            # RUSAGE_CHILDREN only keeps the largest child ever reaped, so a child
+            # peak is attributed to this stage only when it raised that maximum
+            child_rss = _children_peak_rss_mb()
+            record = {
+                'stage': name,
+                'wallSec': round(time.perf_counter() - wall_start, 3),
+                'cpuSec': round(_cpu_seconds() - cpu_start, 3),
+                'peakRssMB': round(_peak_rss_mb(), 1),
+                'childPeakRssMB': round(child_rss, 1) if child_rss > child_rss_start else 0.0,
+                'readMB': round((io_end['read'] - io_start['read']) / 1024 / 1024, 2),
+                'writtenMB': round((io_end['written'] - io_start['written']) / 1024 / 1024, 2),
+            }
+            if structure:
+                record['structure'] = structure
+            if failed:
+                record['failed'] = True
+            self.stages.append(record)
+            self._emit(record)
+
+    def _emit(self, record: Dict[str, Any]):
+        if not EMIT_EMF:
+            return
+        dimensions = [['Stage', 'Structure']] if 'structure' in record else [['Stage']]
+        line = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': dimensions,
+                    'Metrics': [
+                        {'Name': 'WallTime', 'Unit': 'Seconds'},
+                        {'Name': 'CpuTime', 'Unit': 'Seconds'},
+                        {'Name': 'PeakRss', 'Unit': 'Megabytes'},
+                        {'Name': 'BytesRead', 'Unit': 'Megabytes'},
+                        {'Name': 'BytesWritten', 'Unit': 'Megabytes'},
+                    ],
+                }],
+            },
+            'Stage': record['stage'],
+            'JobId': self.job_id,
+            'WallTime': record['wallSec'],
+            'CpuTime': record['cpuSec'],
+            'PeakRss': max(record['peakRssMB'], record['childPeakRssMB']),
+            'BytesRead': record['readMB'],
+            'BytesWritten': record['writtenMB'],
+        }
+        if 'structure' in record:
+            line['Structure'] = record['structure']
+        print(json.dumps(line))
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Per-stage totals for the job record; per-structure stages are folded into
+        one entry with a count and the slowest structure (the full list goes to timings.json)
+        """
+        totals: Dict[str, Dict[str, Any]] = {}
+        for record in self.stages:
+            entry = totals.setdefault(record['stage'], {
+                'wallSec': 0.0, 'cpuSec': 0.0, 'peakRssMB': 0.0, 'readMB': 0.0, 'writtenMB': 0.0, 'count': 0
+            })
+            for key in ('wallSec', 'cpuSec', 'readMB', 'writtenMB'):
+                entry[key] = round(entry[key] + record[key], 3)
+            entry['peakRssMB'] = max(entry['peakRssMB'], record['peakRssMB'], record['childPeakRssMB'])
+            entry['count'] += 1
+            if 'structure' in record and record['wallSec'] >= entry.get('slowestSec', -1):
+                entry['slowest'] = record['structure']
+                entry['slowestSec'] = record['wallSec']
+        return {'totalSec': round(time.time() - self.started, 3), 'stages': totals}
+
+    def write_json(self, path) -> None:
+        with open(path, 'w') as f:
+            json.dump({'jobId': self.job_id, **self.summary(), 'records': self.stages}, f, indent=2)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Device slots for the local FastAPI server (app.py)
+Each GPU is one slot and the CPU offers APP_CPU_SLOTS more. A job holds one
+slot while TotalSegmentator runs and waits in line when none is free; the
+device only reaches that job's runner call (and its subprocess environment),
+never the server's own os.environ.
+"""
+
+import os
+import time
+import threading
+import subprocess
+from typing import Dict, Any, List, Optional
+
+# 'auto' asks nvidia-smi; '0,1' declares GPUs by index ('' for none)
+APP_GPUS = os.environ.get('APP_GPUS', 'auto')
+# Concurrent CPU-only jobs
+APP_CPU_SLOTS = int(os.environ.get('APP_CPU_SLOTS', '1'))
+
+
+class DeviceUnavailable(Exception):
+    pass
+
+
+def detect_gpus(spec: str = APP_GPUS) -> List[int]:
+    """GPU indices from APP_GPUS, or from nvidia-smi when it is 'auto'"""
+    if spec.strip().lower() != 'auto':
+        return [int(i) for i in spec.split(',') if i.strip()]
+    try:
+        out = subprocess.run(['nvidia-smi', '-L'], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    count = sum(1 for line in out.splitlines() if line.startswith('GPU '))
+    # Indices as the process sees them, so they match CUDA_VISIBLE_DEVICES if it is set
+    visible = os.environ.get('CUDA_VISIBLE_DEVICES')
+    if visible is not None:
+        count = min(count, len([v for v in visible.split(',') if v.strip()]))
+    return list(range(count))
+
+
+class Slot:
+    def __init__(self, kind: str, index: int):
+        self.kind = kind
+        self.index = index
+        self.name = f"{kind}:{index}"
+        self.job_id: Optional[str] = None
+        self.since = 0.0
+        self.jobs = 0
+        self.busy_sec = 0.0
+
+    @property
+    def device(self) -> str:
+        """Device argument for TotalSegmentatorRunner.run"""
+        return 'cpu' if self.kind == 'cpu' else self.name
+
+
+class DeviceScheduler:
+    """
+    Hands out slots for device requests: 'cpu', 'gpu' (any GPU), 'gpu:X' or
+    'auto' (a free GPU, else the CPU). 'gpu' falls back to the CPU on a box
+    without GPUs, as TotalSegmentator itself would.
+    """
+
+    def __init__(self, gpus: Optional[List[int]] = None, cpu_slots: int = APP_CPU_SLOTS):
+        gpus = detect_gpus() if gpus is None else gpus
+        self.slots = [Slot('gpu', i) for i in gpus] + [Slot('cpu', i) for i in range(max(cpu_slots, 1))]
+        self._cond = threading.Condition()
+        self._waiting = 0
+        self._waits = 0
+        self._wait_sec = 0.0
+        print(f"[devices] Slots: {', '.join(s.name for s in self.slots)}")
+
+    def candidates(self, request: str) -> List[Slot]:
+        """Slots that may serve request, in order of preference; raises DeviceUnavailable"""
+        request = (request or 'cpu').strip().lower()
+        gpus = [s for s in self.slots if s.kind == 'gpu']
+        cpus = [s for s in self.slots if s.kind == 'cpu']
+        if request == 'cpu':
+            return cpus
+        if request == 'auto':
+            return gpus + cpus
+        if request in ('gpu', 'cuda'):
+            return gpus or cpus
+        if request.startswith(('gpu:', 'cuda:')):
+            name = 'gpu:' + request.split(':', 1)[1]
+            match = [s for s in gpus if s.name == name]
+            if not match:
+                raise DeviceUnavailable(f"Device '{request}' not available (slots: {', '.join(s.name for s in self.slots)})")
+            return match
+        raise DeviceUnavailable(f"Unknown device '{request}' (cpu | gpu | gpu:X | auto)")
+
+    def acquire(self, request: str, job_id: str, timeout: Optional[float] = None) -> Slot:
+        """Block until a slot for request is free and take it; raises DeviceUnavailable"""
+        candidates = self.candidates(request)
+        start = time.time()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    slot = next((s for s in candidates if s.job_id is None), None)
+                    if slot is not None:
+                        break
+                    remaining = None if timeout is None else timeout - (time.time() - start)
+                    if remaining is not None and remaining <= 0:
+                        raise DeviceUnavailable(f"No '{request}' slot free after {timeout:.0f}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            waited = time.time() - start
+            self._waits += 1
+            self._wait_sec += waited
+            slot.job_id = job_id
+            slot.since = time.time()
+        if waited >= 1:
+            print(f"[devices] {job_id} waited {waited:.1f}s for {slot.name}")
+        return slot
+
+    def release(self, slot: Slot):
+        with self._cond:
+            slot.busy_sec += time.time() - slot.since
+            slot.jobs += 1
+            slot.job_id = None
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._cond:
+            return {
+                'waiting': self._waiting,
+                'avgWaitSec': round(self._wait_sec / self._waits, 2) if self._waits else 0.0,
+                'slots': [{
+                    'slot': s.name,
+                    'jobId': s.job_id,
+                    'jobs': s.jobs,
+                    'busySec': round(s.busy_sec + (now - s.since if s.job_id else 0.0), 1),
+                } for s in self.slots],
+            }
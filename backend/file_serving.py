@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Job file responses for the local FastAPI server (app.py)
+Strong ETags with If-None-Match -> 304, single byte ranges (If-Range aware),
+precompressed .br/.gz siblings for clients that accept them, and immutable
+caching once a job has finished. Finished jobs get their text artifacts
+precompressed by precompress(), so repeat viewer loads are 304s or small
+compressed transfers.
+"""
+
+import os
+import gzip
+import shutil
+import mimetypes
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Sibling encodings written for finished artifacts ('' disables)
+APP_PRECOMPRESS = [e.strip() for e in os.environ.get('APP_PRECOMPRESS', 'br,gz').split(',') if e.strip()]
+PRECOMPRESS_MIN_BYTES = 1024
+# Already compressed: a sibling would not be smaller
+COMPRESSED_SUFFIXES = {'.gz', '.br', '.zip', '.png', '.jpg', '.jpeg', '.glb'}
+
+CHUNK_SIZE = 256 * 1024
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Content-Encoding -> sibling suffix, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+MEDIA_TYPES = {'.obj': 'model/obj', '.mtl': 'model/mtl', '.nii': 'application/octet-stream'}
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def precompress(path: Path, encodings: List[str] = APP_PRECOMPRESS) -> List[Path]:
+    """Write .br/.gz siblings of path next to it; brotli is skipped when not installed"""
+    if path.suffix.lower() in COMPRESSED_SUFFIXES or path.stat().st_size < PRECOMPRESS_MIN_BYTES:
+        return []
+    written = []
+    for suffix in encodings:
+        out = path.with_name(path.name + '.' + suffix)
+        tmp = out.with_name(out.name + '.tmp')
+        if suffix == 'gz':
+            with open(path, 'rb') as src, gzip.GzipFile(tmp, 'wb', compresslevel=9, mtime=0) as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        elif suffix == 'br':
+            brotli = _brotli()
+            if brotli is None:
+                continue
+            tmp.write_bytes(brotli.compress(path.read_bytes(), quality=11))
+        else:
+            continue
+        # Served only while at least as new as the original
+        stat = path.stat()
+        os.utime(tmp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        tmp.replace(out)
+        written.append(out)
+    return written
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def select_variant(path: Path, accept_encoding: str) -> Tuple[Path, Optional[str]]:
+    """The stored representation to send: a fresh precompressed sibling the client accepts, else path"""
+    accepted = accepted_encodings(accept_encoding)
+    mtime = path.stat().st_mtime_ns
+    for encoding, suffix in ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0.0)) <= 0:
+            continue
+        sibling = path.with_name(path.name + suffix)
+        try:
+            if sibling.stat().st_mtime_ns >= mtime:
+                return sibling, encoding
+        except FileNotFoundError:
+            continue
+    return path, None
+
+
+def has_variants(path: Path) -> bool:
+    return any(path.with_name(path.name + suffix).exists() for _, suffix in ENCODINGS)
+
+
+def etag_for(stat: os.stat_result) -> str:
+    """
+    Strong validator from inode, size and mtime; job files are written once
+    (atomically replaced when rewritten), so a change always moves one of them
+    """
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison"""
+    if header.strip() == '*':
+        return True
+    bare = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == bare for tag in header.split(','))
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) of a single 'bytes=' range, or None to send the
+    whole file (no range, other units, or several ranges). Raises RangeNotSatisfiable.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def _read(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(path: Path, headers, immutable: bool = False):
+    """Starlette response for path honouring the request headers above"""
+    from starlette.responses import Response, StreamingResponse
+
+    variant, encoding = select_variant(path, headers.get('accept-encoding', ''))
+    # Ranges address the identity bytes; a resumed download skips the compressed copy
+    if headers.get('range'):
+        variant, encoding = path, None
+    stat = variant.stat()
+    etag = etag_for(stat)
+    out = {
+        'ETag': etag,
+        'Cache-Control': IMMUTABLE if immutable else REVALIDATE,
+        'Accept-Ranges': 'bytes',
+    }
+    if encoding:
+        out['Content-Encoding'] = encoding
+    if encoding or has_variants(path):
+        out['Vary'] = 'Accept-Encoding'
+
+    if_none_match = headers.get('if-none-match')
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=out)
+
+    media_type = MEDIA_TYPES.get(path.suffix.lower()) or mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+    size = stat.st_size
+    status, start, length = 200, 0, size
+    range_header = headers.get('range')
+    if_range = headers.get('if-range')
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            out['Content-Range'] = f'bytes */{size}'
+            return Response(status_code=416, headers=out)
+        if byte_range:
+            start, end = byte_range
+            status, length = 206, end - start + 1
+            out['Content-Range'] = f'bytes {start}-{end}/{size}'
+    out['Content-Length'] = str(length)
+    return StreamingResponse(_read(variant, start, length), status_code=status, headers=out, media_type=media_type)
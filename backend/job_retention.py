@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Retention for the local server's job directories (app.py)
+A background sweep frees jobs/ by TTL and, above a disk-usage high-water
+mark, in least-recently-used order down to a low-water mark. Intermediate
+files (the upload, segmentations/) go first; final artifacts (OBJ, MTL, JSON,
+result.zip and their compressed copies) are kept longer and go with the
+whole job. Jobs the queue is still running are never touched, and only
+directories with a status.json written by the queue are managed, so uploads
+in flight and hand-placed job folders are left alone.
+"""
+
+import os
+import time
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from local_jobs import STATUS_FILE
+
+# Final artifacts are removed (with the whole job) after this many hours unused
+APP_JOB_TTL_HOURS = float(os.environ.get('APP_JOB_TTL_HOURS', '168'))
+# Uploads and segmentation masks of finished jobs go after this many hours unused
+APP_INTERMEDIATE_TTL_HOURS = float(os.environ.get('APP_INTERMEDIATE_TTL_HOURS', '24'))
+# High-water mark for jobs/ and the low-water ratio an eviction brings it down to
+APP_JOBS_MAX_GB = float(os.environ.get('APP_JOBS_MAX_GB', '20'))
+APP_JOBS_LOW_WATER = float(os.environ.get('APP_JOBS_LOW_WATER', '0.8'))
+# Free space to keep on the volume holding jobs/
+APP_MIN_FREE_GB = float(os.environ.get('APP_MIN_FREE_GB', '5'))
+APP_RETENTION_INTERVAL_SEC = int(os.environ.get('APP_RETENTION_INTERVAL_SEC', '600'))
+
+FINAL_FILES = {'Result.obj', 'materials.mtl', 'Result.json', 'result.zip', STATUS_FILE}
+FINAL_SUFFIXES = ('', '.gz', '.br')
+
+GB = 1024 ** 3
+
+
+def _size(path: Path) -> int:
+    if path.is_symlink() or not path.is_dir():
+        return path.lstat().st_size
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def is_final(name: str) -> bool:
+    return any(name.endswith(suffix) and name[:len(name) - len(suffix)] in FINAL_FILES for suffix in FINAL_SUFFIXES)
+
+
+class JobEntry:
+    """One job directory as seen by a sweep"""
+
+    def __init__(self, job_dir: Path, status: Optional[str], active: bool, last_used: float):
+        self.job_id = job_dir.name
+        self.dir = job_dir
+        self.status = status
+        self.active = active
+        self.last_used = last_used
+        self.final_bytes = 0
+        self.intermediate: List[Tuple[Path, int]] = []
+        for child in job_dir.iterdir():
+            size = _size(child)
+            if is_final(child.name):
+                self.final_bytes += size
+            else:
+                self.intermediate.append((child, size))
+
+    @property
+    def intermediate_bytes(self) -> int:
+        return sum(size for _, size in self.intermediate)
+
+    @property
+    def bytes(self) -> int:
+        return self.final_bytes + self.intermediate_bytes
+
+
+class JobRetention:
+    """Plans and runs evictions in jobs_dir; queue answers which jobs are active"""
+
+    def __init__(self, jobs_dir: Path, queue, max_bytes: float = APP_JOBS_MAX_GB * GB,
+                 low_water: float = APP_JOBS_LOW_WATER, min_free_bytes: float = APP_MIN_FREE_GB * GB,
+                 job_ttl_sec: float = APP_JOB_TTL_HOURS * 3600,
+                 intermediate_ttl_sec: float = APP_INTERMEDIATE_TTL_HOURS * 3600,
+                 interval_sec: int = APP_RETENTION_INTERVAL_SEC):
+        self.jobs_dir = jobs_dir
+        self.queue = queue
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.min_free_bytes = min_free_bytes
+        self.job_ttl_sec = job_ttl_sec
+        self.intermediate_ttl_sec = intermediate_ttl_sec
+        self.interval_sec = interval_sec
+        self._used: Dict[str, float] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {'sweeps': 0, 'evictedJobs': 0, 'evictedIntermediates': 0, 'freedMB': 0.0,
+                       'usedMB': 0.0, 'lastSweep': None}
+
+    def touch(self, job_id: str):
+        """Record a read of the job (status poll or file download) for LRU order"""
+        self._used[job_id] = time.time()
+
+    def scan(self) -> List[JobEntry]:
+        entries = []
+        for job_dir in self.jobs_dir.iterdir():
+            status_path = job_dir / STATUS_FILE
+            if not status_path.is_file():
+                continue
+            job = self.queue.get(job_dir.name) or {}
+            # A 'processing' status.json left by a previous server run is not active any more
+            active = self.queue.is_active(job_dir.name)
+            last_used = max(self._used.get(job_dir.name, 0.0), status_path.stat().st_mtime)
+            try:
+                entries.append(JobEntry(job_dir, job.get('status'), active, last_used))
+            except FileNotFoundError:
+                continue  # removed while scanning
+        return entries
+
+    def plan(self, entries: List[JobEntry], now: Optional[float] = None,
+             free_bytes: Optional[int] = None) -> List[Tuple[str, JobEntry, int, str]]:
+        """
+        (action, job, bytes, reason) in execution order; action is 'intermediate'
+        (drop the upload and masks) or 'job' (drop the whole directory)
+        """
+        now = time.time() if now is None else now
+        if free_bytes is None:
+            free_bytes = shutil.disk_usage(self.jobs_dir).free
+        candidates = sorted((e for e in entries if not e.active), key=lambda e: e.last_used)
+        used = sum(e.bytes for e in entries)
+        actions = []
+        dropped = set()
+        trimmed = set()
+
+        for e in candidates:
+            idle = now - e.last_used
+            if idle > self.job_ttl_sec:
+                actions.append(('job', e, e.bytes, 'ttl'))
+                dropped.add(e.job_id)
+            elif e.status != 'completed' and idle > self.intermediate_ttl_sec:
+                # Failed or interrupted: the artifacts will never be complete
+                actions.append(('job', e, e.bytes, 'failed' if e.status == 'failed' else 'interrupted'))
+                dropped.add(e.job_id)
+            elif idle > self.intermediate_ttl_sec and e.intermediate:
+                actions.append(('intermediate', e, e.intermediate_bytes, 'ttl'))
+                trimmed.add(e.job_id)
+        freed = sum(size for _, _, size, _ in actions)
+
+        # Over the high-water mark: intermediates first, then whole jobs, LRU first
+        if used - freed > self.max_bytes or free_bytes + freed < self.min_free_bytes:
+            need = max(used - freed - self.max_bytes * self.low_water,
+                       self.min_free_bytes - free_bytes - freed)
+            for e in candidates:
+                if need <= 0:
+                    break
+                if e.job_id in dropped or e.job_id in trimmed or not e.intermediate:
+                    continue
+                actions.append(('intermediate', e, e.intermediate_bytes, 'pressure'))
+                trimmed.add(e.job_id)
+                need -= e.intermediate_bytes
+            for e in candidates:
+                if need <= 0:
+                    break
+                if e.job_id in dropped:
+                    continue
+                size = e.bytes - (e.intermediate_bytes if e.job_id in trimmed else 0)
+                actions.append(('job', e, size, 'pressure'))
+                dropped.add(e.job_id)
+                need -= size
+        return actions
+
+    def sweep(self, dry_run: bool = False) -> List[Tuple[str, str, int, str]]:
+        with self._lock:
+            entries = self.scan()
+            actions = self.plan(entries)
+            done = []
+            for action, e, size, reason in actions:
+                # Re-checked here: the job may have been resubmitted since the scan
+                if self.queue.is_active(e.job_id):
+                    continue
+                if not dry_run:
+                    if action == 'job':
+                        shutil.rmtree(e.dir, ignore_errors=True)
+                        self.queue.forget(e.job_id)
+                        self._used.pop(e.job_id, None)
+                        self._stats['evictedJobs'] += 1
+                    else:
+                        for path, _ in e.intermediate:
+                            if path.is_dir() and not path.is_symlink():
+                                shutil.rmtree(path, ignore_errors=True)
+                            else:
+                                path.unlink(missing_ok=True)
+                        self._stats['evictedIntermediates'] += 1
+                    self._stats['freedMB'] = round(self._stats['freedMB'] + size / 1e6, 1)
+                print(f"[retention] {'would evict' if dry_run else 'evicted'} {action} {e.job_id} "
+                      f"({size / 1e6:.1f} MB, {reason})")
+                done.append((action, e.job_id, size, reason))
+            freed = sum(size for _, _, size, _ in done) if not dry_run else 0
+            self._stats['sweeps'] += 1
+            self._stats['usedMB'] = round((sum(e.bytes for e in entries) - freed) / 1e6, 1)
+            self._stats['lastSweep'] = int(time.time())
+            return done
+
+    def nudge(self):
+        """Sweep soon (after a large upload) instead of at the next interval"""
+        self._wake.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='job-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[retention] sweep failed: {e}")
+            self._wake.wait(self.interval_sec)
+            self._wake.clear()
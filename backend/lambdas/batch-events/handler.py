@@ -0,0 +1,132 @@
+import json
+import os
+import time
+from typing import Dict, Any, List
+
+import boto3
+
+dynamodb = boto3.resource('dynamodb')
+DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']
+table = dynamodb.Table(DYNAMODB_TABLE)
+
+# Batch job status -> job record status
+STATUS_MAP = {
+    'SUBMITTED': 'queued',
+    'PENDING': 'queued',
+    'RUNNABLE': 'queued',
+    'STARTING': 'processing',
+    'RUNNING': 'processing',
+    'SUCCEEDED': 'completed',
+    'FAILED': 'failed'
+}
+
+# Batch states only move forward, so their rank is the record version: an event
+# delivered late or twice carries a version that is not newer and is ignored
+STATUS_VERSION = {
+    'SUBMITTED': 1,
+    'PENDING': 2,
+    'RUNNABLE': 3,
+    'STARTING': 4,
+    'RUNNING': 5,
+    'SUCCEEDED': 6,
+    'FAILED': 6
+}
+
+# Record statuses each update may replace. The worker writes processing/completed/failed
+# itself (with artifacts and messages), so events never regress a record or touch a final one
+REPLACEABLE = {
+    'queued': ['pending', 'queued'],
+    'processing': ['pending', 'queued', 'processing'],
+    'completed': ['pending', 'queued', 'processing'],
+    'failed': ['pending', 'queued', 'processing']
+}
+
+
+def job_ids_for(detail: Dict[str, Any]) -> List[str]:
+    """Metadata job IDs a Batch job works on: one study, a pack of studies, or none for queue workers"""
+    env = {e['name']: e['value'] for e in (detail.get('container') or {}).get('environment', [])}
+    if env.get('WORKER_MODE') == 'queue':
+        return []
+    if env.get('JOBS_JSON'):
+        return [d['jobId'] for d in json.loads(env['JOBS_JSON'])]
+    if env.get('JOB_ID'):
+        return [env['JOB_ID']]
+    return []
+
+
+def plan_updates(event: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Turn one Batch Job State Change event into per-job record updates"""
+    detail = event.get('detail', {})
+    batch_status = detail.get('status')
+    if batch_status not in STATUS_MAP:
+        return []
+
+    fields = {
+        'status': STATUS_MAP[batch_status],
+        'batchStatus': batch_status,
+        'batchStatusVersion': STATUS_VERSION[batch_status],
+        'updatedAt': int(time.time())
+    }
+    if batch_status == 'FAILED':
+        container = detail.get('container') or {}
+        fields['errorMessage'] = container.get('reason') or detail.get('statusReason') or 'Batch job failed'
+
+    return [{'jobId': job_id, 'batchJobId': detail.get('jobId'), 'fields': dict(fields)}
+            for job_id in job_ids_for(detail)]
+
+
+def is_applicable(item: Dict[str, Any], update: Dict[str, Any]) -> bool:
+    """Python form of the ConditionExpression in apply_update (used by the replay harness)"""
+    fields = update['fields']
+    return (
+        item is not None
+        and item.get('batchJobId') == update['batchJobId']
+        and item.get('status') in REPLACEABLE[fields['status']]
+        and int(item.get('batchStatusVersion', 0)) < fields['batchStatusVersion']
+    )
+
+
+def apply_update(update: Dict[str, Any]) -> bool:
+    """Conditionally write one update; returns False when the record is newer, final or for another Batch job"""
+    fields = update['fields']
+    names = {'#status': 'status'}
+    values = {f':{k}': v for k, v in fields.items()}
+    values[':batchJobId'] = update['batchJobId']
+    allowed = REPLACEABLE[fields['status']]
+    for i, status in enumerate(allowed):
+        values[f':from{i}'] = status
+
+    set_expr = ', '.join(f"{'#status' if k == 'status' else k} = :{k}" for k in fields)
+    try:
+        table.update_item(
+            Key={'jobId': update['jobId']},
+            UpdateExpression=f'SET {set_expr}',
+            ConditionExpression=(
+                'batchJobId = :batchJobId '
+                f"AND #status IN ({', '.join(f':from{i}' for i in range(len(allowed)))}) "
+                'AND (attribute_not_exists(batchStatusVersion) OR batchStatusVersion < :batchStatusVersion)'
+            ),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+        return True
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def lambda_handler(event, context):
+    """
+    Sync job records from AWS Batch 'Batch Job State Change' events (EventBridge),
+    so status reads never need to call the Batch API
+    """
+    updates = plan_updates(event)
+    applied = 0
+    for update in updates:
+        if apply_update(update):
+            applied += 1
+            print(f"[batch-events] {update['jobId']} -> {update['fields']['status']} "
+                  f"(Batch {update['batchJobId']} {update['fields']['batchStatus']})")
+        else:
+            print(f"[batch-events] Skipped stale/final update for {update['jobId']} "
+                  f"(Batch {update['batchJobId']} {update['fields']['batchStatus']})")
+    return {'ok': True, 'applied': applied, 'skipped': len(updates) - applied}
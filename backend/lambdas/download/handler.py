@@ -1,7 +1,11 @@
 import json
 import os
+import re
+import time
 import boto3
-import base64
+from botocore.exceptions import ClientError
+
+from presign_cache import presigned_get_url, bucket_end, split_s3_uri
 
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
@@ -11,64 +15,148 @@ DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']
 
 table = dynamodb.Table(DYNAMODB_TABLE)
 
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'ETag,Content-Length,Content-Range,Accept-Ranges,Location'
+}
+
+
+def _response(status_code, headers=None, body=None):
+    response = {
+        'statusCode': status_code,
+        'headers': {**CORS_HEADERS, **(headers or {})},
+        'body': ''
+    }
+    if body is not None:
+        response['headers']['Content-Type'] = 'application/json'
+        response['body'] = json.dumps(body)
+    return response
+
+
+def _header(event, name):
+    """Case-insensitive request header lookup (API Gateway passes headers as sent)"""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def parse_range(value, size):
+    """
+    (start, end) inclusive for a single 'bytes=' range, None when the header should be
+    ignored (absent, malformed or multi-range, which S3 also answers with the full object),
+    or 'unsatisfiable'
+    """
+    if not value:
+        return None
+    match = RANGE_RE.match(value.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    first, last = match.group(1), match.group(2)
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or end < start:
+        return 'unsatisfiable'
+    return start, end
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Weak comparison: S3 ETags are strong, clients may send W/ forms
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any(tag.replace('W/', '', 1) == etag for tag in candidates)
+
+
+def results_prefix(item):
+    """
+    S3 prefix holding a job's files, from its artifact URIs: jobs linked to an
+    identical earlier study before linking copied the files point at that study's
+    """
+    for uri in (item.get('artifacts') or {}).values():
+        parsed = split_s3_uri(uri)
+        if parsed and parsed[1].startswith('results/'):
+            return '/'.join(parsed[1].split('/')[:2]) + '/'
+    return f"results/{item['jobId']}/"
+
+
 def lambda_handler(event, context):
     """
-    Download processed files from S3
+    Serve processed files from S3 without proxying the bytes: GET answers with a
+    redirect to a presigned URL (S3 honours the Range header the client resends),
+    HEAD answers with the object metadata, and If-None-Match is checked against
+    the S3 ETag
     """
     try:
         # Extract path parameters
-        path_params = event.get('pathParameters', {})
+        path_params = event.get('pathParameters') or {}
         job_id = path_params.get('jobId')
         filename = path_params.get('filename')
-        
+        method = event.get('httpMethod', 'GET')
+
         if not job_id or not filename:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'ok': False, 'error': 'jobId and filename are required'})
-            }
-        
+            return _response(400, body={'ok': False, 'error': 'jobId and filename are required'})
+
         # Verify job exists in DynamoDB
-        response = table.get_item(Key={'jobId': job_id})
+        response = table.get_item(Key={'jobId': job_id}, ProjectionExpression='jobId, artifacts')
         if 'Item' not in response:
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'ok': False, 'error': 'Job not found'})
-            }
-        
-        # Construct S3 key
-        s3_key = f'results/{job_id}/{filename}'
-        
+            return _response(404, body={'ok': False, 'error': 'Job not found'})
+
+        s3_key = f"{results_prefix(response['Item'])}{filename}"
+
         try:
-            # Get file from S3
-            s3_response = s3.get_object(Bucket=S3_BUCKET, Key=s3_key)
-            file_content = s3_response['Body'].read()
-            content_type = s3_response.get('ContentType', 'application/octet-stream')
-            
-            # Return file as base64 encoded (required for API Gateway)
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': content_type,
-                    'Content-Disposition': f'attachment; filename="{filename}"',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': True,
-                'body': base64.b64encode(file_content).decode('utf-8')
-            }
-            
-        except s3.exceptions.NoSuchKey:
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'ok': False, 'error': 'File not found'})
-            }
-        
+            head = s3.head_object(Bucket=S3_BUCKET, Key=s3_key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return _response(404, body={'ok': False, 'error': 'File not found'})
+            raise
+
+        etag = head.get('ETag')
+        size = head['ContentLength']
+        headers = {
+            'ETag': etag,
+            'Accept-Ranges': 'bytes',
+            'Last-Modified': head['LastModified'].strftime('%a, %d %b %Y %H:%M:%S GMT')
+        }
+
+        if etag_matches(_header(event, 'if-none-match'), etag):
+            return _response(304, headers)
+
+        byte_range = parse_range(_header(event, 'range'), size)
+        if byte_range == 'unsatisfiable':
+            return _response(416, {**headers, 'Content-Range': f'bytes */{size}'})
+
+        if method == 'HEAD':
+            headers['Content-Type'] = head.get('ContentType', 'application/octet-stream')
+            if byte_range:
+                start, end = byte_range
+                headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+                headers['Content-Length'] = str(end - start + 1)
+                return _response(206, headers)
+            headers['Content-Length'] = str(size)
+            return _response(200, headers)
+
+        url = presigned_get_url(s3, S3_BUCKET, s3_key, response_params={
+            'ResponseContentDisposition': f'attachment; filename="{filename}"'
+        })
+        # The URL is reused until the end of the presign time bucket, so the redirect
+        # itself may be cached until then
+        max_age = max(bucket_end() - int(time.time()), 0)
+        headers['Location'] = url
+        headers['Cache-Control'] = f'private, max-age={max_age}'
+        return _response(302, headers)
+
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'ok': False, 'error': str(e)})
-        }
+        return _response(500, body={'ok': False, 'error': str(e)})
@@ -5,16 +5,41 @@ import boto3
 from botocore.config import Config
 from decimal import Decimal
 
+from presign_cache import presigned_url_for_uri
+
 
 dynamodb = boto3.resource('dynamodb')
 s3 = boto3.client('s3', config=Config(s3={'use_accelerate_endpoint': True}))
-batch_client = boto3.client('batch')
 
 DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']
 S3_BUCKET = os.environ['S3_BUCKET']
 
 table = dynamodb.Table(DYNAMODB_TABLE)
 
+# Bulk endpoint limits (BatchGetItem and DescribeJobs both accept at most 100 keys)
+BULK_MAX_JOBS = 100
+BATCH_GET_RETRIES = 5
+
+# Fallback mapping for records whose Batch state-change event has not arrived yet
+BATCH_STATUS_MAP = {
+    'SUBMITTED': 'queued',
+    'PENDING': 'queued',
+    'RUNNABLE': 'queued',
+    'STARTING': 'processing',
+    'RUNNING': 'processing',
+    'SUCCEEDED': 'completed',
+    'FAILED': 'failed'
+}
+
+_batch_client = None
+
+
+def _batch():
+    global _batch_client
+    if _batch_client is None:
+        _batch_client = boto3.client('batch')
+    return _batch_client
+
 
 class DecimalEncoder(json.JSONEncoder):
     """Convert DynamoDB Decimal types to native Python numbers."""
@@ -28,7 +53,7 @@ class DecimalEncoder(json.JSONEncoder):
 def _with_cors(response):
     headers = response.setdefault('headers', {})
     headers['Access-Control-Allow-Origin'] = '*'
-    headers['Access-Control-Allow-Methods'] = 'GET,OPTIONS'
+    headers['Access-Control-Allow-Methods'] = 'GET,POST,OPTIONS'
     headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization'
     return response
 
@@ -46,23 +71,151 @@ def _build_artifact_urls(item):
 
     urls = {}
     for artifact_type, s3_path in artifacts_source.items():
-        if not isinstance(s3_path, str) or not s3_path.startswith('s3://'):
-            continue
-        parts = s3_path.replace('s3://', '').split('/', 1)
-        if len(parts) != 2:
-            continue
-        bucket, key = parts
         try:
-            urls[artifact_type] = s3.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': bucket, 'Key': key},
-                ExpiresIn=3600,
-            )
+            url = presigned_url_for_uri(s3, s3_path)
+            if url:
+                urls[artifact_type] = url
         except Exception as exc:  # pragma: no cover - log but continue
             print(f"[get-job-status] Failed to presign {artifact_type}: {exc}")
     return urls
 
 
+def _job_payload(item):
+    artifact_urls = _build_artifact_urls(item) if item.get('status') == 'completed' else {}
+    return {
+        'jobId': item.get('jobId'),
+        'status': item.get('status'),
+        'batchStatus': item.get('batchStatus'),
+        'stage': item.get('stage'),
+        'progress': item.get('progress'),
+        'message': item.get('message'),
+        'queuedAt': item.get('queuedAt'),
+        'startedAt': item.get('startedAt'),
+        'completedAt': item.get('completedAt'),
+        'updatedAt': item.get('updatedAt'),
+        'errorMessage': item.get('errorMessage'),
+        'expectedArtifacts': item.get('expectedArtifacts'),
+        'artifacts': item.get('artifacts'),
+        'artifactUrls': artifact_urls,
+    }
+
+
+def _batch_get_jobs(job_ids):
+    """
+    Fetch job records with one BatchGetItem, retrying unprocessed keys with backoff.
+    Returns the items and the IDs still unprocessed after the last retry.
+    """
+    request = {DYNAMODB_TABLE: {'Keys': [{'jobId': job_id} for job_id in job_ids]}}
+    items = []
+    for attempt in range(BATCH_GET_RETRIES):
+        resp = dynamodb.batch_get_item(RequestItems=request)
+        items.extend(resp.get('Responses', {}).get(DYNAMODB_TABLE, []))
+        request = resp.get('UnprocessedKeys') or {}
+        if not request:
+            break
+        if attempt < BATCH_GET_RETRIES - 1:
+            time.sleep(0.05 * (2 ** attempt))
+    unprocessed = [key['jobId'] for key in request.get(DYNAMODB_TABLE, {}).get('Keys', [])]
+    return items, unprocessed
+
+
+def _refresh_from_batch(items):
+    """
+    One DescribeJobs call for active jobs that have no Batch event recorded yet
+    (batch-events normally keeps them current). Read-only: the record is not written.
+    """
+    # A packed Batch job runs several studies, so one batchJobId can map to many records
+    pending = {}
+    for item in items:
+        if (item.get('status') in ('pending', 'queued', 'processing')
+                and item.get('batchJobId') and not item.get('batchStatus')):
+            pending.setdefault(item['batchJobId'], []).append(item)
+    if not pending:
+        return
+    try:
+        resp = _batch().describe_jobs(jobs=list(pending)[:BULK_MAX_JOBS])
+    except Exception as exc:
+        print(f"[get-job-status] Batch lookup failed: {exc}")
+        return
+    for batch_job in resp.get('jobs', []):
+        mapped = BATCH_STATUS_MAP.get(batch_job['status'])
+        for item in pending.get(batch_job['jobId'], []):
+            item['batchStatus'] = batch_job['status']
+            # Completion is reported by the worker together with its artifacts, so only
+            # forward progress and failures are taken from Batch here
+            if mapped == 'processing' or (mapped == 'queued' and item['status'] == 'pending'):
+                item['status'] = mapped
+            elif mapped == 'failed':
+                item['status'] = mapped
+                item['errorMessage'] = batch_job.get('statusReason', 'Batch job failed')
+
+
+def bulk_handler(event, _context):
+    """
+    POST /jobs/status {"jobIds": [...]}: status and artifact URLs for up to
+    BULK_MAX_JOBS jobs in one round trip
+    """
+    if event.get('httpMethod') == 'OPTIONS':
+        return _with_cors({
+            'statusCode': 200,
+            'body': ''
+        })
+
+    authorizer = event.get('requestContext', {}).get('authorizer', {})
+    claims = authorizer.get('claims', {})
+    user_id = claims.get('sub')
+    if not user_id:
+        return _with_cors({
+            'statusCode': 401,
+            'body': json.dumps({'ok': False, 'error': 'Unauthorized'})
+        })
+
+    try:
+        body = json.loads(event.get('body') or '{}') if isinstance(event.get('body'), str) else (event.get('body') or {})
+    except json.JSONDecodeError:
+        body = None
+    job_ids = body.get('jobIds') if isinstance(body, dict) else None
+    if not isinstance(job_ids, list) or not all(isinstance(j, str) and j for j in job_ids):
+        return _with_cors({
+            'statusCode': 400,
+            'body': json.dumps({'ok': False, 'error': 'jobIds must be a list of job IDs'})
+        })
+    job_ids = list(dict.fromkeys(job_ids))
+    if len(job_ids) > BULK_MAX_JOBS:
+        return _with_cors({
+            'statusCode': 400,
+            'body': json.dumps({'ok': False, 'error': f'At most {BULK_MAX_JOBS} jobIds per request'})
+        })
+    if not job_ids:
+        return _with_cors({
+            'statusCode': 200,
+            'body': json.dumps({'ok': True, 'jobs': {}, 'missing': [], 'unprocessed': []})
+        })
+
+    try:
+        # Other users' jobs are reported as missing, same as unknown IDs. Keys DynamoDB
+        # did not get to (throttling) are listed as unprocessed so the client keeps their state
+        items, unprocessed = _batch_get_jobs(job_ids)
+        items = [item for item in items if not item.get('userId') or item['userId'] == user_id]
+        _refresh_from_batch(items)
+
+        jobs = {item['jobId']: _job_payload(item) for item in items}
+        missing = [job_id for job_id in job_ids if job_id not in jobs and job_id not in unprocessed]
+
+        return _with_cors({
+            'statusCode': 200,
+            'body': json.dumps({'ok': True, 'jobs': jobs, 'missing': missing, 'unprocessed': unprocessed},
+                               cls=DecimalEncoder)
+        })
+
+    except Exception as exc:  # pragma: no cover
+        print(f"[get-job-status] Error fetching {len(job_ids)} jobs: {exc}")
+        return _with_cors({
+            'statusCode': 500,
+            'body': json.dumps({'ok': False, 'error': str(exc)})
+        })
+
+
 def lambda_handler(event, _context):
     print(f"[get-job-status] event: {json.dumps(event)}")
 
@@ -104,63 +257,9 @@ def lambda_handler(event, _context):
                 'body': json.dumps({'ok': False, 'error': 'Not authorized to access this job'})
             })
 
-        # If job has a Batch job ID, check Batch status and sync
-        batch_job_id = item.get('batchJobId')
-        if batch_job_id and item.get('status') not in ['completed', 'failed']:
-            try:
-                batch_resp = batch_client.describe_jobs(jobs=[batch_job_id])
-                if batch_resp['jobs']:
-                    batch_job = batch_resp['jobs'][0]
-                    batch_status = batch_job['status']
-                    
-                    # Map Batch status to our status
-                    status_map = {
-                        'SUBMITTED': 'queued',
-                        'PENDING': 'queued',
-                        'RUNNABLE': 'queued',
-                        'STARTING': 'processing',
-                        'RUNNING': 'processing',
-                        'SUCCEEDED': 'completed',
-                        'FAILED': 'failed'
-                    }
-                    
-                    new_status = status_map.get(batch_status, item.get('status'))
-                    
-                    # Update DynamoDB if status changed
-                    if new_status != item.get('status'):
-                        update_expr = 'SET #status = :status, updatedAt = :now'
-                        expr_values = {':status': new_status, ':now': int(time.time())}
-                        expr_names = {'#status': 'status'}
-                        
-                        if new_status == 'failed':
-                            reason = batch_job.get('statusReason', 'Batch job failed')
-                            update_expr += ', errorMessage = :error'
-                            expr_values[':error'] = reason
-                        
-                        table.update_item(
-                            Key={'jobId': job_id},
-                            UpdateExpression=update_expr,
-                            ExpressionAttributeNames=expr_names,
-                            ExpressionAttributeValues=expr_values
-                        )
-                        item['status'] = new_status
-            except Exception as e:
-                print(f'[get-job-status] Error checking Batch status: {e}')
-
-        artifact_urls = _build_artifact_urls(item) if item.get('status') == 'completed' else {}
-
-        job_payload = {
-            'jobId': item.get('jobId'),
-            'status': item.get('status'),
-            'queuedAt': item.get('queuedAt'),
-            'startedAt': item.get('startedAt'),
-            'completedAt': item.get('completedAt'),
-            'updatedAt': item.get('updatedAt'),
-            'errorMessage': item.get('errorMessage'),
-            'expectedArtifacts': item.get('expectedArtifacts'),
-            'artifacts': item.get('artifacts'),
-            'artifactUrls': artifact_urls,
-        }
+        # Status is kept current by the batch-events Lambda (Batch state-change events)
+        # and by the worker itself, so a poll is a single read
+        job_payload = _job_payload(item)
 
         return _with_cors({
             'statusCode': 200,
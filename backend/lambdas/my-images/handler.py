@@ -1,9 +1,13 @@
 import json
 import os
+import base64
+import binascii
 import boto3
 from botocore.config import Config
 from decimal import Decimal
 
+from presign_cache import presigned_get_url, MIN_REMAINING_SEC
+
 dynamodb = boto3.resource('dynamodb')
 s3 = boto3.client('s3', config=Config(s3={'use_accelerate_endpoint': True}))
 
@@ -12,6 +16,14 @@ S3_BUCKET = os.environ['S3_BUCKET']
 
 table = dynamodb.Table(DYNAMODB_TABLE)
 
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+# Upper bound on index reads per request when many items are filtered out as deleted
+MAX_QUERY_CALLS = 10
+
+# Fields the list view needs; artifacts and presigned URLs come from the per-study call
+LIST_PROJECTION = 'jobId, filename, #status, createdAt, updatedAt, completedAt, errorMessage, inputFile, progress, #message'
+
 
 class DecimalEncoder(json.JSONEncoder):
     """Helper class to convert DynamoDB Decimal to JSON"""
@@ -21,117 +33,160 @@ class DecimalEncoder(json.JSONEncoder):
         return super(DecimalEncoder, self).default(obj)
 
 
+def _response(status_code, payload):
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(payload, cls=DecimalEncoder)
+    }
+
+
+def _user_id(event):
+    # When using Cognito authorizer, the claims are in requestContext
+    authorizer = event.get('requestContext', {}).get('authorizer', {})
+    return authorizer.get('claims', {}).get('sub')
+
+
+def encode_cursor(last_evaluated_key):
+    """Opaque pagination cursor from a DynamoDB LastEvaluatedKey"""
+    raw = json.dumps(last_evaluated_key, cls=DecimalEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, user_id):
+    """ExclusiveStartKey from a cursor; raises ValueError if it is malformed or not the caller's"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(key, dict) or set(key) != {'jobId', 'userId', 'createdAt'} or key['userId'] != user_id:
+        raise ValueError("Invalid cursor")
+    key['createdAt'] = Decimal(str(key['createdAt']))
+    return key
+
+
+def _presign(key):
+    try:
+        return presigned_get_url(s3, S3_BUCKET, key)
+    except Exception as e:
+        print(f"Error generating presigned URL for {key}: {e}")
+        return None
+
+
+def list_page(user_id, limit, start_key=None):
+    """
+    One page of the user's non-deleted studies, newest first.
+    Deleted items are dropped by the filter expression after they are read, so
+    the query is repeated from LastEvaluatedKey until the page is full; each call
+    asks only for the remaining count, so the returned key is an exact cursor.
+    """
+    images = []
+    last_key = start_key
+    for _ in range(MAX_QUERY_CALLS):
+        params = {
+            'IndexName': 'userId-createdAt-index',
+            'KeyConditionExpression': 'userId = :uid',
+            'FilterExpression': 'attribute_not_exists(deleted) OR deleted = :false',
+            'ProjectionExpression': LIST_PROJECTION,
+            'ExpressionAttributeNames': {'#status': 'status', '#message': 'message'},
+            'ExpressionAttributeValues': {':uid': user_id, ':false': False},
+            'ScanIndexForward': False,  # Sort by createdAt descending (newest first)
+            'Limit': limit - len(images)
+        }
+        if last_key:
+            params['ExclusiveStartKey'] = last_key
+        response = table.query(**params)
+        images.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key or len(images) >= limit:
+            break
+    return images, last_key
+
+
 def lambda_handler(event, context):
     """
-    Get list of images uploaded by the authenticated user
+    Get one page of images uploaded by the authenticated user
+    Query string: limit (default 25, max 100), cursor (nextCursor of the previous page)
     """
     try:
-        # Extract userId from Cognito authorizer
-        # When using Cognito authorizer, the claims are in requestContext
-        authorizer = event.get('requestContext', {}).get('authorizer', {})
-        claims = authorizer.get('claims', {})
-        user_id = claims.get('sub')
-        
+        user_id = _user_id(event)
         if not user_id:
-            return {
-                'statusCode': 401,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'ok': False,
-                    'error': 'Unauthorized - No user ID in token'
-                })
-            }
+            return _response(401, {'ok': False, 'error': 'Unauthorized - No user ID in token'})
         
-        print(f"Getting images for user: {user_id}")
+        params = event.get('queryStringParameters') or {}
+        try:
+            limit = max(1, min(MAX_PAGE_SIZE, int(params.get('limit', DEFAULT_PAGE_SIZE))))
+            start_key = decode_cursor(params['cursor'], user_id) if params.get('cursor') else None
+        except ValueError as e:
+            return _response(400, {'ok': False, 'error': str(e)})
         
-        # Query DynamoDB by userId using GSI
-        response = table.query(
-            IndexName='userId-createdAt-index',
-            KeyConditionExpression='userId = :uid',
-            ExpressionAttributeValues={':uid': user_id},
-            ScanIndexForward=False  # Sort by createdAt descending (newest first)
-        )
+        print(f"Getting images for user: {user_id} (limit {limit}, cursor {'yes' if start_key else 'no'})")
+        images, last_key = list_page(user_id, limit, start_key)
+        print(f"Found {len(images)} images for user {user_id}")
         
-        # Filter out deleted studies
-        all_images = response.get('Items', [])
-        images = [img for img in all_images if not img.get('deleted', False)]
+        return _response(200, {
+            'ok': True,
+            'count': len(images),
+            'images': images,
+            'nextCursor': encode_cursor(last_key) if last_key else None
+        })
         
-        print(f"Found {len(images)} images for user {user_id}")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return _response(500, {'ok': False, 'error': str(e)})
+
+
+def artifacts_handler(event, context):
+    """
+    GET /my-images/{jobId}/artifacts: presigned URLs for one study's input file
+    and, once completed, its 3D artifacts
+    """
+    try:
+        user_id = _user_id(event)
+        if not user_id:
+            return _response(401, {'ok': False, 'error': 'Unauthorized - No user ID in token'})
         
-        # Enrich images with presigned URLs for thumbnails and artifacts
-        for img in images:
-            # Generate presigned URL for the original file
-            if 'inputFile' in img:
-                try:
-                    img['downloadUrl'] = s3.generate_presigned_url(
-                        'get_object',
-                        Params={
-                            'Bucket': S3_BUCKET,
-                            'Key': img['inputFile']
-                        },
-                        ExpiresIn=3600  # 1 hour
-                    )
-                except Exception as e:
-                    print(f"Error generating presigned URL: {e}")
-                    img['downloadUrl'] = None
-            
-            # If job is completed, generate presigned URLs for 3D artifacts
-            if img.get('status') == 'completed':
-                artifacts_source = {}
-                # Merge expectedArtifacts and actual artifacts, preferring actual
-                if 'expectedArtifacts' in img:
-                    artifacts_source.update(img['expectedArtifacts'])
-                if 'artifacts' in img:
-                    artifacts_source.update(img['artifacts'])
-                
-                artifacts_urls = {}
-                for artifact_type, s3_path in artifacts_source.items():
-                    # Extract S3 key from s3://bucket/key format
-                    if isinstance(s3_path, str) and s3_path.startswith('s3://'):
-                        # Remove s3://bucket/ prefix
-                        s3_key = '/'.join(s3_path.split('/')[3:])
-                        try:
-                            artifacts_urls[artifact_type] = s3.generate_presigned_url(
-                                'get_object',
-                                Params={
-                                    'Bucket': S3_BUCKET,
-                                    'Key': s3_key
-                                },
-                                ExpiresIn=3600
-                            )
-                        except Exception as e:
-                            print(f"Error generating presigned URL for {artifact_type}: {e}")
-                
-                if artifacts_urls:
-                    img['artifactUrls'] = artifacts_urls
-                    print(f"Generated {len(artifacts_urls)} artifact URLs for job {img['jobId']}")
+        job_id = (event.get('pathParameters') or {}).get('jobId')
+        if not job_id:
+            return _response(400, {'ok': False, 'error': 'jobId is required'})
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'ok': True,
-                'count': len(images),
-                'images': images
-            }, cls=DecimalEncoder)
-        }
+        img = table.get_item(
+            Key={'jobId': job_id},
+            ProjectionExpression='jobId, userId, #status, inputFile, expectedArtifacts, artifacts, deleted',
+            ExpressionAttributeNames={'#status': 'status'}
+        ).get('Item')
+        if not img or img.get('userId') != user_id or img.get('deleted'):
+            return _response(404, {'ok': False, 'error': 'Study not found'})
+        
+        download_url = _presign(img['inputFile']) if 'inputFile' in img else None
+        
+        # If job is completed, generate presigned URLs for 3D artifacts
+        artifact_urls = {}
+        if img.get('status') == 'completed':
+            # Merge expectedArtifacts and actual artifacts, preferring actual
+            artifacts_source = dict(img.get('expectedArtifacts', {}))
+            artifacts_source.update(img.get('artifacts', {}))
+            for artifact_type, s3_path in artifacts_source.items():
+                # Extract S3 key from s3://bucket/key format
+                if isinstance(s3_path, str) and s3_path.startswith('s3://'):
+                    url = _presign('/'.join(s3_path.split('/')[3:]))
+                    if url:
+                        artifact_urls[artifact_type] = url
+        
+        return _response(200, {
+            'ok': True,
+            'jobId': job_id,
+            'status': img.get('status'),
+            'downloadUrl': download_url,
+            'artifacts': img.get('artifacts'),
+            'artifactUrls': artifact_urls,
+            'expiresIn': MIN_REMAINING_SEC  # URLs stay valid at least this long
+        })
         
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'ok': False,
-                'error': str(e)
-            })
-        }
+        return _response(500, {'ok': False, 'error': str(e)})
@@ -1,7 +1,8 @@
 import json
 import os
+import re
 import time
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 
 import boto3
 
@@ -13,29 +14,144 @@ S3_BUCKET = os.environ['S3_BUCKET']
 DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']
 BATCH_JOB_QUEUE = os.environ['BATCH_JOB_QUEUE']
 BATCH_JOB_DEFINITION = os.environ['BATCH_JOB_DEFINITION']
+RESULTS_INDEX_TABLE = os.environ.get('RESULTS_INDEX_TABLE', '')
+# When set, jobs go to this SQS queue and are consumed by long-running workers
+JOB_QUEUE_URL = os.environ.get('JOB_QUEUE_URL', '')
+WORKER_IDLE_TIMEOUT_SEC = os.environ.get('WORKER_IDLE_TIMEOUT_SEC', '300')
+# Attempt timeout of a queue worker; the job definition's 2 h ceiling is sized for one study
+WORKER_MAX_LIFETIME_SEC = os.environ.get('WORKER_MAX_LIFETIME_SEC', '43200')
+# Packing: inputs up to PACK_MAX_INPUT_MB wait briefly and are submitted together as one
+# Batch job of up to PACK_MAX_JOBS studies (0 disables packing)
+PACK_MAX_INPUT_MB = float(os.environ.get('PACK_MAX_INPUT_MB', '0'))
+PACK_MAX_JOBS = int(os.environ.get('PACK_MAX_JOBS', '8'))
+PACK_MAX_WAIT_SEC = int(os.environ.get('PACK_MAX_WAIT_SEC', '60'))
+PACK_INDEX = 'packState-queuedAt-index'
+# PROFILE job parameter: comma-separated stage names and modifiers ('' = off)
+PROFILE_RE = re.compile(r'^([a-z_]+(,[a-z_]+)*)?$')
 
 table = dynamodb.Table(DYNAMODB_TABLE)
+sqs = boto3.client('sqs') if JOB_QUEUE_URL else None
+index_table = dynamodb.Table(RESULTS_INDEX_TABLE) if RESULTS_INDEX_TABLE else None
 
 
-def submit_batch_job(job_id: str, s3_input_key: str, device: str, fast: bool, reduction_percent: int) -> str:
+def compute_content_hash(s3_key: str) -> Tuple[str, int]:
+    """
+    Content hash of the uploaded volume taken from S3 itself (no download),
+    returned with the object size in bytes.
+    Browser uploads are single-part presigned PUTs, so the ETag is the MD5 of
+    the object; multipart ETags are still deterministic for the same content
+    and part size, so they only ever cause a missed match, never a false one.
+    """
+    head = s3.head_object(Bucket=S3_BUCKET, Key=s3_key)
+    etag = head['ETag'].strip('"')
+    return f"etag:{etag}:{head['ContentLength']}", int(head['ContentLength'])
+
+
+def build_dedup_key(content_hash: str, task: str, fast: bool, reduction_percent: int) -> str:
+    """Index key: same content processed with the same parameters gives the same results"""
+    return f"{content_hash}#task={task}#fast={str(fast).lower()}#reduction={reduction_percent}"
+
+
+def find_existing_results(dedup_key: str):
+    """Return a usable results index entry for dedup_key, or None"""
+    if index_table is None:
+        return None
+    entry = index_table.get_item(Key={'dedupKey': dedup_key}).get('Item')
+    if not entry or int(entry.get('expiresAt', 0)) <= int(time.time()):
+        return None
+    
+    # Artifacts may have been removed by the bucket lifecycle before the index TTL fired
+    any_path = next(iter(entry.get('artifacts', {}).values()), '')
+    obj_key = any_path.split('/', 3)[-1].rsplit('/', 1)[0] + '/Result.obj'
+    try:
+        s3.head_object(Bucket=S3_BUCKET, Key=obj_key)
+    except Exception as e:
+        print(f"[process] Indexed results for {dedup_key} unavailable: {e}")
+        return None
+    return entry
+
+
+def copy_results(source_job_id: str, job_id: str) -> Dict[str, str]:
+    """
+    Server-side copy of an earlier job's result files (top level of its prefix) to
+    job_id's own prefix; returns {source key: new key}
+    """
+    source_prefix = f'results/{source_job_id}/'
+    copied = {}
+    params = {'Bucket': S3_BUCKET, 'Prefix': source_prefix, 'Delimiter': '/'}
+    while True:
+        response = s3.list_objects_v2(**params)
+        for obj in response.get('Contents', []):
+            key = obj['Key']
+            new_key = f"results/{job_id}/{key[len(source_prefix):]}"
+            s3.copy_object(Bucket=S3_BUCKET, Key=new_key, CopySource={'Bucket': S3_BUCKET, 'Key': key})
+            copied[key] = new_key
+        if not response.get('IsTruncated'):
+            return copied
+        params['ContinuationToken'] = response['NextContinuationToken']
+
+
+def link_existing_results(job_id: str, content_hash: str, dedup_key: str, entry: Dict[str, Any]):
+    """
+    Complete job_id with the artifacts of an earlier identical job. The files are
+    copied rather than referenced so they get their own bucket lifecycle: the source's
+    expire 90 days after it ran, possibly days after this job was linked.
+    """
+    copied = copy_results(entry['sourceJobId'], job_id)
+    artifacts = {}
+    for name, uri in entry['artifacts'].items():
+        key = uri.split('/', 3)[-1]
+        if key not in copied:
+            raise RuntimeError(f"Indexed artifact {uri} was not copied")
+        artifacts[name] = f"s3://{S3_BUCKET}/{copied[key]}"
+    table.update_item(
+        Key={'jobId': job_id},
+        UpdateExpression='SET #status = :status, updatedAt = :now, completedAt = :now, artifacts = :artifacts, '
+                         'expectedArtifacts = :expected, inputHash = :hash, dedupKey = :key, dedupOf = :source, '
+                         'message = :message',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={
+            ':status': 'completed',
+            ':now': int(time.time()),
+            ':artifacts': artifacts,
+            ':expected': expected_artifacts_for(job_id),
+            ':hash': content_hash,
+            ':key': dedup_key,
+            ':source': entry['sourceJobId'],
+            ':message': '3D models ready to view'
+        }
+    )
+
+
+def submit_batch_job(job_id: str, s3_input_key: str, device: str, fast: bool, reduction_percent: int,
+                     task: str = 'auto', dedup_key: str = '', profile: str = '') -> str:
     """Submit job to AWS Batch and return Batch job ID"""
     print(f"[process] Submitting Batch job for {job_id}...")
     
+    environment = [
+        {'name': 'JOB_ID', 'value': job_id},
+        {'name': 'S3_BUCKET', 'value': S3_BUCKET},
+        {'name': 'S3_INPUT_KEY', 'value': s3_input_key},
+        {'name': 'S3_OUTPUT_PREFIX', 'value': f'results/{job_id}/'},
+        {'name': 'DEVICE', 'value': device},
+        {'name': 'FAST', 'value': str(fast).lower()},
+        {'name': 'REDUCTION_PERCENT', 'value': str(reduction_percent)},
+        {'name': 'DYNAMODB_TABLE', 'value': DYNAMODB_TABLE}
+    ]
+    if task != 'auto':
+        environment.append({'name': 'TASK_OVERRIDE', 'value': task})
+    if dedup_key and RESULTS_INDEX_TABLE:
+        environment.append({'name': 'DEDUP_KEY', 'value': dedup_key})
+        environment.append({'name': 'RESULTS_INDEX_TABLE', 'value': RESULTS_INDEX_TABLE})
+    if profile:
+        environment.append({'name': 'PROFILE', 'value': profile})
+    
     response = batch_client.submit_job(
         jobName=f"totalseg-{job_id}",
         jobQueue=BATCH_JOB_QUEUE,
         jobDefinition=BATCH_JOB_DEFINITION,
         containerOverrides={
-            'environment': [
-                {'name': 'JOB_ID', 'value': job_id},
-                {'name': 'S3_BUCKET', 'value': S3_BUCKET},
-                {'name': 'S3_INPUT_KEY', 'value': s3_input_key},
-                {'name': 'S3_OUTPUT_PREFIX', 'value': f'results/{job_id}/'},
-                {'name': 'DEVICE', 'value': device},
-                {'name': 'FAST', 'value': str(fast).lower()},
-                {'name': 'REDUCTION_PERCENT', 'value': str(reduction_percent)},
-                {'name': 'DYNAMODB_TABLE', 'value': DYNAMODB_TABLE}
-            ]
+            'environment': environment
         },
         tags={
             'JobId': job_id,
@@ -47,10 +163,217 @@ def submit_batch_job(job_id: str, s3_input_key: str, device: str, fast: bool, re
     print(f"[process] Batch job submitted: {batch_job_id}")
     return batch_job_id
 
+def expected_artifacts_for(job_id: str) -> Dict[str, str]:
+    return {
+        'obj': f's3://{S3_BUCKET}/results/{job_id}/Result.obj',
+        'mtl': f's3://{S3_BUCKET}/results/{job_id}/materials.mtl',
+        'json': f's3://{S3_BUCKET}/results/{job_id}/Result.json',
+        'zip': f's3://{S3_BUCKET}/results/{job_id}/result.zip'
+    }
+
+
+def build_job_descriptor(job_id: str, s3_input_key: str, device: str, fast: bool, reduction_percent: int,
+                         task: str = 'auto', dedup_key: str = '', profile: str = '') -> Dict[str, Any]:
+    """Job descriptor understood by the Batch worker's job_from_message"""
+    return {
+        'jobId': job_id,
+        's3Bucket': S3_BUCKET,
+        's3InputKey': s3_input_key,
+        's3OutputPrefix': f'results/{job_id}/',
+        'device': device,
+        'fast': fast,
+        'reductionPercent': int(reduction_percent),
+        'taskOverride': '' if task == 'auto' else task,
+        'dedupKey': dedup_key,
+        'profile': profile,
+    }
+
+
+def enqueue_job(job_id: str, s3_input_key: str, device: str, fast: bool, reduction_percent: int,
+                task: str = 'auto', dedup_key: str = '', profile: str = '') -> str:
+    """Send the job descriptor to the worker queue and make sure a worker is running; returns the worker's Batch job ID"""
+    message = build_job_descriptor(job_id, s3_input_key, device, fast, reduction_percent, task, dedup_key, profile)
+    sqs.send_message(QueueUrl=JOB_QUEUE_URL, MessageBody=json.dumps(message))
+    print(f"[process] Enqueued {job_id} on worker queue")
+    return ensure_worker()
+
+
+def ensure_worker() -> str:
+    """Submit a queue-consumer Batch job unless one is already pending or running"""
+    # With a filter, ListJobs returns every status including finished workers' history,
+    # so an active worker may be on any page
+    params = {
+        'jobQueue': BATCH_JOB_QUEUE,
+        'filters': [{'name': 'JOB_NAME', 'values': ['totalseg-worker*']}],
+        'maxResults': 100
+    }
+    while True:
+        response = batch_client.list_jobs(**params)
+        for summary in response.get('jobSummaryList', []):
+            if summary.get('status') in ('SUBMITTED', 'PENDING', 'RUNNABLE', 'STARTING', 'RUNNING'):
+                return summary['jobId']
+        if not response.get('nextToken'):
+            break
+        params['nextToken'] = response['nextToken']
+    
+    response = batch_client.submit_job(
+        jobName=f"totalseg-worker-{int(time.time())}",
+        jobQueue=BATCH_JOB_QUEUE,
+        jobDefinition=BATCH_JOB_DEFINITION,
+        containerOverrides={
+            'environment': [
+                {'name': 'WORKER_MODE', 'value': 'queue'},
+                {'name': 'JOB_QUEUE_URL', 'value': JOB_QUEUE_URL},
+                {'name': 'WORKER_IDLE_TIMEOUT_SEC', 'value': WORKER_IDLE_TIMEOUT_SEC},
+                {'name': 'WORKER_MAX_LIFETIME_SEC', 'value': WORKER_MAX_LIFETIME_SEC},
+                {'name': 'S3_BUCKET', 'value': S3_BUCKET},
+                {'name': 'DYNAMODB_TABLE', 'value': DYNAMODB_TABLE},
+                {'name': 'RESULTS_INDEX_TABLE', 'value': RESULTS_INDEX_TABLE}
+            ]
+        },
+        # The worker stops taking jobs early enough to finish the last one within this
+        timeout={'attemptDurationSeconds': int(WORKER_MAX_LIFETIME_SEC)},
+        tags={
+            'Application': 'iris-oculus',
+            'Role': 'queue-worker'
+        }
+    )
+    print(f"[process] Started queue worker {response['jobId']}")
+    return response['jobId']
+
+
+def ensure_worker_for_backlog() -> Dict[str, Any]:
+    """
+    Scheduled check: start a worker when messages are waiting and none is running,
+    e.g. one was sent while the last worker was exiting on idle, or that worker
+    crashed or reached its lifetime with jobs left
+    """
+    resp = sqs.get_queue_attributes(QueueUrl=JOB_QUEUE_URL, AttributeNames=['ApproximateNumberOfMessages'])
+    waiting = int(resp.get('Attributes', {}).get('ApproximateNumberOfMessages', 0))
+    if not waiting:
+        return {'waiting': 0}
+    return {'waiting': waiting, 'workerBatchJobId': ensure_worker()}
+
+
+def hold_for_pack(job_id: str, descriptor: Dict[str, Any], content_hash: str, dedup_key: str, input_bytes: int):
+    """Mark a small job as waiting to be packed; it shows as queued to the user"""
+    table.update_item(
+        Key={'jobId': job_id},
+        UpdateExpression='SET #status = :status, queuedAt = :now, updatedAt = :now, packState = :waiting, '
+                         'packDescriptor = :descriptor, expectedArtifacts = :artifacts, inputHash = :hash, '
+                         'dedupKey = :key, inputBytes = :bytes',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={
+            ':status': 'queued',
+            ':now': int(time.time()),
+            ':waiting': 'waiting',
+            ':descriptor': json.dumps(descriptor),
+            ':artifacts': expected_artifacts_for(job_id),
+            ':hash': content_hash,
+            ':key': dedup_key,
+            ':bytes': input_bytes
+        }
+    )
+
+
+def claim_waiting_jobs(items: List[Dict[str, Any]], pack_id: str) -> List[Dict[str, Any]]:
+    """
+    Atomically take waiting jobs for this pack. The conditional update means
+    concurrent flushes never put the same job in two packs.
+    """
+    claimed = []
+    for item in items:
+        try:
+            table.update_item(
+                Key={'jobId': item['jobId']},
+                UpdateExpression='SET packId = :pack, updatedAt = :now REMOVE packState',
+                ConditionExpression='packState = :waiting',
+                ExpressionAttributeValues={':pack': pack_id, ':waiting': 'waiting', ':now': int(time.time())}
+            )
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            continue
+        claimed.append(json.loads(item['packDescriptor']))
+    return claimed
+
+
+def flush_pack(force: bool = False) -> Dict[str, Any]:
+    """
+    Submit waiting small jobs as one Batch job once PACK_MAX_JOBS are waiting,
+    the oldest has waited PACK_MAX_WAIT_SEC, or force is set.
+    """
+    response = table.query(
+        IndexName=PACK_INDEX,
+        KeyConditionExpression='packState = :waiting',
+        ExpressionAttributeValues={':waiting': 'waiting'},
+        Limit=PACK_MAX_JOBS
+    )
+    waiting = response.get('Items', [])
+    if not waiting:
+        return {'submitted': False, 'waiting': 0}
+    oldest_age = int(time.time()) - int(waiting[0]['queuedAt'])
+    if not force and len(waiting) < PACK_MAX_JOBS and oldest_age < PACK_MAX_WAIT_SEC:
+        return {'submitted': False, 'waiting': len(waiting), 'oldestAgeSec': oldest_age}
+    
+    pack_id = f"pack-{int(time.time() * 1000)}"
+    descriptors = claim_waiting_jobs(waiting, pack_id)
+    if not descriptors:
+        return {'submitted': False, 'waiting': 0}
+    
+    print(f"[process] Submitting {pack_id} with {len(descriptors)} job(s)")
+    try:
+        response = batch_client.submit_job(
+            jobName=f"totalseg-{pack_id}",
+            jobQueue=BATCH_JOB_QUEUE,
+            jobDefinition=BATCH_JOB_DEFINITION,
+            containerOverrides={
+                'environment': [
+                    {'name': 'JOBS_JSON', 'value': json.dumps(descriptors)},
+                    {'name': 'S3_BUCKET', 'value': S3_BUCKET},
+                    {'name': 'DYNAMODB_TABLE', 'value': DYNAMODB_TABLE},
+                    {'name': 'RESULTS_INDEX_TABLE', 'value': RESULTS_INDEX_TABLE}
+                ]
+            },
+            tags={
+                'Application': 'iris-oculus',
+                'PackId': pack_id
+            }
+        )
+    except Exception:
+        # Put the jobs back so the next flush retries them
+        for descriptor in descriptors:
+            table.update_item(
+                Key={'jobId': descriptor['jobId']},
+                UpdateExpression='SET packState = :waiting REMOVE packId',
+                ExpressionAttributeValues={':waiting': 'waiting'}
+            )
+        raise
+    batch_job_id = response['jobId']
+    
+    # Every packed job follows the pack's Batch job, so a crashed container still fails them
+    for descriptor in descriptors:
+        table.update_item(
+            Key={'jobId': descriptor['jobId']},
+            UpdateExpression='SET batchJobId = :batchId, updatedAt = :now REMOVE batchStatus, batchStatusVersion',
+            ExpressionAttributeValues={':batchId': batch_job_id, ':now': int(time.time())}
+        )
+    print(f"[process] {pack_id} submitted as Batch job {batch_job_id}")
+    return {'submitted': True, 'packId': pack_id, 'batchJobId': batch_job_id, 'jobs': len(descriptors)}
+
+
 def lambda_handler(event, context):
     """
     Process uploaded file using AWS Batch (TotalSegmentator on GPU Spot instances)
     """
+    # Scheduled invocation: submit packs whose wait window has passed, and make sure
+    # queued messages have a worker
+    if event.get('source') == 'aws.events':
+        result = flush_pack() if PACK_MAX_INPUT_MB > 0 else {'submitted': False}
+        print(f"[process] Pack flush: {result}")
+        if JOB_QUEUE_URL:
+            result['workerCheck'] = ensure_worker_for_backlog()
+            print(f"[process] Worker check: {result['workerCheck']}")
+        return result
+    
     try:
         # Parse request
         if isinstance(event.get('body'), str):
@@ -62,6 +385,19 @@ def lambda_handler(event, context):
         device = body.get('device', 'gpu')  # Default to GPU now that quota is approved
         fast = body.get('fast', True)
         reduction_percent = body.get('reduction_percent', 90)
+        task = body.get('task', 'auto')  # 'auto' lets the worker detect it from DICOM metadata
+        reprocess = body.get('reprocess', False)  # Skip result deduplication
+        # Opt-in stage profiling, e.g. 'mesh,export' or 'all,memory' (see batch/profiling.py)
+        profile = body.get('profile', '') or ''
+        
+        if not isinstance(profile, str) or not PROFILE_RE.match(profile):
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'ok': False, 'error': 'profile must be a comma-separated list of stage names'})
+            }
+        # A profiled run has to actually run, so it never reuses earlier results
+        reprocess = reprocess or bool(profile)
         
         if not job_id:
             return {
@@ -89,27 +425,109 @@ def lambda_handler(event, context):
                 'body': json.dumps({'ok': False, 'error': 'Input file not found'})
             }
         
+        # Reuse results of an identical earlier upload instead of spending GPU time
+        content_hash, dedup_key, input_bytes = '', '', 0
+        try:
+            content_hash, input_bytes = compute_content_hash(input_s3_key)
+            dedup_key = build_dedup_key(content_hash, task, fast, reduction_percent)
+            existing = None if reprocess else find_existing_results(dedup_key)
+        except Exception as e:
+            print(f"[process] Content hash lookup failed, processing normally: {e}")
+            existing = None
+        
+        if existing:
+            print(f"[process] Job {job_id} matches results of {existing['sourceJobId']}, linking")
+            try:
+                link_existing_results(job_id, content_hash, dedup_key, existing)
+            except Exception as e:
+                print(f"[process] Linking results of {existing['sourceJobId']} failed, processing normally: {e}")
+                existing = None
+        
+        if existing:
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'ok': True,
+                    'jobId': job_id,
+                    'status': 'completed',
+                    'deduplicated': True,
+                    'sourceJobId': existing['sourceJobId'],
+                    'message': 'Identical study already processed, results reused'
+                })
+            }
+        
+        # Queue mode: a warm worker picks the job up. The worker's Batch job is stored
+        # separately because its state says nothing about this particular study
+        if JOB_QUEUE_URL:
+            worker_job_id = enqueue_job(job_id, input_s3_key, device, fast, reduction_percent,
+                                        task=task, dedup_key=dedup_key, profile=profile)
+            table.update_item(
+                Key={'jobId': job_id},
+                UpdateExpression='SET #status = :status, queuedAt = :now, updatedAt = :now, workerBatchJobId = :worker, '
+                                 'expectedArtifacts = :artifacts, inputHash = :hash, dedupKey = :key',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':status': 'queued',
+                    ':now': int(time.time()),
+                    ':worker': worker_job_id,
+                    ':artifacts': expected_artifacts_for(job_id),
+                    ':hash': content_hash,
+                    ':key': dedup_key
+                }
+            )
+            return {
+                'statusCode': 202,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'ok': True,
+                    'jobId': job_id,
+                    'workerBatchJobId': worker_job_id,
+                    'status': 'queued',
+                    'message': 'Job queued for a GPU worker'
+                })
+            }
+        
+        # Small inputs (dental CBCT, small MR) finish inference in seconds; pack them so
+        # several share one container start instead of paying for one each
+        if PACK_MAX_INPUT_MB > 0 and 0 < input_bytes <= PACK_MAX_INPUT_MB * 1024 * 1024:
+            descriptor = build_job_descriptor(job_id, input_s3_key, device, fast, reduction_percent,
+                                              task=task, dedup_key=dedup_key, profile=profile)
+            hold_for_pack(job_id, descriptor, content_hash, dedup_key, input_bytes)
+            pack = flush_pack()
+            return {
+                'statusCode': 202,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'ok': True,
+                    'jobId': job_id,
+                    'status': 'queued',
+                    'packed': True,
+                    'packSubmitted': pack['submitted'],
+                    'message': f'Small study queued for a shared GPU job (starts within {PACK_MAX_WAIT_SEC}s)'
+                })
+            }
+        
         # Submit job to AWS Batch
-        batch_job_id = submit_batch_job(job_id, input_s3_key, device, fast, reduction_percent)
+        batch_job_id = submit_batch_job(job_id, input_s3_key, device, fast, reduction_percent,
+                                        task=task, dedup_key=dedup_key, profile=profile)
         
         # Save expected artifact paths to DynamoDB
-        expected_artifacts = {
-            'obj': f's3://{S3_BUCKET}/results/{job_id}/Result.obj',
-            'mtl': f's3://{S3_BUCKET}/results/{job_id}/materials.mtl',
-            'json': f's3://{S3_BUCKET}/results/{job_id}/Result.json',
-            'zip': f's3://{S3_BUCKET}/results/{job_id}/result.zip'
-        }
+        expected_artifacts = expected_artifacts_for(job_id)
         
         # Update status to queued with Batch job ID
         table.update_item(
             Key={'jobId': job_id},
-            UpdateExpression='SET #status = :status, queuedAt = :now, updatedAt = :now, batchJobId = :batchId, expectedArtifacts = :artifacts',
+            UpdateExpression='SET #status = :status, queuedAt = :now, updatedAt = :now, batchJobId = :batchId, expectedArtifacts = :artifacts, inputHash = :hash, dedupKey = :key '
+                             'REMOVE batchStatus, batchStatusVersion',
             ExpressionAttributeNames={'#status': 'status'},
             ExpressionAttributeValues={
                 ':status': 'queued',
                 ':now': int(time.time()),
                 ':batchId': batch_job_id,
-                ':artifacts': expected_artifacts
+                ':artifacts': expected_artifacts,
+                ':hash': content_hash,
+                ':key': dedup_key
             }
         )
         
@@ -4,18 +4,58 @@ import boto3
 import time
 import random
 import string
-from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
 
 dynamodb = boto3.resource('dynamodb')
 vr_table = dynamodb.Table(os.environ['VR_CODES_TABLE'])
 
+CODE_TTL_SEC = 24 * 60 * 60
+MAX_ATTEMPTS = 10
+
+# Room codes are reserved as their own items in the codes table, keyed apart from
+# the 5-digit login codes, so uniqueness is a conditional write instead of a scan
+ROOM_KEY_PREFIX = 'room#'
+
 def generate_code(length=5):
     return ''.join(random.choices(string.digits, k=length))
 
 def generate_room_code(length=6):
     return ''.join(random.choices(string.digits, k=length))
 
+def put_if_free(item, now):
+    """Write item unless its key is held by an unexpired item (TTL deletion lags by hours)"""
+    try:
+        vr_table.put_item(
+            Item=item,
+            ConditionExpression='attribute_not_exists(code) OR expiresAt < :now',
+            ExpressionAttributeValues={':now': now}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def allocate(make_code, build_item, now):
+    """Claim a free code with at most MAX_ATTEMPTS conditional writes"""
+    for attempt in range(MAX_ATTEMPTS):
+        value = make_code()
+        if put_if_free(build_item(value), now):
+            return value
+        print(f"[vr-generate-code] Collision on attempt {attempt + 1}")
+    return None
+
+def allocation_failed():
+    return {
+        'statusCode': 503,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': '*',
+            'Access-Control-Allow-Methods': 'POST, OPTIONS'
+        },
+        'body': json.dumps({'error': 'Could not allocate a VR code, please retry'})
+    }
+
 def lambda_handler(event, context):
     try:
         # Get userId from Cognito authorizer
@@ -30,34 +70,36 @@ def lambda_handler(event, context):
             except:
                 pass
 
-        # Generate unique code
-        code = generate_code()
+        now = int(time.time())
+        expiration_time = now + CODE_TTL_SEC # 24 hours
         
-        # Generate unique roomCode
-        while True:
-            room_code = generate_room_code()
-            # Check if roomCode exists
-            response = vr_table.scan(
-                FilterExpression=Attr('roomCode').eq(room_code),
-                Limit=1
-            )
-            if response['Count'] == 0:
-                break
-        
-        expiration_time = int(time.time()) + (24 * 60 * 60) # 24 hours
-        
-        item = {
-            'code': code,
+        # Reserve a unique roomCode
+        room_code = allocate(generate_room_code, lambda value: {
+            'code': ROOM_KEY_PREFIX + value,
             'userId': user_id,
-            'roomCode': room_code,
             'expiresAt': expiration_time,
-            'createdAt': int(time.time())
-        }
+            'createdAt': now
+        }, now)
+        if room_code is None:
+            return allocation_failed()
         
-        if job_id:
-            item['jobId'] = job_id
+        def build_item(value):
+            item = {
+                'code': value,
+                'userId': user_id,
+                'roomCode': room_code,
+                'expiresAt': expiration_time,
+                'createdAt': now
+            }
+            if job_id:
+                item['jobId'] = job_id
+            return item
         
-        vr_table.put_item(Item=item)
+        # Claim a unique login code
+        code = allocate(generate_code, build_item, now)
+        if code is None:
+            vr_table.delete_item(Key={'code': ROOM_KEY_PREFIX + room_code})
+            return allocation_failed()
         
         return {
             'statusCode': 200,
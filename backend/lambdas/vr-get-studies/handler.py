@@ -1,27 +1,25 @@
 import json
 import os
+import time
 import boto3
 from boto3.dynamodb.conditions import Key
 
+from presign_cache import presigned_get_url
+
 dynamodb = boto3.resource('dynamodb')
 vr_table = dynamodb.Table(os.environ['VR_CODES_TABLE'])
 metadata_table = dynamodb.Table(os.environ['METADATA_TABLE'])
 s3 = boto3.client('s3')
 bucket_name = os.environ['S3_BUCKET']
 
-def get_presigned_url(key, expiration=3600):
+def get_presigned_url(key):
     try:
         if key.startswith('s3://'):
             parts = key[5:].split('/', 1)
             if len(parts) > 1:
                 key = parts[1]
         
-        url = s3.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket_name, 'Key': key},
-            ExpiresIn=expiration
-        )
-        return url
+        return presigned_get_url(s3, bucket_name, key)
     except Exception as e:
         print(f"Error generating presigned URL: {str(e)}")
         return None
@@ -46,7 +44,9 @@ def lambda_handler(event, context):
         response = vr_table.get_item(Key={'code': code})
         item = response.get('Item')
         
-        if not item:
+        # Room reservations share the table but are not login codes; TTL deletion
+        # lags, so expiry is checked here as well
+        if not item or 'roomCode' not in item or int(item.get('expiresAt', 0)) < int(time.time()):
             return {
                 'statusCode': 401,
                 'headers': {
@@ -0,0 +1,160 @@
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+
+from registry import DynamoRegistry, ApiPoster, ConnectionGone
+
+dynamodb = boto3.resource('dynamodb')
+
+DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']
+CONNECTIONS_TABLE = os.environ.get('CONNECTIONS_TABLE', '')
+WS_ENDPOINT = os.environ.get('WS_ENDPOINT', '')
+
+# API Gateway closes WebSocket connections after 2 hours; registry items expire with them
+CONNECTION_TTL_SEC = 2 * 60 * 60
+MAX_SUBSCRIBE_JOBS = 100
+
+# Job record fields pushed to subscribers; a stream record changing none of them is skipped
+PUSHED_FIELDS = ('status', 'progress', 'stage', 'message', 'errorMessage', 'completedAt')
+
+metadata_table = dynamodb.Table(DYNAMODB_TABLE)
+
+# Module-level so scripts/ws-local.py can swap in the in-memory stand-ins
+registry = DynamoRegistry(dynamodb.Table(CONNECTIONS_TABLE)) if CONNECTIONS_TABLE else None
+poster = ApiPoster(boto3.client('apigatewaymanagementapi', endpoint_url=WS_ENDPOINT)) if WS_ENDPOINT else None
+
+_cognito = None
+_deserializer = TypeDeserializer()
+
+
+def authenticate(token: str):
+    """Cognito user sub for an access token, or None"""
+    global _cognito
+    if not token:
+        return None
+    if _cognito is None:
+        _cognito = boto3.client('cognito-idp')
+    try:
+        user = _cognito.get_user(AccessToken=token)
+    except Exception as e:
+        print(f"[ws] Token rejected: {e}")
+        return None
+    attributes = {a['Name']: a['Value'] for a in user.get('UserAttributes', [])}
+    return attributes.get('sub')
+
+
+def load_jobs(job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Job records by jobId (owner and pushed fields only)"""
+    names = {'#status': 'status', '#message': 'message'}
+    projection = 'jobId, userId, #status, progress, stage, #message, errorMessage, completedAt'
+    request = {DYNAMODB_TABLE: {'Keys': [{'jobId': j} for j in job_ids],
+                                'ProjectionExpression': projection,
+                                'ExpressionAttributeNames': names}}
+    jobs = {}
+    while request:
+        resp = dynamodb.batch_get_item(RequestItems=request)
+        for item in resp.get('Responses', {}).get(DYNAMODB_TABLE, []):
+            jobs[item['jobId']] = item
+        request = resp.get('UnprocessedKeys') or {}
+    return jobs
+
+
+def job_message(job: Dict[str, Any]) -> Dict[str, Any]:
+    message = {'type': 'job', 'jobId': job['jobId']}
+    for field in PUSHED_FIELDS:
+        if job.get(field) is not None:
+            message[field] = job[field]
+    return message
+
+
+def send(connection_id: str, message: Dict[str, Any]) -> bool:
+    """Post one message; a gone connection is dropped from the registry"""
+    try:
+        poster.post(connection_id, message)
+        return True
+    except ConnectionGone:
+        print(f"[ws] Connection {connection_id} gone, removing")
+        registry.remove_connection(connection_id)
+        return False
+
+
+def connect_handler(event, context):
+    """$connect: ?token=<Cognito access token>; the connection is registered for its user"""
+    connection_id = event['requestContext']['connectionId']
+    token = (event.get('queryStringParameters') or {}).get('token')
+    user_id = authenticate(token)
+    if not user_id:
+        return {'statusCode': 401}
+    registry.add_connection(connection_id, user_id, int(time.time()) + CONNECTION_TTL_SEC)
+    print(f"[ws] Connected {connection_id} for user {user_id}")
+    return {'statusCode': 200}
+
+
+def disconnect_handler(event, context):
+    connection_id = event['requestContext']['connectionId']
+    registry.remove_connection(connection_id)
+    print(f"[ws] Disconnected {connection_id}")
+    return {'statusCode': 200}
+
+
+def subscribe_handler(event, context):
+    """
+    {"action": "subscribe", "jobIds": [...]}: push updates for the caller's jobs.
+    The current state of each job is sent right away, so nothing between the
+    client's last read and the subscription is missed.
+    """
+    connection_id = event['requestContext']['connectionId']
+    connection = registry.get_connection(connection_id)
+    if not connection:
+        return {'statusCode': 403}
+
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except json.JSONDecodeError:
+        body = {}
+    job_ids = body.get('jobIds') if isinstance(body, dict) else None
+    if not isinstance(job_ids, list) or not all(isinstance(j, str) and j for j in job_ids):
+        send(connection_id, {'type': 'error', 'error': 'jobIds must be a list of job IDs'})
+        return {'statusCode': 400}
+    job_ids = list(dict.fromkeys(job_ids))[:MAX_SUBSCRIBE_JOBS]
+
+    # Jobs of other users are ignored, same as unknown IDs
+    jobs = {job_id: job for job_id, job in (load_jobs(job_ids) if job_ids else {}).items()
+            if job.get('userId') == connection['userId']}
+    registry.subscribe(connection_id, list(jobs), int(connection['expiresAt']))
+    for job in jobs.values():
+        if not send(connection_id, job_message(job)):
+            break
+    print(f"[ws] {connection_id} subscribed to {len(jobs)} jobs")
+    return {'statusCode': 200}
+
+
+def _changed(record: Dict[str, Any]):
+    """(new image, True if a pushed field changed) for one stream record"""
+    images = record.get('dynamodb', {})
+    new = {k: _deserializer.deserialize(v) for k, v in images.get('NewImage', {}).items()}
+    old = {k: _deserializer.deserialize(v) for k, v in images.get('OldImage', {}).items()}
+    return new, any(new.get(f) != old.get(f) for f in PUSHED_FIELDS)
+
+
+def fanout_handler(event, context):
+    """Metadata table stream -> push job changes to subscribed connections"""
+    pushed = 0
+    latest = {}
+    for record in event.get('Records', []):
+        new, changed = _changed(record)
+        if changed and new.get('jobId'):
+            # Several records for one job in a batch: only the newest state matters
+            latest[new['jobId']] = new
+
+    for job_id, job in latest.items():
+        message = job_message(job)
+        for connection_id in registry.connections_for_job(job_id):
+            if send(connection_id, message):
+                pushed += 1
+    print(f"[ws] Pushed {pushed} messages for {len(latest)} jobs")
+    return {'ok': True, 'pushed': pushed, 'jobs': len(latest)}
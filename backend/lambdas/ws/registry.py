@@ -0,0 +1,136 @@
+"""
+WebSocket connection registry and message delivery
+
+The connections table holds one 'conn' item per open connection and one
+'job#<jobId>' item per subscription (same partition, so a disconnect removes
+everything with one query). Subscription items carry jobId, which feeds the
+sparse jobId-index used for fan-out.
+
+MemoryRegistry and MemoryPoster are in-process stand-ins with the same
+interface, used by scripts/ws-local.py.
+"""
+
+import json
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+CONNECTION_SK = 'conn'
+JOB_SK_PREFIX = 'job#'
+
+
+class ConnectionGone(Exception):
+    """The client disconnected without a $disconnect reaching us (API Gateway answered 410)"""
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return int(value) if value % 1 == 0 else float(value)
+    raise TypeError(f'Not JSON serializable: {type(value)}')
+
+
+def dumps(message: Dict[str, Any]) -> str:
+    return json.dumps(message, default=_encode)
+
+
+class DynamoRegistry:
+    def __init__(self, table):
+        self.table = table
+
+    def add_connection(self, connection_id: str, user_id: str, expires_at: int):
+        self.table.put_item(Item={
+            'connectionId': connection_id,
+            'sk': CONNECTION_SK,
+            'userId': user_id,
+            'expiresAt': expires_at
+        })
+
+    def get_connection(self, connection_id: str) -> Optional[Dict[str, Any]]:
+        return self.table.get_item(Key={'connectionId': connection_id, 'sk': CONNECTION_SK}).get('Item')
+
+    def subscribe(self, connection_id: str, job_ids: Iterable[str], expires_at: int):
+        with self.table.batch_writer() as batch:
+            for job_id in job_ids:
+                batch.put_item(Item={
+                    'connectionId': connection_id,
+                    'sk': JOB_SK_PREFIX + job_id,
+                    'jobId': job_id,
+                    'expiresAt': expires_at
+                })
+
+    def connections_for_job(self, job_id: str) -> List[str]:
+        kwargs = {
+            'IndexName': 'jobId-index',
+            'KeyConditionExpression': 'jobId = :jobId',
+            'ExpressionAttributeValues': {':jobId': job_id}
+        }
+        connection_ids = []
+        while True:
+            resp = self.table.query(**kwargs)
+            connection_ids.extend(item['connectionId'] for item in resp.get('Items', []))
+            if 'LastEvaluatedKey' not in resp:
+                return connection_ids
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    def remove_connection(self, connection_id: str):
+        kwargs = {
+            'KeyConditionExpression': 'connectionId = :id',
+            'ExpressionAttributeValues': {':id': connection_id},
+            'ProjectionExpression': 'connectionId, sk'
+        }
+        with self.table.batch_writer() as batch:
+            while True:
+                resp = self.table.query(**kwargs)
+                for item in resp.get('Items', []):
+                    batch.delete_item(Key={'connectionId': item['connectionId'], 'sk': item['sk']})
+                if 'LastEvaluatedKey' not in resp:
+                    break
+                kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+
+class ApiPoster:
+    """Sends messages through the API Gateway management API of the WebSocket stage"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def post(self, connection_id: str, message: Dict[str, Any]):
+        try:
+            self.client.post_to_connection(ConnectionId=connection_id, Data=dumps(message).encode('utf-8'))
+        except self.client.exceptions.GoneException:
+            raise ConnectionGone(connection_id)
+
+
+class MemoryRegistry:
+    def __init__(self):
+        self.connections: Dict[str, Dict[str, Any]] = {}
+        self.subscriptions: Dict[str, set] = {}
+
+    def add_connection(self, connection_id: str, user_id: str, expires_at: int):
+        self.connections[connection_id] = {'connectionId': connection_id, 'userId': user_id, 'expiresAt': expires_at}
+        self.subscriptions.setdefault(connection_id, set())
+
+    def get_connection(self, connection_id: str) -> Optional[Dict[str, Any]]:
+        return self.connections.get(connection_id)
+
+    def subscribe(self, connection_id: str, job_ids: Iterable[str], expires_at: int):
+        self.subscriptions.setdefault(connection_id, set()).update(job_ids)
+
+    def connections_for_job(self, job_id: str) -> List[str]:
+        return sorted(c for c, jobs in self.subscriptions.items() if job_id in jobs)
+
+    def remove_connection(self, connection_id: str):
+        self.connections.pop(connection_id, None)
+        self.subscriptions.pop(connection_id, None)
+
+
+class MemoryPoster:
+    """Collects messages per connection; connections in gone answer like a closed socket"""
+
+    def __init__(self):
+        self.sent: Dict[str, List[Dict[str, Any]]] = {}
+        self.gone = set()
+
+    def post(self, connection_id: str, message: Dict[str, Any]):
+        if connection_id in self.gone:
+            raise ConnectionGone(connection_id)
+        self.sent.setdefault(connection_id, []).append(json.loads(dumps(message)))
@@ -0,0 +1,88 @@
+"""
+Presigned GET URL cache shared by the API Lambdas (shipped in the dependencies layer)
+
+URLs are minted per time bucket: every URL handed out during a bucket expires at
+the same moment (bucket end + PRESIGN_MIN_REMAINING_SEC), and the same key gets
+the same URL for the whole bucket. Repeated loads of e.g. Result.obj therefore
+hit the browser/CDN cache, and any URL returned still has at least
+PRESIGN_MIN_REMAINING_SEC of validity. Entries live in module scope (one cache
+per warm Lambda container) under an LRU bound.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+BUCKET_SEC = int(os.environ.get('PRESIGN_BUCKET_SEC', '3600'))
+MIN_REMAINING_SEC = int(os.environ.get('PRESIGN_MIN_REMAINING_SEC', '3600'))
+MAX_ENTRIES = int(os.environ.get('PRESIGN_CACHE_SIZE', '2048'))
+
+_cache: 'OrderedDict[Tuple, Tuple[str, int]]' = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def split_s3_uri(uri: str) -> Optional[Tuple[str, str]]:
+    """('bucket', 'key') for s3://bucket/key, else None"""
+    if not isinstance(uri, str) or not uri.startswith('s3://'):
+        return None
+    parts = uri[len('s3://'):].split('/', 1)
+    if len(parts) != 2 or not parts[0] or not parts[1]:
+        return None
+    return parts[0], parts[1]
+
+
+def bucket_end(now: Optional[float] = None) -> int:
+    """End of the current time bucket; URLs cached now are reused until then"""
+    now = int(now if now is not None else time.time())
+    return (now // BUCKET_SEC + 1) * BUCKET_SEC
+
+
+def presigned_get_url(s3_client, bucket: str, key: str, now: Optional[float] = None,
+                      response_params: Optional[Dict[str, str]] = None) -> str:
+    """
+    Cached presigned GET URL for s3://bucket/key.
+    response_params are extra GetObject parameters such as ResponseContentDisposition.
+    Raises whatever generate_presigned_url raises; failures are not cached.
+    """
+    now = int(now if now is not None else time.time())
+    expires_at = bucket_end(now) + MIN_REMAINING_SEC
+    # Clients are module-level singletons in each handler; their identity separates
+    # e.g. the accelerate-endpoint client from the regular one
+    cache_key = (id(s3_client), bucket, key, tuple(sorted((response_params or {}).items())))
+
+    with _lock:
+        entry = _cache.get(cache_key)
+        if entry and entry[1] == expires_at:
+            _cache.move_to_end(cache_key)
+            _stats['hits'] += 1
+            return entry[0]
+
+    url = s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket, 'Key': key, **(response_params or {})},
+        ExpiresIn=expires_at - now,
+    )
+
+    with _lock:
+        _stats['misses'] += 1
+        _cache[cache_key] = (url, expires_at)
+        _cache.move_to_end(cache_key)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return url
+
+
+def presigned_url_for_uri(s3_client, uri: str) -> Optional[str]:
+    """Cached presigned URL for an s3:// URI, or None if it is not one"""
+    parts = split_s3_uri(uri)
+    if parts is None:
+        return None
+    return presigned_get_url(s3_client, *parts)
+
+
+def cache_stats():
+    with _lock:
+        return {'entries': len(_cache), **_stats}
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Job queue for the local FastAPI server (app.py)
+Jobs are accepted at once and run on a bounded thread pool, so a long
+TotalSegmentator run no longer blocks the event loop; meshing fans out to a
+process pool. Status is kept in memory and mirrored to <job dir>/status.json.
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from device_slots import DeviceScheduler
+from file_serving import precompress
+from mesh_processing import Mesh, crop_to_mask, mask_array_to_mesh, decimate_mesh, export_obj_with_submeshes
+
+# Pipelines running at once; 0 means one per device slot (see device_slots.py)
+APP_JOB_WORKERS = int(os.environ.get('APP_JOB_WORKERS', '0'))
+# Accepted jobs waiting for a worker before new ones get 429
+APP_MAX_PENDING = int(os.environ.get('APP_MAX_PENDING', '8'))
+# Processes shared by all jobs for per-structure meshing
+APP_MESH_PROCESSES = int(os.environ.get('APP_MESH_PROCESSES', str(max(1, (os.cpu_count() or 2) // 2))))
+
+STATUS_FILE = 'status.json'
+# Progress ranges per stage, as in the Batch worker
+SEGMENT_RANGE = (5, 70)
+MESH_RANGE = (70, 95)
+
+
+class QueueFull(Exception):
+    pass
+
+
+def mesh_structure(mask: np.ndarray, spacing, offset: np.ndarray, reduction_percent: int) -> Optional[Mesh]:
+    """Runs in a mesh worker process on a mask cropped to its bounding box"""
+    # No smoothing here; reduction_percent is the only decimation
+    mesh = mask_array_to_mesh(mask, spacing, smooth=False, decimate=False)
+    if mesh is None:
+        return None
+    mesh.vertices += offset * np.asarray(spacing[:3], dtype=np.float64)
+    if reduction_percent and reduction_percent > 0:
+        mesh = decimate_mesh(mesh, target_percent=1.0 - reduction_percent / 100.0)
+    return mesh
+
+
+class JobQueue:
+    """Accepts jobs, runs them on the worker pools and answers status queries"""
+
+    def __init__(self, jobs_dir: Path, runner, devices: DeviceScheduler, job_workers: int = APP_JOB_WORKERS,
+                 max_pending: int = APP_MAX_PENDING, mesh_processes: int = APP_MESH_PROCESSES):
+        self.jobs_dir = jobs_dir
+        self.runner = runner
+        self.devices = devices
+        # A job only holds its slot while segmenting, so workers may outnumber slots
+        job_workers = job_workers or len(devices.slots)
+        self.capacity = job_workers + max_pending
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._active = 0
+        self._lock = threading.Lock()
+        self._workers = ThreadPoolExecutor(max_workers=job_workers, thread_name_prefix='job')
+        # spawn: forking a process that runs threads can deadlock the child
+        self._mesh_pool = ProcessPoolExecutor(max_workers=mesh_processes,
+                                              mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, job_id: str, input_path: Path, device: str, fast: bool, reduction_percent: int,
+               input_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Raises QueueFull, or DeviceUnavailable for a device this server does not have"""
+        self.devices.candidates(device)
+        job = {
+            'jobId': job_id,
+            'status': 'queued',
+            'progress': 0,
+            'message': 'Waiting for a worker...',
+            'createdAt': int(time.time()),
+        }
+        if input_sha256:
+            job['inputSha256'] = input_sha256
+        with self._lock:
+            if self._active >= self.capacity:
+                raise QueueFull(f"{self._active} jobs queued or running")
+            self._active += 1
+            self._jobs[job_id] = job
+        self._save(job_id)
+        self._workers.submit(self._run, job_id, input_path, device, fast, reduction_percent)
+        return dict(job)
+
+    def full(self) -> bool:
+        """Checked before an upload is read, so a busy server does not receive the body"""
+        with self._lock:
+            return self._active >= self.capacity
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if job_id in self._jobs:
+            return dict(self._jobs[job_id])
+        path = self.jobs_dir / job_id / STATUS_FILE
+        if path.is_file():
+            return json.loads(path.read_text())
+        return None
+
+    def is_active(self, job_id: str) -> bool:
+        """Queued or running in this server process"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job is not None and job['status'] in ('queued', 'processing')
+
+    def forget(self, job_id: str):
+        """Drop a finished job whose directory was removed"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job['status'] not in ('queued', 'processing'):
+                del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            statuses = [j['status'] for j in self._jobs.values()]
+        return {
+            'queued': statuses.count('queued'),
+            'processing': statuses.count('processing'),
+            'capacity': self.capacity,
+            'devices': self.devices.stats(),
+        }
+
+    def shutdown(self):
+        self._workers.shutdown(wait=False, cancel_futures=True)
+        self._mesh_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _update(self, job_id: str, **fields):
+        self._jobs[job_id].update(fields)
+        self._save(job_id)
+
+    def _save(self, job_id: str):
+        path = self.jobs_dir / job_id / STATUS_FILE
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self._jobs[job_id]))
+        tmp.replace(path)
+
+    def _run(self, job_id: str, input_path: Path, device: str, fast: bool, reduction_percent: int):
+        start = time.time()
+        try:
+            self._update(job_id, status='processing', stage='waiting', progress=SEGMENT_RANGE[0],
+                         message='Waiting for a device...', startedAt=int(start))
+            artifacts = self._pipeline(job_id, input_path, device, fast, reduction_percent)
+            self._update(job_id, status='completed', stage='done', progress=100, message='Completed',
+                         artifacts=artifacts, elapsedSec=round(time.time() - start, 1), finishedAt=int(time.time()))
+        except Exception as e:
+            print(f"[jobs] {job_id} failed: {e}")
+            self._update(job_id, status='failed', error=str(e), message='Failed',
+                         elapsedSec=round(time.time() - start, 1), finishedAt=int(time.time()))
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _pipeline(self, job_id: str, input_path: Path, device: str, fast: bool, reduction_percent: int) -> Dict[str, str]:
+        job_dir = self.jobs_dir / job_id
+        seg_dir = job_dir / "segmentations"
+        seg_dir.mkdir(parents=True, exist_ok=True)
+
+        lo, hi = SEGMENT_RANGE
+
+        def on_progress(fraction: float, detail: str):
+            self._update(job_id, progress=int(lo + (hi - lo) * fraction), message=detail or 'Segmenting...')
+
+        slot = self.devices.acquire(device, job_id)
+        try:
+            self._update(job_id, stage='segmenting', message='Segmenting...', slot=slot.name)
+            segmentation = self.runner.run(input_path, seg_dir, task='total', fast=fast, device=slot.device,
+                                           on_progress=on_progress)
+        except Exception as e:
+            raise RuntimeError(f"TotalSegmentator failed: {e}")
+        finally:
+            self.devices.release(slot)
+
+        # Masks go to the process pool cropped to their bounding box, which keeps
+        # the pickled payload small next to the full scan
+        self._update(job_id, stage='meshing', progress=MESH_RANGE[0], message='Building 3D models...')
+        futures = []
+        for name, mask in segmentation.iter_masks():
+            crop = crop_to_mask(mask)
+            if crop is None:
+                continue
+            window, offset = crop
+            futures.append((name, self._mesh_pool.submit(
+                mesh_structure, np.ascontiguousarray(mask[window]), segmentation.spacing, offset, reduction_percent)))
+
+        meshes: List[Mesh] = []
+        names: List[str] = []
+        lo, hi = MESH_RANGE
+        for i, (name, future) in enumerate(futures, 1):
+            try:
+                mesh = future.result()
+            except Exception as e:
+                print(f"[mask_to_mesh] error for {name}: {e}")
+                mesh = None
+            if mesh is not None:
+                meshes.append(mesh)
+                names.append(name)
+            self._update(job_id, progress=int(lo + (hi - lo) * i / len(futures)),
+                         message=f"Building 3D models ({i} of {len(futures)})...")
+
+        if not meshes:
+            raise RuntimeError("No meshes generated from segmentations.")
+
+        self._update(job_id, stage='exporting', message='Exporting...')
+        obj_path, mtl_path, json_path = export_obj_with_submeshes(meshes, names, job_dir, center=False)
+        # Built next to the job directory (it would include itself) and moved in, so /files can serve it
+        archive = shutil.make_archive(str(job_dir), 'zip', root_dir=str(job_dir))
+        zip_path = job_dir / 'result.zip'
+        shutil.move(archive, zip_path)
+        # After the zip, which should not carry the compressed copies
+        for path in (obj_path, mtl_path, json_path):
+            precompress(path)
+
+        return {
+            "obj": f"/files/{job_id}/{obj_path.name}",
+            "mtl": f"/files/{job_id}/{mtl_path.name}",
+            "json": f"/files/{job_id}/{json_path.name}",
+            "zip": f"/files/{job_id}/{zip_path.name}",
+        }
@@ -3,6 +3,8 @@
 SageMaker inference script for TotalSegmentator with GPU
 """
 
+from startup import timeline
+
 import io
 import os
 import sys
@@ -15,17 +17,12 @@ from pathlib import Path
 from typing import Dict, Any
 
 import boto3
-import nibabel as nib
-import numpy as np
 
-from mesh_processing import (
-    mask_to_mesh,
-    export_obj_with_submeshes,
-    get_system_for_subobject,
-    get_color_for_subobject
-)
+# mesh_processing (skimage, scipy) is imported in predict_fn so /ping can answer sooner
+import s3_transfer
+import weights
+from totalseg_runner import TotalSegmentatorRunner
 
-s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
 
 # Get DynamoDB table name from environment (set in SageMaker endpoint config)
@@ -33,14 +30,23 @@ DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'iris-oculus-metadata')
 
 def model_fn(model_dir):
     """
-    Load the model. For TotalSegmentator, the model is downloaded on first use.
-    This function must return quickly for SageMaker health checks to pass.
+    Load the model. Weights are baked into the image and checked against their
+    manifest here (raises weights.WeightsError on mismatch, so /ping fails fast).
+    This function must return quickly for SageMaker health checks to pass, so the
+    heavy TotalSegmentator/torch import runs in a background thread.
+    The runner is kept in the model object so loaded weights survive between invocations.
     """
-    print("[inference] Model initialized. TotalSegmentator will download weights on first use.", flush=True)
+    weights_record = weights.verify()
+    timeline.mark('weights_verified' if weights_record.get('verified') else 'weights_unverified')
+    runner = TotalSegmentatorRunner()
+    runner.start_warm_up()
+    print("[inference] Model initialized.", flush=True)
     return {
         "ready": True,
         "model_dir": model_dir,
-        "status": "initialized"
+        "status": "initialized",
+        "runner": runner,
+        "weights": weights_record
     }
 
 
@@ -80,53 +86,41 @@ def predict_fn(input_data: Dict[str, Any], model):
         
         # Download input from S3
         print(f"Downloading {s3_input_key} from S3")
-        s3.download_file(s3_bucket, s3_input_key, str(input_path))
+        transfers = [s3_transfer.download(s3_bucket, s3_input_key, input_path)]
+        timeline.mark('input_downloaded')
         
         # Run TotalSegmentator
-        cmd = [
-            'TotalSegmentator',
-            '-i', str(input_path),
-            '-o', str(seg_dir),
-        ]
-        
-        if device == 'cpu':
-            os.environ['CUDA_VISIBLE_DEVICES'] = ''
-        
-        if fast:
-            cmd.append('--fast')
-        
-        print(f"Running: {' '.join(cmd)}")
-        
+        runner = model.get('runner') or TotalSegmentatorRunner()
+        startup = None if timeline.closed else timeline.close()
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            print(result.stdout)
+            segmentation = runner.run(input_path, seg_dir, task='total', fast=fast, device=device)
         except subprocess.CalledProcessError as e:
             print(f"TotalSegmentator failed: {e}")
             print(e.stderr)
             raise
         
         # Convert segmentations to meshes
+        from mesh_processing import mask_array_to_mesh, decimate_mesh, export_obj_with_submeshes
         print("Converting segmentations to meshes")
-        nii_files = sorted([p for p in seg_dir.glob('*.nii*') if p.is_file()])
         
         meshes = []
         names = []
-        
-        for nii in nii_files:
-            name = nii.name.replace('.nii.gz', '').replace('.nii', '')
-            mesh = mask_to_mesh(nii)
+        reduce = bool(reduction_percent and reduction_percent > 0)
+        
+        for name, mask in segmentation.iter_masks():
+            try:
+                # reduction_percent replaces the default decimation when given
+                mesh = mask_array_to_mesh(mask, segmentation.spacing, decimate=not reduce)
+            except Exception as e:
+                print(f"Mesh generation failed for {name}: {e}")
+                mesh = None
             
             if mesh is None:
                 continue
             
             # Decimate
-            if reduction_percent and reduction_percent > 0:
-                tri_count = len(np.asarray(mesh.triangles))
-                target_tri = max(100, int(tri_count * (1.0 - reduction_percent/100.0)))
-                try:
-                    mesh = mesh.simplify_quadric_decimation(target_number_of_triangles=target_tri)
-                except Exception as e:
-                    print(f"Decimation failed for {name}: {e}")
+            if reduce:
+                mesh = decimate_mesh(mesh, target_percent=1.0 - reduction_percent / 100.0)
             
             meshes.append(mesh)
             names.append(name)
@@ -136,7 +130,7 @@ def predict_fn(input_data: Dict[str, Any], model):
         
         # Export meshes
         print(f"Exporting {len(meshes)} meshes")
-        obj_path, mtl_path, json_path = export_obj_with_submeshes(meshes, names, output_dir)
+        obj_path, mtl_path, json_path = export_obj_with_submeshes(meshes, names, output_dir, center=False)
         
         # Create zip archive
         zip_path = shutil.make_archive(str(output_dir / 'result'), 'zip', root_dir=str(output_dir))
@@ -146,6 +140,7 @@ def predict_fn(input_data: Dict[str, Any], model):
         
         artifacts = {}
         artifact_s3_keys = {}
+        uploads = []
         
         for local_path, artifact_name in [
             (obj_path, 'Result.obj'),
@@ -154,10 +149,12 @@ def predict_fn(input_data: Dict[str, Any], model):
             (zip_path, 'result.zip')
         ]:
             s3_key = f"{s3_output_prefix}{artifact_name}"
-            s3.upload_file(str(local_path), s3_bucket, s3_key)
+            uploads.append((Path(local_path), s3_bucket, s3_key))
             artifacts[artifact_name.split('.')[0]] = f"/files/{job_id}/{artifact_name}"
             artifact_s3_keys[artifact_name.split('.')[0]] = f"s3://{s3_bucket}/{s3_key}"
         
+        transfers.extend(s3_transfer.upload_many(uploads))
+        
         print(f"Job {job_id} completed successfully, updating DynamoDB...")
         
         # Update DynamoDB with completion status and artifact paths
@@ -182,7 +179,9 @@ def predict_fn(input_data: Dict[str, Any], model):
             'ok': True,
             'jobId': job_id,
             'artifacts': artifacts,
-            's3_artifacts': artifact_s3_keys
+            's3_artifacts': artifact_s3_keys,
+            'transfers': transfers,
+            'startup': startup
         }
 
 
@@ -1,17 +1,55 @@
 #!/usr/bin/env python3
 """
-Mesh processing utilities (optimized for SageMaker Serverless)
-Uses trimesh instead of open3d for smaller image size
+Mesh processing shared by the Batch worker, the SageMaker endpoint and the
+local API (app.py); backend/, batch/ and sagemaker/ carry identical copies.
+
+Meshes are plain vertex/face arrays (Mesh). Marching cubes, cleanup, smoothing
+and decimation each have one or more backends and the first installed one in
+preference order is used (fastest first, see scripts/bench-mesh.py):
+  MESH_BACKENDS   pins backends, e.g. 'decimate=open3d,smooth=trimesh'
+  MESH_CALIBRATE  'true' times the installed candidates on a small sphere at
+                  first use and keeps the fastest instead
+scripts/mesh-parity.py checks that the backends of each operation agree.
 """
 
+import os
 import json
+import time
+import importlib
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
 
 import numpy as np
 import nibabel as nib
-from skimage import measure
-import trimesh
+
+MESH_SMOOTH_ITERATIONS = int(os.environ.get('MESH_SMOOTH_ITERATIONS', '15'))
+MESH_SMOOTH_LAMBDA = float(os.environ.get('MESH_SMOOTH_LAMBDA', '0.5'))
+# Fraction of faces kept by clean_mesh, for meshes above MESH_DECIMATE_MIN_FACES
+MESH_DECIMATE_RATIO = float(os.environ.get('MESH_DECIMATE_RATIO', '0.2'))
+MESH_DECIMATE_MIN_FACES = int(os.environ.get('MESH_DECIMATE_MIN_FACES', '1000'))
+MESH_BACKENDS = os.environ.get('MESH_BACKENDS', '')
+MESH_CALIBRATE = os.environ.get('MESH_CALIBRATE', 'false').lower() == 'true'
+
+MIN_DECIMATED_FACES = 100
+MERGE_DIGITS = 8
+MIN_FACE_AREA = 1e-12
+CALIBRATION_SIZE = 48
+
+
+class Mesh:
+    """Triangle mesh: float64 vertices (N, 3) and int64 faces (M, 3)"""
+
+    __slots__ = ('vertices', 'faces')
+
+    def __init__(self, vertices, faces):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float64)
+        self.faces = np.ascontiguousarray(faces, dtype=np.int64)
+
+    def copy(self) -> 'Mesh':
+        return Mesh(self.vertices.copy(), self.faces.copy())
+
+    def __len__(self) -> int:
+        return len(self.faces)
 
 
 def get_system_for_subobject(obj_name_original: str) -> str:
@@ -77,13 +115,88 @@ def get_system_for_subobject(obj_name_original: str) -> str:
 
 def get_color_for_subobject(obj_name_original: str) -> Tuple[int, int, int]:
     name = obj_name_original.lower()
+    
+    # ===== DENTAL STRUCTURES - Unique colors per tooth =====
+    # FDI notation: 1x=upper right, 2x=upper left, 3x=lower left, 4x=lower right
+    # x1=central incisor, x2=lateral incisor, x3=canine, x4-x5=premolars, x6-x8=molars
+    
+    dental_colors = {
+        # Upper Right (1x) - Blue spectrum
+        "upper_right_central_incisor": (0, 120, 255),      # Bright blue
+        "upper_right_lateral_incisor": (0, 180, 255),      # Sky blue
+        "upper_right_canine": (0, 220, 200),               # Cyan
+        "upper_right_first_premolar": (0, 200, 150),       # Teal
+        "upper_right_second_premolar": (0, 180, 120),      # Sea green
+        "upper_right_first_molar": (0, 160, 100),          # Green-teal
+        "upper_right_second_molar": (0, 140, 80),          # Dark teal
+        "upper_right_third_molar": (0, 120, 60),           # Forest teal
+        
+        # Upper Left (2x) - Green spectrum
+        "upper_left_central_incisor": (50, 205, 50),       # Lime green
+        "upper_left_lateral_incisor": (34, 180, 34),       # Forest green
+        "upper_left_canine": (0, 200, 100),                # Spring green
+        "upper_left_first_premolar": (60, 179, 113),       # Medium sea green
+        "upper_left_second_premolar": (46, 139, 87),       # Sea green
+        "upper_left_first_molar": (32, 178, 170),          # Light sea green
+        "upper_left_second_molar": (0, 139, 139),          # Dark cyan
+        "upper_left_third_molar": (0, 128, 128),           # Teal
+        
+        # Lower Left (3x) - Yellow/Orange spectrum
+        "lower_left_central_incisor": (255, 215, 0),       # Gold
+        "lower_left_lateral_incisor": (255, 193, 37),      # Goldenrod
+        "lower_left_canine": (255, 165, 0),                # Orange
+        "lower_left_first_premolar": (255, 140, 0),        # Dark orange
+        "lower_left_second_premolar": (255, 127, 80),      # Coral
+        "lower_left_first_molar": (255, 99, 71),           # Tomato
+        "lower_left_second_molar": (250, 128, 114),        # Salmon
+        "lower_left_third_molar": (233, 150, 122),         # Dark salmon
+        
+        # Lower Right (4x) - Purple/Pink spectrum
+        "lower_right_central_incisor": (186, 85, 211),     # Medium orchid
+        "lower_right_lateral_incisor": (147, 112, 219),    # Medium purple
+        "lower_right_canine": (138, 43, 226),              # Blue violet
+        "lower_right_first_premolar": (153, 50, 204),      # Dark orchid
+        "lower_right_second_premolar": (148, 0, 211),      # Dark violet
+        "lower_right_first_molar": (199, 21, 133),         # Medium violet red
+        "lower_right_second_molar": (219, 112, 147),       # Pale violet red
+        "lower_right_third_molar": (255, 20, 147),         # Deep pink
+        
+        # Pulp chambers - Red tones (darker/brighter than teeth)
+        "pulp": (220, 20, 60),                             # Crimson for all pulp
+        
+        # Crown
+        "crown": (255, 248, 220),                          # Cornsilk (ivory/cream)
+        
+        # Anatomical structures
+        "maxillary_sinus": (135, 206, 250),                # Light sky blue
+        "inferior_alveolar_canal": (255, 215, 0),          # Gold/yellow for nerves
+        "mandibular_canal": (255, 200, 0),                 # Similar gold
+    }
+    
+    # Check for specific dental structures first
+    for key, color in dental_colors.items():
+        if key in name:
+            return color
+    
+    # Check for pulp (any tooth pulp)
+    if "pulp" in name:
+        return (220, 20, 60)  # Crimson
+    
+    # Check for sinus
+    if "sinus" in name:
+        return (135, 206, 250)  # Light sky blue
+    
+    # Check for canal (nerve)
+    if "canal" in name:
+        return (255, 215, 0)  # Gold
+    
+    # ===== Original specific mappings =====
     specific = {
         "heartchambers_highres": (200, 90, 70),
         "gland": (238, 130, 25),
         "brain": (255, 180, 184),
         "cyst": (70, 230, 120),
         "gingiva": (255, 182, 193),
-        "sinus": (25, 60, 255),
         "perforator": (255, 100, 50),
         "circumflex": (255, 100, 50),
         "colon": (200, 125, 140),
@@ -144,115 +257,379 @@ def get_color_for_subobject(obj_name_original: str) -> Tuple[int, int, int]:
     return (200, 200, 200)
 
 
-def smooth_mesh(mesh: trimesh.Trimesh, iterations: int = 3):
+# ----------------------------------------------------------------------------
+# Geometry helpers
+# ----------------------------------------------------------------------------
+
+def signed_volume(vertices: np.ndarray, faces: np.ndarray) -> float:
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    return float(np.einsum('ij,ij->', a, np.cross(b, c)) / 6.0)
+
+
+def volume_and_center(vertices: np.ndarray, faces: np.ndarray) -> Tuple[float, np.ndarray]:
+    """Signed volume and center of mass (tetrahedra against the origin)"""
+    tri = vertices[faces]
+    six_vol = np.einsum('ij,ij->i', tri[:, 0], np.cross(tri[:, 1], tri[:, 2]))
+    total = six_vol.sum()
+    if total == 0:
+        return 0.0, vertices.mean(axis=0) if len(vertices) else np.zeros(3)
+    center = (six_vol[:, None] * tri.sum(axis=1)).sum(axis=0) / (4.0 * total)
+    return float(total / 6.0), center
+
+
+def is_closed(faces: np.ndarray) -> bool:
+    """Every edge shared by exactly two faces (a mask cut by the scan border is open)"""
+    edges = np.sort(np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1)
+    _, counts = np.unique(edges, axis=0, return_counts=True)
+    return bool(len(counts)) and bool((counts == 2).all())
+
+
+def laplacian_operator(faces: np.ndarray, n_vertices: int):
+    """Row-normalised adjacency: each vertex moves to the mean of its neighbours"""
+    from scipy import sparse
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    edges = np.concatenate([edges, edges[:, ::-1]])
+    adjacency = sparse.coo_matrix(
+        (np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n_vertices, n_vertices)
+    ).tocsr()
+    adjacency.data[:] = 1.0  # shared edges were summed
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    degree[degree == 0] = 1.0
+    return sparse.diags(1.0 / degree) @ adjacency
+
+
+# ----------------------------------------------------------------------------
+# Backends (one function per operation and library)
+# ----------------------------------------------------------------------------
+
+def _marching_cubes_skimage(volume: np.ndarray, spacing, level: float) -> Tuple[np.ndarray, np.ndarray]:
+    from skimage import measure
+    verts, faces, _, _ = measure.marching_cubes(volume, level=level, spacing=tuple(spacing))
+    return verts, faces
+
+
+def _cleanup_numpy(mesh: Mesh) -> Mesh:
+    """Merge coincident vertices, drop degenerate and duplicate faces and unreferenced vertices"""
+    vertices, faces = mesh.vertices, mesh.faces
+    if len(faces) == 0:
+        return Mesh(np.empty((0, 3)), np.empty((0, 3), dtype=np.int64))
+
+    # Merge vertices equal to MERGE_DIGITS decimals, keeping first-seen order
+    _, first, inverse = np.unique(np.round(vertices, MERGE_DIGITS), axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    vertices = vertices[first[order]]
+    faces = rank[inverse.reshape(-1)][faces]
+
+    # Degenerate faces: repeated vertex or zero area
+    tri = vertices[faces]
+    area2 = np.linalg.norm(np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0]), axis=1)
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2]) & (area2 > MIN_FACE_AREA)
+    faces = faces[keep]
+
+    # Duplicate faces regardless of winding
+    _, unique_idx = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    faces = faces[np.sort(unique_idx)]
+
+    used = np.unique(faces)
+    remap = np.full(len(vertices), -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    return Mesh(vertices[used], remap[faces])
+
+
+def _smooth(vertices: np.ndarray, faces: np.ndarray, step: Callable, lamb: float, iterations: int) -> np.ndarray:
     """
-    Smooth mesh to remove cubic/blocky appearance from segmentation
-    Uses Laplacian smoothing to make surfaces more natural
+    Explicit Laplacian steps; closed meshes are rescaled about the center of mass
+    to keep the initial volume (undefined for open ones, which are left unscaled)
     """
-    try:
-        # Apply Laplacian smoothing
-        for _ in range(iterations):
-            # Get vertex neighbors
-            vertex_neighbors = mesh.vertex_neighbors
-            
-            # For each vertex, move it towards the average position of neighbors
-            new_vertices = np.array(mesh.vertices)
-            for i, neighbors in enumerate(vertex_neighbors):
-                if len(neighbors) > 0:
-                    neighbor_positions = mesh.vertices[neighbors]
-                    average_position = np.mean(neighbor_positions, axis=0)
-                    # Blend with current position (0.5 = 50% smoothing)
-                    new_vertices[i] = 0.5 * mesh.vertices[i] + 0.5 * average_position
-            
-            mesh.vertices = new_vertices
-        
-        # Recalculate normals after smoothing
-        mesh.fix_normals()
-        print(f"[smooth_mesh] Applied {iterations} iterations of smoothing")
-    except Exception as e:
-        print(f"[smooth_mesh] warning: {e}")
+    constrain = is_closed(faces)
+    vol_ini, center = volume_and_center(vertices, faces)
+    vertices = vertices.copy()
+    for _ in range(iterations):
+        vertices += lamb * (step(vertices) - vertices)
+        if not constrain:
+            continue
+        vol_new = signed_volume(vertices, faces)
+        ratio = vol_ini / vol_new if vol_new else 0.0
+        if ratio > 0:
+            vertices = (vertices - center) * ratio ** (1.0 / 3.0) + center
+    return vertices
+
+
+def _smooth_scipy(mesh: Mesh, lamb: float, iterations: int) -> Mesh:
+    operator = laplacian_operator(mesh.faces, len(mesh.vertices))
+    return Mesh(_smooth(mesh.vertices, mesh.faces, operator.dot, lamb, iterations), mesh.faces)
+
+
+def _smooth_trimesh(mesh: Mesh, lamb: float, iterations: int) -> Mesh:
+    import trimesh
+    tm = trimesh.Trimesh(vertices=mesh.vertices, faces=mesh.faces, process=False)
+    trimesh.smoothing.filter_laplacian(tm, lamb=lamb, iterations=iterations, volume_constraint=is_closed(mesh.faces))
+    return Mesh(tm.vertices, mesh.faces)
+
+
+def _decimate_fast_simplification(mesh: Mesh, target_faces: int) -> Mesh:
+    import fast_simplification
+    reduction = 1.0 - target_faces / len(mesh.faces)
+    vertices, faces = fast_simplification.simplify(mesh.vertices, mesh.faces, target_reduction=reduction)
+    return Mesh(vertices, faces)
+
+
+def _decimate_open3d(mesh: Mesh, target_faces: int) -> Mesh:
+    import open3d as o3d
+    o3d_mesh = o3d.geometry.TriangleMesh(
+        o3d.utility.Vector3dVector(mesh.vertices),
+        o3d.utility.Vector3iVector(mesh.faces.astype(np.int32, copy=False))
+    )
+    simplified = o3d_mesh.simplify_quadric_decimation(target_number_of_triangles=target_faces)
+    return Mesh(np.asarray(simplified.vertices), np.asarray(simplified.triangles))
+
 
+def _decimate_pymeshlab(mesh: Mesh, target_faces: int) -> Mesh:
+    import pymeshlab
+    ms = pymeshlab.MeshSet()
+    ms.add_mesh(pymeshlab.Mesh(mesh.vertices, mesh.faces.astype(np.int32, copy=False)))
+    ms.meshing_decimation_quadric_edge_collapse(targetfacenum=target_faces)
+    result = ms.current_mesh()
+    return Mesh(result.vertex_matrix(), result.face_matrix())
 
-def decimate_mesh(mesh: trimesh.Trimesh, target_percent: float = 0.5):
+
+# Candidates per operation, fastest first: (name, module that must import, function)
+BACKENDS: Dict[str, List[Tuple[str, str, Callable]]] = {
+    'marching_cubes': [('skimage', 'skimage.measure', _marching_cubes_skimage)],
+    'cleanup': [('numpy', 'numpy', _cleanup_numpy)],
+    'smooth': [
+        ('scipy', 'scipy.sparse', _smooth_scipy),
+        ('trimesh', 'trimesh', _smooth_trimesh),
+    ],
+    'decimate': [
+        ('fast_simplification', 'fast_simplification', _decimate_fast_simplification),
+        ('open3d', 'open3d', _decimate_open3d),
+        ('pymeshlab', 'pymeshlab', _decimate_pymeshlab),
+    ],
+}
+
+_importable: Dict[str, bool] = {}
+_selected: Dict[str, Optional[Tuple[str, Callable]]] = {}
+
+
+def _is_importable(module: str) -> bool:
+    if module not in _importable:
+        try:
+            importlib.import_module(module)
+            _importable[module] = True
+        except Exception:
+            _importable[module] = False
+    return _importable[module]
+
+
+def available_backends(operation: str, first_only: bool = False) -> List[Tuple[str, Callable]]:
+    """Installed backends for an operation, in preference order"""
+    found = []
+    for name, module, fn in BACKENDS[operation]:
+        if _is_importable(module):
+            found.append((name, fn))
+            if first_only:
+                break
+    return found
+
+
+def _pinned_backends() -> Dict[str, str]:
+    pins = {}
+    for item in MESH_BACKENDS.split(','):
+        if '=' in item:
+            operation, name = item.split('=', 1)
+            pins[operation.strip()] = name.strip()
+    return pins
+
+
+def _calibration_mesh() -> Mesh:
+    n = CALIBRATION_SIZE
+    grid = np.indices((n, n, n), dtype=np.float32) - (n - 1) / 2
+    volume = (np.sqrt((grid ** 2).sum(axis=0)) < n * 0.4).astype(np.uint8)
+    return _cleanup_numpy(Mesh(*_marching_cubes_skimage(volume, (1.0, 1.0, 1.0), 0.5)))
+
+
+def _calibrate(operation: str, candidates: List[Tuple[str, Callable]]) -> Tuple[str, Callable]:
+    """Time each candidate on the calibration sphere and return the fastest"""
+    mesh = _calibration_mesh()
+    calls = {
+        'smooth': lambda fn: fn(mesh, MESH_SMOOTH_LAMBDA, MESH_SMOOTH_ITERATIONS),
+        'decimate': lambda fn: fn(mesh, max(MIN_DECIMATED_FACES, int(len(mesh) * MESH_DECIMATE_RATIO))),
+        'cleanup': lambda fn: fn(mesh),
+    }
+    if operation not in calls:
+        return candidates[0]
+    timings = []
+    for name, fn in candidates:
+        started = time.perf_counter()
+        try:
+            calls[operation](fn)
+        except Exception as e:
+            print(f"[mesh] calibration: {operation}={name} failed: {e}")
+            continue
+        timings.append((time.perf_counter() - started, name, fn))
+    if not timings:
+        return candidates[0]
+    timings.sort(key=lambda t: t[0])
+    print(f"[mesh] calibration {operation}: " + ', '.join(f"{name} {sec * 1000:.0f}ms" for sec, name, _ in timings))
+    return timings[0][1], timings[0][2]
+
+
+def select_backend(operation: str) -> Optional[Tuple[str, Callable]]:
+    """The backend used for an operation (chosen once per process); None when nothing is installed"""
+    if operation in _selected:
+        return _selected[operation]
+    pinned = _pinned_backends().get(operation)
+    # Importing a candidate can take seconds (open3d), so only probe them all when needed
+    candidates = available_backends(operation, first_only=not (pinned or MESH_CALIBRATE))
+    choice = None
+    if pinned:
+        choice = next((c for c in candidates if c[0] == pinned), None)
+        if choice is None:
+            print(f"[mesh] warning: pinned {operation} backend '{pinned}' is not installed")
+    if choice is None and candidates:
+        choice = _calibrate(operation, candidates) if MESH_CALIBRATE and len(candidates) > 1 else candidates[0]
+    if choice is None:
+        print(f"[mesh] warning: no {operation} backend installed")
+    else:
+        print(f"[mesh] {operation} backend: {choice[0]}")
+    _selected[operation] = choice
+    return choice
+
+
+def backends_in_use() -> Dict[str, Optional[str]]:
+    return {operation: (select_backend(operation) or ('none',))[0] for operation in BACKENDS}
+
+
+# ----------------------------------------------------------------------------
+# Pipeline
+# ----------------------------------------------------------------------------
+
+def crop_to_mask(data: np.ndarray, level: float = 0.5):
+    """Bounding box of voxels above level plus one voxel of padding and its voxel offset; None when empty"""
+    mask = data > level
+    bounds = []
+    for axis in range(3):
+        other = tuple(a for a in range(3) if a != axis)
+        hits = np.flatnonzero(mask.any(axis=other))
+        if len(hits) == 0:
+            return None
+        bounds.append((max(hits[0] - 1, 0), min(hits[-1] + 2, data.shape[axis])))
+    return tuple(slice(lo, hi) for lo, hi in bounds), np.array([lo for lo, _ in bounds], dtype=np.float64)
+
+
+def marching_cubes(data: np.ndarray, spacing, level: float = 0.5) -> Optional[Mesh]:
     """
-    Reduce mesh complexity by removing triangles
-    Makes meshes lighter for web viewing
+    Isosurface of a mask, computed on its bounding box only (structures are
+    small next to the scan) and shifted back into volume coordinates
     """
-    try:
-        target_faces = max(100, int(len(mesh.faces) * target_percent))
-        if len(mesh.faces) > target_faces:
-            # Use trimesh simplification
-            simplified = mesh.simplify_quadric_decimation(target_faces)
-            print(f"[decimate_mesh] Reduced from {len(mesh.faces)} to {len(simplified.faces)} faces")
-            return simplified
+    if data.dtype == bool:
+        data = data.astype(np.uint8)
+    crop = crop_to_mask(data, level)
+    if crop is None:
+        return None
+    window, offset = crop
+    sub = data[window]
+    # marching cubes needs at least two voxels along every axis
+    if min(sub.shape) < 2:
+        sub, offset = data, np.zeros(3)
+    _, fn = select_backend('marching_cubes')
+    verts, faces = fn(sub, spacing, level)
+    if len(verts) == 0 or len(faces) == 0:
+        return None
+    return Mesh(verts + offset * np.asarray(spacing[:3], dtype=np.float64), faces)
+
+
+def cleanup_mesh(mesh: Mesh) -> Mesh:
+    _, fn = select_backend('cleanup')
+    return fn(mesh)
+
+
+def smooth_mesh(mesh: Mesh, iterations: int = MESH_SMOOTH_ITERATIONS, lamb: float = MESH_SMOOTH_LAMBDA) -> Mesh:
+    """Laplacian smoothing with volume preservation, removes the blocky voxel look"""
+    if iterations <= 0 or len(mesh) == 0:
+        return mesh
+    choice = select_backend('smooth')
+    if choice is None:
         return mesh
+    try:
+        return choice[1](mesh, lamb, iterations)
     except Exception as e:
-        print(f"[decimate_mesh] warning: {e}")
+        print(f"[smooth_mesh] warning: {choice[0]} failed: {e}")
         return mesh
 
 
-def clean_mesh(mesh: trimesh.Trimesh, smooth: bool = True, decimate: bool = True):
-    """Clean and optimize mesh using trimesh functions"""
-    try:
-        # Remove degenerate faces
-        mesh.remove_degenerate_faces()
-        # Remove duplicate faces
-        mesh.remove_duplicate_faces()
-        # Merge vertices that are very close
-        mesh.merge_vertices()
-        # Remove unreferenced vertices
-        mesh.remove_unreferenced_vertices()
-        
-        # Apply smoothing to remove blocky appearance
-        if smooth:
-            smooth_mesh(mesh, iterations=3)
-        
-        # Optionally reduce polygon count for web performance
-        if decimate and len(mesh.faces) > 5000:
-            mesh = decimate_mesh(mesh, target_percent=0.6)
-        
-        # Fix normals
-        mesh.fix_normals()
-        
+def decimate_mesh(mesh: Mesh, target_percent: float = 0.5) -> Mesh:
+    """Quadric decimation down to target_percent of the faces (at least MIN_DECIMATED_FACES)"""
+    target_faces = max(MIN_DECIMATED_FACES, int(len(mesh) * target_percent))
+    if len(mesh) <= target_faces:
         return mesh
+    choice = select_backend('decimate')
+    if choice is None:
+        return mesh
+    try:
+        simplified = cleanup_mesh(choice[1](mesh, target_faces))
     except Exception as e:
-        print(f"[clean_mesh] warning: {e}")
+        print(f"[decimate_mesh] warning: {choice[0]} failed: {e}")
         return mesh
+    print(f"[decimate_mesh] Reduced from {len(mesh)} to {len(simplified)} faces ({choice[0]})")
+    return simplified
+
 
+def orient_outward(mesh: Mesh) -> Mesh:
+    """Marching cubes winding is consistent, so one sign check orients the whole mesh"""
+    if signed_volume(mesh.vertices, mesh.faces) < 0:
+        return Mesh(mesh.vertices, mesh.faces[:, ::-1])
+    return mesh
 
-def mask_to_mesh(nii_path: Path, level: float = 0.5, smooth: bool = True) -> Optional[trimesh.Trimesh]:
+
+def clean_mesh(mesh: Mesh, smooth: bool = True, decimate: bool = True) -> Mesh:
+    """Cleanup, smoothing and decimation (MESH_* settings), with outward-facing triangles"""
+    mesh = cleanup_mesh(mesh)
+    if smooth:
+        mesh = smooth_mesh(mesh)
+    if decimate and len(mesh) > MESH_DECIMATE_MIN_FACES:
+        mesh = decimate_mesh(mesh, target_percent=MESH_DECIMATE_RATIO)
+    return orient_outward(mesh)
+
+
+def mask_array_to_mesh(data: np.ndarray, spacing, level: float = 0.5, smooth: bool = True,
+                       decimate: bool = True) -> Optional[Mesh]:
     """
-    Convert NIFTI mask to trimesh mesh using marching cubes
+    Convert an in-memory mask array to a mesh using marching cubes
     
     Args:
-        nii_path: Path to NIFTI file
+        data: Mask volume (bool or numeric)
+        spacing: Voxel spacing of the first three axes
         level: Isosurface level for marching cubes
         smooth: Apply smoothing to remove blocky appearance
+        decimate: Reduce the face count (MESH_DECIMATE_RATIO)
     """
+    # Vertices are in spacing-scaled voxel coordinates, which matches how the
+    # frontend displays the volume (array index * spacing)
+    mesh = marching_cubes(data, spacing, level=level)
+    if mesh is None:
+        return None
+    return clean_mesh(mesh, smooth=smooth, decimate=decimate)
+
+
+def mask_to_mesh(nii_path: Path, level: float = 0.5, smooth: bool = True, decimate: bool = True) -> Optional[Mesh]:
+    """Convert a NIFTI mask to a mesh (see mask_array_to_mesh)"""
     try:
         img = nib.load(str(nii_path))
         data = img.get_fdata()
-        if data.max() <= 0:
-            return None
         spacing = img.header.get_zooms()[:3]
-        verts, faces, normals, values = measure.marching_cubes(data, level=level, spacing=spacing)
-        if len(verts) == 0 or len(faces) == 0:
-            return None
-        
-        # Create trimesh object
-        mesh = trimesh.Trimesh(vertices=verts, faces=faces, process=False)
-        
-        # Clean and optimize mesh (with smoothing and decimation)
-        mesh = clean_mesh(mesh, smooth=smooth, decimate=True)
-        
-        return mesh
+        return mask_array_to_mesh(data, spacing, level=level, smooth=smooth, decimate=decimate)
     except Exception as e:
         print(f"[mask_to_mesh] error for {nii_path}: {e}")
         return None
 
 
-def export_obj_with_submeshes(meshes: List[trimesh.Trimesh], names: List[str], out_dir: Path) -> Tuple[Path, Path, Path]:
-    """Export meshes to OBJ + MTL + JSON with system grouping"""
+def export_obj_with_submeshes(meshes: List[Mesh], names: List[str], out_dir: Path, label_map: dict = None,
+                              center: bool = True) -> Tuple[Path, Path, Path]:
+    """Export meshes to OBJ + MTL + JSON with system grouping, optionally centered at origin"""
     out_dir.mkdir(parents=True, exist_ok=True)
     obj_path = out_dir / "Result.obj"
     mtl_name = "materials.mtl"
@@ -260,6 +637,13 @@ def export_obj_with_submeshes(meshes: List[trimesh.Trimesh], names: List[str], o
     json_path = out_dir / "Result.json"
 
     systems_data = {}
+    
+    # Global bounding box center, so the whole model is centered as one piece
+    global_center = np.zeros(3)
+    if center and meshes:
+        combined_verts = np.vstack([mesh.vertices for mesh in meshes])
+        global_center = (combined_verts.min(axis=0) + combined_verts.max(axis=0)) / 2.0
+        print(f"[export] Centering model: original center at {global_center}")
 
     with open(obj_path, 'w', encoding='utf-8') as f_obj:
         f_obj.write(f"mtllib {mtl_name}\n")
@@ -273,25 +657,23 @@ def export_obj_with_submeshes(meshes: List[trimesh.Trimesh], names: List[str], o
             f_obj.write(f"g {label}\n")
             f_obj.write(f"usemtl {label}\n")
 
-            # Write vertices
-            vs = mesh.vertices
-            for vx, vy, vz in vs:
-                f_obj.write(f"v {vx} {vy} {vz}\n")
-            
-            # Write faces
-            fs = mesh.faces
-            for tri in fs:
-                i1 = int(tri[0]) + 1 + v_offset
-                i2 = int(tri[1]) + 1 + v_offset
-                i3 = int(tri[2]) + 1 + v_offset
-                f_obj.write(f"f {i1} {i2} {i3}\n")
+            # Formatting Python floats/ints from tolist() is several times faster than
+            # per-row numpy iteration and produces the same text
+            vs = mesh.vertices - global_center
+            f_obj.write(''.join(f"v {vx} {vy} {vz}\n" for vx, vy, vz in vs.tolist()))
+            fs = mesh.faces + (1 + v_offset)
+            f_obj.write(''.join(f"f {i1} {i2} {i3}\n" for i1, i2, i3 in fs.tolist()))
             v_offset += vs.shape[0]
 
             color = get_color_for_subobject(real_name)
-            systems_data.setdefault(system_name, []).append({
+            entry = {
                 "object_name": real_name,
                 "color": list(color)
-            })
+            }
+            if label_map and real_name in label_map:
+                entry["label_id"] = label_map[real_name]
+                
+            systems_data.setdefault(system_name, []).append(entry)
 
     # Write MTL file
     with open(mtl_path, 'w', encoding='utf-8') as f_mtl:
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+S3 transfer helpers for the processing workers
+Concurrent multipart ranged downloads, parallel artifact uploads and
+SHA-256 / MD5 ETag verification, with per-transfer throughput reporting
+"""
+
+import os
+import time
+import hashlib
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+
+PART_SIZE_MB = int(os.environ.get('S3_PART_SIZE_MB', '16'))
+MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY', '16'))
+MAX_PARALLEL_FILES = int(os.environ.get('S3_MAX_PARALLEL_FILES', '5'))
+VERIFY_CHECKSUMS = os.environ.get('S3_VERIFY_CHECKSUMS', 'true').lower() == 'true'
+
+# Metadata key holding the hex SHA-256 of the whole object
+SHA256_METADATA_KEY = 'sha256'
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=PART_SIZE_MB * 1024 * 1024,
+    multipart_chunksize=PART_SIZE_MB * 1024 * 1024,
+    max_concurrency=MAX_CONCURRENCY,
+    use_threads=True,
+)
+
+# Every file transfer opens up to MAX_CONCURRENCY connections, so size the pool for all of them
+s3 = boto3.client('s3', config=Config(
+    max_pool_connections=MAX_CONCURRENCY * MAX_PARALLEL_FILES,
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+))
+
+
+class ChecksumMismatchError(Exception):
+    """Raised when a transferred file does not match its recorded checksum"""
+
+
+class _ByteCounter:
+    """boto3 transfer Callback summing bytes across threads and reporting the overall fraction"""
+
+    def __init__(self, total: int, on_progress: Callable[[float], None]):
+        self.total = max(total, 1)
+        self.done = 0
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+
+    def __call__(self, num_bytes: int):
+        with self._lock:
+            self.done += num_bytes
+            fraction = self.done / self.total
+        self.on_progress(fraction)
+
+
+def _hash_file(path: Path, algorithm: str, chunk_size: int = 8 * 1024 * 1024) -> str:
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sha256_file(path: Path) -> str:
+    """Streaming SHA-256 of a local file"""
+    return _hash_file(path, 'sha256')
+
+
+def etag_md5(head: Dict[str, Any]) -> Optional[str]:
+    """
+    The object's MD5 when its ETag is one: single-part uploads (e.g. browser
+    presigned PUTs) without SSE-KMS or SSE-C. None for multipart ETags ('<hex>-<parts>').
+    """
+    etag = head.get('ETag', '').strip('"')
+    if len(etag) != 32 or '-' in etag:
+        return None
+    if head.get('ServerSideEncryption', '').startswith('aws:kms') or head.get('SSECustomerAlgorithm'):
+        return None
+    return etag
+
+
+def _stats(direction: str, key: str, size: int, elapsed: float, sha256: Optional[str]) -> Dict[str, Any]:
+    mb = size / 1024 / 1024
+    mbps = mb / elapsed if elapsed > 0 else 0.0
+    print(f"[s3] {direction} {key}: {mb:.1f} MB in {elapsed:.2f}s ({mbps:.1f} MB/s)")
+    return {
+        'key': key,
+        'direction': direction,
+        'bytes': size,
+        'seconds': round(elapsed, 3),
+        'mbPerSec': round(mbps, 2),
+        'sha256': sha256,
+    }
+
+
+def download(bucket: str, key: str, dest: Path, verify: bool = VERIFY_CHECKSUMS,
+             on_progress: Optional[Callable[[float], None]] = None) -> Dict[str, Any]:
+    """
+    Download an object with concurrent ranged GETs.
+    The local file is checked against the object size and against the
+    object's sha256 metadata entry (set by upload()) or, lacking one, its MD5
+    ETag. Multipart objects without the metadata entry get the size check only.
+    on_progress(fraction) is called from the transfer threads as bytes arrive.
+    """
+    head = s3.head_object(Bucket=bucket, Key=key)
+    expected_size = head['ContentLength']
+    expected_sha = head.get('Metadata', {}).get(SHA256_METADATA_KEY)
+    expected_md5 = None if expected_sha else etag_md5(head)
+
+    start = time.time()
+    callback = _ByteCounter(expected_size, on_progress) if on_progress else None
+    s3.download_file(bucket, key, str(dest), Config=TRANSFER_CONFIG, Callback=callback)
+    elapsed = time.time() - start
+
+    size = Path(dest).stat().st_size
+    if size != expected_size:
+        raise ChecksumMismatchError(f"s3://{bucket}/{key}: expected {expected_size} bytes, got {size}")
+
+    sha = None
+    if verify and expected_sha:
+        sha = sha256_file(Path(dest))
+        if sha != expected_sha:
+            raise ChecksumMismatchError(f"s3://{bucket}/{key}: sha256 {sha} != {expected_sha}")
+    elif verify and expected_md5:
+        md5 = _hash_file(Path(dest), 'md5')
+        if md5 != expected_md5:
+            raise ChecksumMismatchError(f"s3://{bucket}/{key}: md5 {md5} != ETag {expected_md5}")
+
+    return _stats('download', key, size, elapsed, sha)
+
+
+def upload(local_path: Path, bucket: str, key: str, verify: bool = VERIFY_CHECKSUMS,
+           callback: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """
+    Upload a file with multipart concurrency.
+    S3 validates every part against a SHA-256 checksum and the whole-file
+    digest is stored as object metadata so later downloads can verify it.
+    """
+    local_path = Path(local_path)
+    extra_args = {}
+    content_type, _ = mimetypes.guess_type(local_path.name)
+    if content_type:
+        extra_args['ContentType'] = content_type
+
+    sha = None
+    if verify:
+        sha = sha256_file(local_path)
+        extra_args['Metadata'] = {SHA256_METADATA_KEY: sha}
+        extra_args['ChecksumAlgorithm'] = 'SHA256'
+
+    start = time.time()
+    s3.upload_file(str(local_path), bucket, key, ExtraArgs=extra_args, Config=TRANSFER_CONFIG, Callback=callback)
+    elapsed = time.time() - start
+
+    return _stats('upload', key, local_path.stat().st_size, elapsed, sha)
+
+
+def upload_many(items: List[Tuple[Path, str, str]], verify: bool = VERIFY_CHECKSUMS,
+                on_progress: Optional[Callable[[float], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Upload several files in parallel.
+    items: list of (local_path, bucket, key); results are returned in the same order.
+    on_progress(fraction) reports bytes sent across all files.
+    """
+    if not items:
+        return []
+
+    start = time.time()
+    callback = None
+    if on_progress:
+        callback = _ByteCounter(sum(Path(path).stat().st_size for path, _, _ in items), on_progress)
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_FILES, len(items))) as pool:
+        futures = [pool.submit(upload, path, bucket, key, verify, callback) for path, bucket, key in items]
+        results = [f.result() for f in futures]
+    elapsed = time.time() - start
+
+    total = sum(r['bytes'] for r in results)
+    print(f"[s3] Uploaded {len(results)} files, {total / 1024 / 1024:.1f} MB in {elapsed:.2f}s "
+          f"({total / 1024 / 1024 / elapsed if elapsed > 0 else 0:.1f} MB/s aggregate)")
+    return results
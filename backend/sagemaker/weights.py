@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+TotalSegmentator model weights: build-time prefetch and startup verification
+Weights are baked into the image (or placed on a mounted cache pointed to by
+TOTALSEG_HOME_DIR) together with a manifest of every file; workers check the
+weights against the manifest at startup and refuse to run on a mismatch
+instead of silently re-downloading gigabytes on the first job.
+
+    python3 weights.py prefetch --tasks total,total_fast --optional teeth
+    python3 weights.py verify
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+
+# Same lookup order as TotalSegmentator itself
+HOME_DIR = Path(os.environ.get('TOTALSEG_HOME_DIR', str(Path.home() / '.totalsegmentator')))
+WEIGHTS_DIR = Path(os.environ.get('TOTALSEG_WEIGHTS_PATH', str(HOME_DIR / 'nnunet' / 'results')))
+MANIFEST_PATH = Path(os.environ.get('WEIGHTS_MANIFEST', str(HOME_DIR / 'weights_manifest.json')))
+# size: stat every file (milliseconds), sha256: hash every file (seconds per GB), off: skip
+VERIFY_MODE = os.environ.get('WEIGHTS_VERIFY', 'size').lower()
+# Refuse to start without a manifest (set in images that are expected to carry baked weights)
+REQUIRED = os.environ.get('WEIGHTS_REQUIRED', 'false').lower() == 'true'
+
+
+class WeightsError(Exception):
+    """Raised when baked weights are missing or do not match the manifest"""
+
+
+def _sha256(path: Path, chunk_size: int = 8 * 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(weights_dir: Path = WEIGHTS_DIR, tasks: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Describe every file under weights_dir by size and SHA-256"""
+    files = {}
+    for path in sorted(p for p in weights_dir.rglob('*') if p.is_file()):
+        files[str(path.relative_to(weights_dir))] = {
+            'bytes': path.stat().st_size,
+            'sha256': _sha256(path),
+        }
+    return {
+        'createdAt': int(time.time()),
+        'tasks': tasks or [],
+        'totalBytes': sum(f['bytes'] for f in files.values()),
+        'files': files,
+    }
+
+
+def prefetch(tasks: List[str], optional: Optional[List[str]] = None,
+             weights_dir: Path = WEIGHTS_DIR, manifest_path: Path = MANIFEST_PATH) -> Dict[str, Any]:
+    """
+    Download weights for the given tasks and write the manifest.
+    A failure on a required task aborts; optional tasks (e.g. licensed ones)
+    are skipped and will download on first use as before.
+    """
+    fetched = []
+    for task in tasks + (optional or []):
+        print(f"[weights] Downloading weights for '{task}'")
+        result = subprocess.run(['totalseg_download_weights', '-t', task], capture_output=True, text=True)
+        if result.returncode != 0:
+            if task in (optional or []):
+                print(f"[weights] Skipping optional task '{task}': {result.stderr.strip()[-500:]}")
+                continue
+            raise WeightsError(f"Weight download for '{task}' failed: {result.stderr.strip()[-500:]}")
+        fetched.append(task)
+
+    manifest = build_manifest(weights_dir, fetched)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    print(f"[weights] Manifest written to {manifest_path}: {len(manifest['files'])} files, "
+          f"{manifest['totalBytes'] / 1024 / 1024:.0f} MB for {fetched}")
+    return manifest
+
+
+def verify(weights_dir: Path = WEIGHTS_DIR, manifest_path: Path = MANIFEST_PATH,
+           mode: str = VERIFY_MODE, required: bool = REQUIRED) -> Dict[str, Any]:
+    """
+    Check the weights on disk against the manifest.
+    Returns a summary; raises WeightsError on any missing or mismatched file.
+    """
+    start = time.time()
+    if mode == 'off':
+        return {'verified': False, 'mode': mode}
+    if not manifest_path.exists():
+        if required:
+            raise WeightsError(f"Weights manifest {manifest_path} not found (WEIGHTS_REQUIRED=true)")
+        print(f"[weights] No manifest at {manifest_path}, weights will download on first use")
+        return {'verified': False, 'mode': mode, 'reason': 'no manifest'}
+
+    manifest = json.loads(manifest_path.read_text())
+    problems = []
+    for rel_path, expected in manifest['files'].items():
+        path = weights_dir / rel_path
+        if not path.is_file():
+            problems.append(f"missing {rel_path}")
+        elif path.stat().st_size != expected['bytes']:
+            problems.append(f"size mismatch {rel_path}: {path.stat().st_size} != {expected['bytes']}")
+        elif mode == 'sha256' and _sha256(path) != expected['sha256']:
+            problems.append(f"sha256 mismatch {rel_path}")
+
+    if problems:
+        shown = '; '.join(problems[:5]) + (f" (+{len(problems) - 5} more)" if len(problems) > 5 else '')
+        raise WeightsError(f"Model weights in {weights_dir} do not match manifest: {shown}")
+
+    elapsed = time.time() - start
+    print(f"[weights] Verified {len(manifest['files'])} files ({manifest['totalBytes'] / 1024 / 1024:.0f} MB, "
+          f"tasks {manifest['tasks']}) by {mode} in {elapsed:.2f}s")
+    return {
+        'verified': True,
+        'mode': mode,
+        'tasks': manifest['tasks'],
+        'files': len(manifest['files']),
+        'elapsedSec': round(elapsed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prefetch or verify TotalSegmentator weights')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_prefetch = sub.add_parser('prefetch')
+    p_prefetch.add_argument('--tasks', default='total,total_fast', help='comma-separated required tasks')
+    p_prefetch.add_argument('--optional', default='', help='comma-separated tasks to skip on failure')
+    p_verify = sub.add_parser('verify')
+    p_verify.add_argument('--mode', default='sha256', choices=['size', 'sha256'])
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'prefetch':
+            prefetch([t for t in args.tasks.split(',') if t], [t for t in args.optional.split(',') if t])
+        else:
+            verify(mode=args.mode, required=True)
+    except WeightsError as e:
+        print(f"[weights] ERROR: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
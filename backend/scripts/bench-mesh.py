@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of mesh_processing.py over the bundled job fixtures
+(jobs/*/segmentations) and synthetic spheres and tubes.
+
+Every structure goes through the pipeline stages:
+  load      nibabel read of the mask
+  marching  marching cubes on the mask's bounding box
+  cleanup   vertex merge, degenerate/duplicate face removal
+  smooth    each installed smoothing backend
+  decimate  each installed decimation backend (on the selected backend's smoothed mesh)
+  export    OBJ/MTL/JSON for that structure
+
+Records are keyed by backend ('impl'), structure and stage and keep wall/CPU
+time and peak RSS (batch/telemetry.py), plus the triangle count and output
+bytes. Results are written as JSON and two runs can be compared; the
+comparison exits 1 when a regression is found.
+
+    python3 scripts/bench-mesh.py run --limit 10 --sizes 64,128
+    python3 scripts/bench-mesh.py run --save baseline
+    python3 scripts/bench-mesh.py compare scripts/bench-baselines/baseline.json scripts/bench-baselines/latest.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import platform
+import tempfile
+import importlib.util
+from contextlib import redirect_stdout, nullcontext
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BASELINES_DIR = Path(__file__).resolve().parent / 'bench-baselines'
+DEFAULT_SIZES = '64,128,192'
+# Differences below these are noise whatever the relative change
+MIN_ABS_DELTA = {'wallSec': 0.05, 'cpuSec': 0.05, 'peakRssMB': 16.0, 'triangles': 0, 'bytes': 0}
+COMPARED_FIELDS = ('wallSec', 'peakRssMB', 'triangles', 'bytes')
+
+os.environ.setdefault('EMIT_EMF', 'false')
+
+
+def load_module(name: str, path: Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_mesh_module():
+    return load_module('bench_mesh_processing', BACKEND_DIR / 'mesh_processing.py')
+
+
+# ----------------------------------------------------------------------------
+# Cases
+# ----------------------------------------------------------------------------
+
+def fixture_cases(jobs: Optional[int], match: Optional[str], limit: Optional[int]) -> List[Dict[str, Any]]:
+    """Masks under jobs/*/segmentations; identical files across jobs are benchmarked once"""
+    seen = set()
+    cases = []
+    job_dirs = sorted(p for p in (BACKEND_DIR / 'jobs').glob('*') if (p / 'segmentations').is_dir())
+    for job_dir in job_dirs[:jobs] if jobs else job_dirs:
+        for nii in sorted((job_dir / 'segmentations').glob('*.nii.gz')):
+            name = nii.name[:-len('.nii.gz')]
+            if match and match not in name:
+                continue
+            digest = hashlib.md5(nii.read_bytes()).hexdigest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            cases.append({'case': name, 'source': str(nii.relative_to(BACKEND_DIR)), 'path': nii})
+            if limit and len(cases) >= limit:
+                return cases
+    return cases
+
+
+def sphere(n: int) -> np.ndarray:
+    grid = np.indices((n, n, n), dtype=np.float32) - (n - 1) / 2
+    return (np.sqrt((grid ** 2).sum(axis=0)) < n * 0.4).astype(np.uint8)
+
+
+def tube(n: int) -> np.ndarray:
+    """Hollow tube along the first axis, half-way between a vessel and an airway"""
+    yz = np.indices((n, n), dtype=np.float32) - (n - 1) / 2
+    r = np.sqrt((yz ** 2).sum(axis=0))
+    ring = ((r < n * 0.25) & (r > n * 0.15)).astype(np.uint8)
+    volume = np.zeros((n, n, n), dtype=np.uint8)
+    volume[n // 8:n - n // 8] = ring
+    return volume
+
+
+def synthetic_cases(sizes: List[int]) -> List[Dict[str, Any]]:
+    cases = []
+    for n in sizes:
+        cases.append({'case': f'sphere_{n}', 'source': 'synthetic', 'make': lambda n=n: sphere(n)})
+        cases.append({'case': f'tube_{n}', 'source': 'synthetic', 'make': lambda n=n: tube(n)})
+    return cases
+
+
+# ----------------------------------------------------------------------------
+# Run
+# ----------------------------------------------------------------------------
+
+def dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.iterdir() if p.is_file())
+
+
+def note_warnings(record: Dict[str, Any], output: str):
+    """mesh_processing swallows backend errors and logs a warning, which would
+    otherwise look like a very fast stage"""
+    warnings = sorted({line for line in output.splitlines() if 'warning' in line.lower()})
+    if warnings:
+        record['warnings'] = warnings
+
+
+def run_case(case: Dict[str, Any], mp, operations: Dict[str, List[Any]], telemetry, scratch: Path,
+             quiet: bool) -> List[Dict[str, Any]]:
+    name = case['case']
+    records = []
+
+    def measured(impl_name: str, stage: str, fn):
+        log = io.StringIO()
+        with redirect_stdout(log) if quiet else nullcontext():
+            with telemetry.stage(stage, structure=name):
+                result = fn()
+        record = dict(telemetry.stages[-1], impl=impl_name, case=name)
+        if isinstance(result, mp.Mesh):
+            record['triangles'] = len(result)
+        note_warnings(record, log.getvalue())
+        records.append(record)
+        return result, record
+
+    def load():
+        if 'make' in case:
+            return case['make'](), (1.0, 1.0, 1.0)
+        import nibabel as nib
+        img = nib.load(str(case['path']))
+        return img.get_fdata(), img.header.get_zooms()[:3]
+
+    (data, spacing), _ = measured('nibabel', 'load', load)
+    mesh, _ = measured(mp.select_backend('marching_cubes')[0], 'marching', lambda: mp.marching_cubes(data, spacing))
+    del data
+    if mesh is None:
+        print(f"[bench] {name}: empty mask, skipped")
+        return records
+    mesh, _ = measured(mp.select_backend('cleanup')[0], 'cleanup', lambda: mp.cleanup_mesh(mesh))
+
+    smoothed = {}
+    for backend, fn in operations['smooth']:
+        try:
+            smoothed[backend], _ = measured(backend, 'smooth',
+                                            lambda: fn(mesh, mp.MESH_SMOOTH_LAMBDA, mp.MESH_SMOOTH_ITERATIONS))
+        except Exception as e:
+            print(f"[bench] smooth={backend} failed on {name}: {e}")
+            records.append({'impl': backend, 'case': name, 'stage': 'smooth', 'failed': True, 'error': str(e)})
+    selected = mp.select_backend('smooth')
+    mesh = smoothed.get(selected[0], mesh) if selected else mesh
+
+    final = mesh
+    target = max(mp.MIN_DECIMATED_FACES, int(len(mesh) * mp.MESH_DECIMATE_RATIO))
+    selected = (mp.select_backend('decimate') or ('none',))[0]
+    for backend, fn in operations['decimate'] if len(mesh) > mp.MESH_DECIMATE_MIN_FACES else []:
+        try:
+            decimated, _ = measured(backend, 'decimate', lambda: mp.cleanup_mesh(fn(mesh, target)))
+        except Exception as e:
+            print(f"[bench] decimate={backend} failed on {name}: {e}")
+            records.append({'impl': backend, 'case': name, 'stage': 'decimate', 'failed': True, 'error': str(e)})
+            continue
+        if backend == selected:
+            final = decimated
+
+    out_dir = scratch / name
+    final = mp.orient_outward(final)
+    _, record = measured('numpy', 'export', lambda: mp.export_obj_with_submeshes([final], [name], out_dir))
+    record['triangles'] = len(final)
+    record['bytes'] = dir_bytes(out_dir)
+    for p in out_dir.iterdir():
+        p.unlink()
+    return records
+
+
+def totals(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Sums per implementation and stage"""
+    out: Dict[str, Dict[str, Any]] = {}
+    for r in records:
+        if r.get('failed'):
+            continue
+        entry = out.setdefault(f"{r['impl']}/{r['stage']}", {'wallSec': 0.0, 'peakRssMB': 0.0, 'triangles': 0, 'bytes': 0, 'count': 0})
+        entry['wallSec'] = round(entry['wallSec'] + r['wallSec'], 3)
+        entry['peakRssMB'] = max(entry['peakRssMB'], r['peakRssMB'])
+        entry['triangles'] += r.get('triangles', 0)
+        entry['bytes'] += r.get('bytes', 0)
+        entry['count'] += 1
+    return out
+
+
+def print_totals(summary: Dict[str, Dict[str, Any]]):
+    print(f"{'impl/stage':<30}{'cases':>7}{'wall s':>10}{'peak MB':>10}{'triangles':>12}{'MB out':>9}")
+    for key, t in sorted(summary.items()):
+        print(f"{key:<30}{t['count']:>7}{t['wallSec']:>10.2f}{t['peakRssMB']:>10.0f}{t['triangles']:>12}{t['bytes'] / 1024 / 1024:>9.1f}")
+
+
+def cmd_run(args) -> int:
+    telemetry = load_module('bench_telemetry', BACKEND_DIR / 'batch' / 'telemetry.py').StageTelemetry('bench-mesh')
+    mp = load_mesh_module()
+    wanted = {n.strip() for n in args.backends.split(',') if n.strip()} if args.backends else None
+    operations = {
+        op: [(n, fn) for n, fn in mp.available_backends(op) if wanted is None or n in wanted]
+        for op in ('smooth', 'decimate')
+    }
+    print("[bench] Backends: " + ', '.join(f"{op}={[n for n, _ in found]}" for op, found in operations.items()))
+
+    cases = []
+    if not args.no_fixtures:
+        cases += fixture_cases(args.jobs, args.match, args.limit)
+    if not args.no_synthetic:
+        cases += synthetic_cases([int(s) for s in args.sizes.split(',') if s.strip()])
+    print(f"[bench] {len(cases)} cases")
+
+    records = []
+    with tempfile.TemporaryDirectory(prefix='bench-mesh-') as scratch:
+        for i, case in enumerate(cases, 1):
+            started = time.perf_counter()
+            records += run_case(case, mp, operations, telemetry, Path(scratch), quiet=not args.verbose)
+            print(f"[bench] {i}/{len(cases)} {case['case']} ({time.perf_counter() - started:.2f}s)")
+
+    warned = sorted({w for r in records for w in r.get('warnings', [])})
+    for w in warned:
+        print(f"[bench] Warning logged by mesh_processing (stage result may be partial): {w}")
+
+    summary = totals(records)
+    result = {
+        'createdAt': int(time.time()),
+        'host': socket.gethostname(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'backends': {op: [n for n, _ in found] for op, found in operations.items()},
+        'totals': summary,
+        'records': records,
+    }
+    out = Path(args.out) if args.out else BASELINES_DIR / f'{args.save or "latest"}.json'
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2))
+    print_totals(summary)
+    print(f"[bench] Wrote {len(records)} records to {out}")
+    return 0
+
+
+# ----------------------------------------------------------------------------
+# Compare
+# ----------------------------------------------------------------------------
+
+def index(records: List[Dict[str, Any]]) -> Dict[tuple, Dict[str, Any]]:
+    return {(r['impl'], r['case'], r['stage']): r for r in records}
+
+
+def regressions(base: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Fields that grew by more than threshold (relative) and the noise floor (absolute)"""
+    found = []
+    old, new = index(base['records']), index(current['records'])
+    for key, r in sorted(new.items()):
+        b = old.get(key)
+        if b is None or b.get('failed'):
+            continue
+        label = '/'.join(key)
+        if r.get('failed'):
+            found.append(f"{label}: failed ({r.get('error')})")
+            continue
+        for field in COMPARED_FIELDS:
+            if field not in b or field not in r:
+                continue
+            before, after = b[field], r[field]
+            grew = after - before > MIN_ABS_DELTA[field] and after > before * (1 + threshold)
+            # A different triangle count or output size is a behaviour change either way
+            changed = field in ('triangles', 'bytes') and abs(after - before) > before * threshold
+            if grew or changed:
+                found.append(f"{label}: {field} {before} -> {after}")
+    missing = sorted(set(old) - set(new))
+    if missing:
+        print(f"[bench] {len(missing)} baseline records not in this run (filtered run?)")
+    return found
+
+
+def cmd_compare(args) -> int:
+    base = json.loads(Path(args.baseline).read_text())
+    current = json.loads(Path(args.current).read_text())
+    if base.get('host') != current.get('host'):
+        print(f"[bench] Warning: runs come from different hosts ({base.get('host')} vs {current.get('host')})")
+
+    base_totals, cur_totals = base.get('totals', {}), current.get('totals', {})
+    print(f"{'impl/stage':<30}{'wall before':>12}{'wall after':>12}{'change':>9}")
+    for key in sorted(set(base_totals) & set(cur_totals)):
+        before, after = base_totals[key]['wallSec'], cur_totals[key]['wallSec']
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{key:<30}{before:>12.2f}{after:>12.2f}{change:>8.1f}%")
+
+    found = regressions(base, current, args.threshold)
+    for line in found:
+        print(f"REGRESSION {line}")
+    print(f"{'FAILED' if found else 'passed'}: {len(found)} regression(s) at threshold {args.threshold:.0%}")
+    return 1 if found else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Mesh pipeline micro-benchmark')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='benchmark and write a JSON result')
+    run.add_argument('--backends', help='only these smoothing/decimation backends (comma-separated)')
+    run.add_argument('--jobs', type=int, help='only the first N job fixtures')
+    run.add_argument('--match', help='only structures whose name contains this')
+    run.add_argument('--limit', type=int, help='at most N fixture structures')
+    run.add_argument('--sizes', default=DEFAULT_SIZES, help='synthetic grid sizes')
+    run.add_argument('--no-fixtures', action='store_true')
+    run.add_argument('--no-synthetic', action='store_true')
+    run.add_argument('--save', help='baseline name under scripts/bench-baselines (default: latest)')
+    run.add_argument('--out', help='explicit output path')
+    run.add_argument('--verbose', action='store_true', help='keep the implementations\' own logging')
+
+    compare = sub.add_parser('compare', help='flag regressions between two results')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.2, help='relative growth flagged (default 0.2)')
+
+    args = parser.parse_args()
+    return cmd_run(args) if args.command == 'run' else cmd_compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
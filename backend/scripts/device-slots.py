@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Exercise device_slots.py with fake GPUs on any machine (no CUDA needed).
+
+Concurrent jobs ask for cpu / gpu / gpu:X / auto slots; the script checks that
+no slot is handed out twice, that jobs queue when their slots are busy, and
+that TotalSegmentatorRunner (subprocess backend, with a stand-in executable)
+passes the device only through the child's environment.
+
+    python3 scripts/device-slots.py
+    python3 scripts/device-slots.py --gpus 0,1 --cpu-slots 2 --jobs 40
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import contextlib
+import tempfile
+import threading
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Prints what the child sees instead of segmenting
+FAKE_CLI = """#!/usr/bin/env python3
+import os, sys
+print('CUDA_VISIBLE_DEVICES=' + os.environ.get('CUDA_VISIBLE_DEVICES', '<unset>'))
+print('ARGS=' + ' '.join(sys.argv[1:]))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description='device slot scheduler checks with fake devices')
+    parser.add_argument('--gpus', default='0,1', help="fake GPU indices (default '0,1')")
+    parser.add_argument('--cpu-slots', type=int, default=2)
+    parser.add_argument('--jobs', type=int, default=24)
+    args = parser.parse_args()
+
+    from device_slots import DeviceScheduler, DeviceUnavailable
+    from totalseg_runner import TotalSegmentatorRunner
+
+    problems = []
+
+    def expect(label, ok, detail=''):
+        if not ok:
+            problems.append(label)
+        print(f"{'ok  ' if ok else 'FAIL'} {label}{f': {detail}' if detail else ''}")
+
+    gpus = [int(i) for i in args.gpus.split(',') if i.strip()]
+    scheduler = DeviceScheduler(gpus=gpus, cpu_slots=args.cpu_slots)
+
+    # Requests resolve to the right slots
+    names = lambda req: [s.name for s in scheduler.candidates(req)]
+    expect('cpu -> cpu slots', all(n.startswith('cpu') for n in names('cpu')), str(names('cpu')))
+    expect('auto prefers gpus', names('auto')[:len(gpus)] == [f'gpu:{i}' for i in gpus], str(names('auto')))
+    for request in ('gpu:99', 'tpu'):
+        try:
+            scheduler.candidates(request)
+            expect(f'{request} rejected', False)
+        except DeviceUnavailable as e:
+            expect(f'{request} rejected', True, str(e))
+    cpu_only = DeviceScheduler(gpus=[], cpu_slots=1)
+    expect('gpu falls back to cpu without gpus', [s.name for s in cpu_only.candidates('gpu')] == ['cpu:0'])
+
+    # Concurrent jobs never share a slot
+    holders = {}
+    lock = threading.Lock()
+    double_booked = []
+    served = []
+    requests = ['cpu', 'gpu', 'auto'] + [f'gpu:{i}' for i in gpus]
+    rng = random.Random(0)
+
+    def job(n):
+        request = rng.choice(requests)
+        slot = scheduler.acquire(request, f'job-{n}')
+        with lock:
+            if slot.name in holders:
+                double_booked.append(slot.name)
+            holders[slot.name] = n
+            served.append((request, slot.name))
+        time.sleep(rng.uniform(0.01, 0.05))
+        with lock:
+            holders.pop(slot.name, None)
+        scheduler.release(slot)
+
+    threads = [threading.Thread(target=job, args=(n,)) for n in range(args.jobs)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = scheduler.stats()
+    expect('no slot double-booked', not double_booked, f'{len(served)} jobs')
+    expect('requests served by matching slots', all(
+        slot.startswith('cpu') if req == 'cpu' else
+        slot == req if req.startswith('gpu:') else
+        slot.startswith('gpu') if req == 'gpu' and gpus else True
+        for req, slot in served))
+    expect('jobs counted', sum(s['jobs'] for s in stats['slots']) == args.jobs,
+           ', '.join(f"{s['slot']}={s['jobs']}" for s in stats['slots']))
+    expect('all released', stats['waiting'] == 0 and all(s['jobId'] is None for s in stats['slots']),
+           f"avg wait {stats['avgWaitSec']}s")
+
+    # A waiter times out while the only slot is held
+    slot = cpu_only.acquire('cpu', 'holder')
+    try:
+        cpu_only.acquire('cpu', 'late', timeout=0.2)
+        expect('busy slot times out', False)
+    except DeviceUnavailable:
+        expect('busy slot times out', True)
+    cpu_only.release(slot)
+
+    # The device reaches the child environment only
+    before = os.environ.get('CUDA_VISIBLE_DEVICES')
+    with tempfile.TemporaryDirectory() as tmp:
+        cli = Path(tmp) / 'TotalSegmentator'
+        cli.write_text(FAKE_CLI)
+        cli.chmod(0o755)
+        runner = TotalSegmentatorRunner(backend='subprocess', executable=str(cli))
+        for device, expected in [('cpu', ''), (f'gpu:{gpus[-1]}' if gpus else 'cpu', str(gpus[-1]) if gpus else '')]:
+            out = io.StringIO()
+            # The runner logs the child's output line by line
+            with contextlib.redirect_stdout(out):
+                runner.run(Path(tmp) / 'in.nii.gz', Path(tmp), device=device)
+            seen = out.getvalue().splitlines()
+            env_line = next((l for l in seen if 'CUDA_VISIBLE_DEVICES=' in l), '')
+            args_line = next((l for l in seen if 'ARGS=' in l), '')
+            expect(f'{device} child env', env_line.endswith(f'CUDA_VISIBLE_DEVICES={expected}'), env_line)
+            expect(f'{device} child args', ('-d gpu' in args_line) == device.startswith('gpu')
+                   and 'gpu:' not in args_line, args_line)
+    expect('server environment untouched', os.environ.get('CUDA_VISIBLE_DEVICES') == before)
+
+    print(f"{'FAILED' if problems else 'passed'}: {len(problems)} problem(s)")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Check the job retention policy (job_retention.py) on synthetic job
+directories, or show what a sweep would evict from a real jobs/ folder.
+
+  ttl       idle finished jobs lose the upload and masks, then everything
+  pressure  above the high-water mark intermediates go first, LRU first,
+            then whole jobs, down to the low-water mark
+  safety    running jobs and folders without status.json are never touched
+
+    python3 scripts/job-retention.py
+    python3 scripts/job-retention.py --plan jobs --max-gb 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+MB = 1024 * 1024
+HOUR = 3600
+
+
+class StatusQueue:
+    """Stands in for JobQueue: statuses from status.json, a set of running jobs"""
+
+    def __init__(self, jobs_dir: Path, running=()):
+        self.jobs_dir = jobs_dir
+        self.running = set(running)
+        self.forgotten = []
+
+    def get(self, job_id):
+        path = self.jobs_dir / job_id / 'status.json'
+        return json.loads(path.read_text()) if path.is_file() else None
+
+    def is_active(self, job_id):
+        return job_id in self.running
+
+    def forget(self, job_id):
+        self.forgotten.append(job_id)
+
+
+def make_job(jobs_dir: Path, job_id: str, status: str, idle_hours: float, masks_mb: int = 4, upload_mb: int = 2,
+             with_status: bool = True):
+    job_dir = jobs_dir / job_id
+    (job_dir / 'segmentations').mkdir(parents=True)
+    for i in range(4):
+        (job_dir / 'segmentations' / f'organ_{i}.nii.gz').write_bytes(b'\0' * (masks_mb * MB // 4))
+    (job_dir / 'ct.nii.gz').write_bytes(b'\0' * (upload_mb * MB))
+    if status == 'completed':
+        for name in ('Result.obj', 'materials.mtl', 'Result.json', 'result.zip', 'Result.obj.gz'):
+            (job_dir / name).write_bytes(b'\0' * MB)
+    if with_status:
+        path = job_dir / 'status.json'
+        path.write_text(json.dumps({'jobId': job_id, 'status': status}))
+        stamp = time.time() - idle_hours * HOUR
+        os.utime(path, (stamp, stamp))
+
+
+def contents(job_dir: Path):
+    return sorted(p.name for p in job_dir.iterdir()) if job_dir.exists() else None
+
+
+def check():
+    from job_retention import JobRetention
+
+    problems = []
+
+    def expect(label, ok, detail=''):
+        if not ok:
+            problems.append(label)
+        print(f"{'ok  ' if ok else 'FAIL'} {label}{f': {detail}' if detail else ''}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = Path(tmp)
+        make_job(jobs, 'fresh', 'completed', 1)
+        make_job(jobs, 'idle', 'completed', 30)
+        make_job(jobs, 'stale', 'completed', 200)
+        make_job(jobs, 'failed', 'failed', 30)
+        make_job(jobs, 'running', 'processing', 500)
+        make_job(jobs, 'orphan', 'processing', 30)  # left 'processing' by a previous server run
+        make_job(jobs, 'uploading', 'queued', 500, with_status=False)
+        queue = StatusQueue(jobs, running={'running'})
+        retention = JobRetention(jobs, queue, max_bytes=1000 * MB, min_free_bytes=0,
+                                 job_ttl_sec=168 * HOUR, intermediate_ttl_sec=24 * HOUR)
+        retention.sweep()
+
+        finals = ['Result.json', 'Result.obj', 'Result.obj.gz', 'materials.mtl', 'result.zip', 'status.json']
+        expect('ttl: fresh job untouched', 'segmentations' in contents(jobs / 'fresh'))
+        expect('ttl: idle job keeps only final artifacts', contents(jobs / 'idle') == finals, str(contents(jobs / 'idle')))
+        expect('ttl: stale job removed', contents(jobs / 'stale') is None)
+        expect('ttl: failed job removed', contents(jobs / 'failed') is None)
+        expect('ttl: orphaned job removed', contents(jobs / 'orphan') is None)
+        expect('safety: running job untouched', 'segmentations' in contents(jobs / 'running'))
+        expect('safety: upload without status.json untouched', contents(jobs / 'uploading') is not None)
+        expect('removed jobs forgotten by the queue', sorted(queue.forgotten) == ['failed', 'orphan', 'stale'],
+               str(queue.forgotten))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = Path(tmp)
+        # 11 MB each (6 intermediate, 5 final), least recently used first
+        for i, idle in enumerate([10, 8, 6, 4, 2]):
+            make_job(jobs, f'job{i}', 'completed', idle)
+        make_job(jobs, 'running', 'processing', 20, masks_mb=20)
+        queue = StatusQueue(jobs, running={'running'})
+        # 77 MB used; high water 50 MB, low water 40 MB -> 37 MB to free
+        retention = JobRetention(jobs, queue, max_bytes=50 * MB, low_water=0.8, min_free_bytes=0,
+                                 job_ttl_sec=168 * HOUR, intermediate_ttl_sec=24 * HOUR)
+        retention.touch('job0')  # just downloaded: now the most recently used
+        actions = retention.sweep()
+        order = [(a, j) for a, j, _, _ in actions]
+        expect('pressure: intermediates first, LRU order',
+               order[:5] == [('intermediate', 'job1'), ('intermediate', 'job2'), ('intermediate', 'job3'),
+                             ('intermediate', 'job4'), ('intermediate', 'job0')], str(order))
+        expect('pressure: then whole jobs, LRU order', order[5:] == [('job', 'job1'), ('job', 'job2')], str(order[5:]))
+        expect('pressure: running job untouched', 'segmentations' in contents(jobs / 'running'))
+        used = sum(p.stat().st_size for p in jobs.rglob('*') if p.is_file())
+        expect('pressure: down to the low-water mark', used <= 40 * MB, f'{used / MB:.1f} MB left')
+
+    print(f"{'FAILED' if problems else 'passed'}: {len(problems)} problem(s)")
+    return 1 if problems else 0
+
+
+def plan(jobs_dir: Path, max_gb: float):
+    from job_retention import JobRetention, GB
+    retention = JobRetention(jobs_dir, StatusQueue(jobs_dir), max_bytes=max_gb * GB)
+    entries = retention.scan()
+    print(f"{len(entries)} managed job(s), {sum(e.bytes for e in entries) / 1e6:.1f} MB")
+    retention.sweep(dry_run=True)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='job retention policy checks')
+    parser.add_argument('--plan', type=Path, help='show what a sweep would evict from this jobs folder (nothing is deleted)')
+    parser.add_argument('--max-gb', type=float, default=20.0, help='high-water mark for --plan (default 20)')
+    args = parser.parse_args()
+    return plan(args.plan, args.max_gb) if args.plan else check()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
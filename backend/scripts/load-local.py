@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the AWS flow on one machine, without an AWS account.
+
+The real handlers (lambdas/upload, process, get-job-status, my-images,
+batch-events) and the real Batch worker (batch/batch_processor.py) run against
+the stand-ins in scripts/local_aws.py: S3 is a directory, DynamoDB a SQLite
+file, Batch a pool of worker processes that emits state-change events to
+batch-events. TotalSegmentator is replaced by a replay of the masks of a
+finished job in jobs/, so preflight, meshing, export and upload all run for
+real. Each simulated user uploads, processes and polls until the job is
+done, then lists their studies and opens the artifacts.
+
+    python3 scripts/load-local.py --users 4 --jobs-per-user 2
+    python3 scripts/load-local.py --users 20 --compute 4 --cold-start-sec 5 --segment-sec 30
+    python3 scripts/load-local.py --users 12 --pack-mb 50 --out load.json
+
+Reports p50/p99/max latency per call and per job, queue wait and processing
+time from the job records, and completed jobs per hour. Handler and worker
+output goes to <work-dir>/lambdas.log and <work-dir>/batch.log.
+"""
+
+import io
+import os
+import sys
+import json
+import gzip
+import time
+import uuid
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+import importlib.util
+from pathlib import Path
+from urllib.parse import urlparse
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR / 'scripts'))
+sys.path.insert(0, str(BACKEND_DIR / 'layers' / 'dependencies'))
+
+from local_aws import LocalDynamoDB, LocalS3, LocalBatch, batch_worker_init, run_batch_job
+
+BUCKET = 'iris-oculus-data'
+TABLE = 'iris-oculus-metadata'
+INDEX_TABLE = 'iris-oculus-results-index'
+# Key schema and GSIs as in template.yaml
+SCHEMAS = {
+    TABLE: {'key': ['jobId'], 'indexes': {'userId-createdAt-index': ('userId', 'createdAt'),
+                                          'packState-queuedAt-index': ('packState', 'queuedAt')}},
+    INDEX_TABLE: {'key': ['dedupKey'], 'indexes': {}},
+}
+LAMBDAS = ['upload', 'process', 'get-job-status', 'my-images', 'batch-events']
+
+
+def load_handler(name: str):
+    # Module-level boto3 clients are created at import and replaced below; no AWS call is made
+    path = BACKEND_DIR / 'lambdas' / name / 'handler.py'
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_') + '_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class Recorder:
+    """Latencies per operation and per-job outcomes, shared by the user threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.jobs = []
+
+    @contextlib.contextmanager
+    def timed(self, op):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            with self.lock:
+                self.errors[op] = self.errors.get(op, 0) + 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies.setdefault(op, []).append(elapsed)
+
+    def job(self, outcome):
+        with self.lock:
+            self.jobs.append(outcome)
+
+
+def call(recorder, op, handler, event, expect=(200, 202)):
+    with recorder.timed(op):
+        response = handler(event, None)
+    if response.get('statusCode') not in expect:
+        raise RuntimeError(f"{op} returned {response.get('statusCode')}: {response.get('body')}")
+    body = response['body']
+    return json.loads(body) if isinstance(body, str) else body
+
+
+def authorized(user_id, **event):
+    event['requestContext'] = {'authorizer': {'claims': {'sub': user_id}}}
+    return event
+
+
+def make_input(source: Path, unique: bool) -> bytes:
+    """The fixture volume as .nii.gz; unique inputs differ in the gzip header only, so dedup cannot match them"""
+    raw = gzip.decompress(source.read_bytes()) if source.suffix == '.gz' else source.read_bytes()
+    out = io.BytesIO()
+    name = f'{uuid.uuid4().hex}.nii' if unique else 'input.nii'
+    with gzip.GzipFile(filename=name, mode='wb', fileobj=out, mtime=0, compresslevel=1) as f:
+        f.write(raw)
+    return out.getvalue()
+
+
+def user_session(user_id, args, handlers, s3, recorder, input_bytes, deadline):
+    upload, process, status, my_images = (handlers[n] for n in ('upload', 'process', 'get-job-status', 'my-images'))
+    rng = random.Random(user_id)
+    for n in range(args.jobs_per_user):
+        time.sleep(rng.uniform(0, args.think_sec))
+        outcome = {'userId': user_id, 'n': n, 'jobId': None, 'status': 'error', 'error': None}
+        start = time.perf_counter()
+        try:
+            body = call(recorder, 'upload', upload.lambda_handler,
+                        authorized(user_id, body=json.dumps({'filename': 'scan.nii.gz'})))
+            job_id = outcome['jobId'] = body['jobId']
+            data = input_bytes()
+            with recorder.timed('s3_put'):
+                s3.put_object(Bucket=BUCKET, Key=body['s3Key'], Body=data,
+                              ContentType='application/octet-stream')
+            call(recorder, 'process', process.lambda_handler,
+                 authorized(user_id, body=json.dumps({'jobId': job_id, 'device': 'gpu'})))
+
+            job = {}
+            while time.time() < deadline:
+                job = call(recorder, 'status', status.lambda_handler,
+                           authorized(user_id, pathParameters={'jobId': job_id}))['job']
+                if job['status'] in ('completed', 'failed'):
+                    break
+                time.sleep(args.poll_sec)
+            outcome['status'] = job.get('status') or 'timeout'
+            if outcome['status'] not in ('completed', 'failed'):
+                outcome['status'] = 'timeout'
+            outcome['e2eSec'] = time.perf_counter() - start
+            outcome['error'] = job.get('errorMessage')
+            for a, b, key in (('queuedAt', 'startedAt', 'queueWaitSec'), ('startedAt', 'completedAt', 'processingSec')):
+                if job.get(a) and job.get(b):
+                    outcome[key] = job[b] - job[a]
+
+            listing = call(recorder, 'my_images', my_images.lambda_handler,
+                           authorized(user_id, queryStringParameters={'limit': '25'}))
+            if job_id not in [i['jobId'] for i in listing['images']]:
+                outcome['status'] = 'error'
+                outcome['error'] = 'job missing from my-images'
+            if outcome['status'] == 'completed':
+                artifacts = call(recorder, 'artifacts', my_images.artifacts_handler,
+                                 authorized(user_id, pathParameters={'jobId': job_id}))
+                # What the viewer would fetch; deduplicated jobs point at the artifacts of the job they matched
+                obj_url = next((url for url in artifacts['artifactUrls'].values() if '/Result.obj' in url), None)
+                if obj_url is None:
+                    outcome['status'] = 'error'
+                    outcome['error'] = 'no Result.obj among the artifact URLs'
+                elif not s3.exists(BUCKET, urlparse(obj_url).path.split('/', 2)[2]):
+                    outcome['status'] = 'error'
+                    outcome['error'] = f'{obj_url} points at a missing object'
+        except Exception as e:
+            outcome['error'] = str(e)
+        recorder.job(outcome)
+
+
+def pack_flusher(process, interval, stop):
+    # The EventBridge schedule that submits packs whose wait window has passed
+    while not stop.wait(interval):
+        try:
+            process.lambda_handler({'source': 'aws.events'}, None)
+        except Exception as e:
+            print(f"[load] pack flush failed: {e}")
+
+
+def report(args, recorder, batch, wall_sec, out):
+    rows = []
+
+    def row(name, values, count=None):
+        values = [v for v in values if v is not None]
+        rows.append({'name': name, 'count': count if count is not None else len(values),
+                     'p50': percentile(values, 50), 'p99': percentile(values, 99),
+                     'max': max(values) if values else None})
+
+    for op in ('upload', 's3_put', 'process', 'status', 'my_images', 'artifacts'):
+        row(op, recorder.latencies.get(op, []))
+    done = [j for j in recorder.jobs if j['status'] == 'completed']
+    row('job end-to-end', [j.get('e2eSec') for j in done])
+    row('queue wait (record)', [j.get('queueWaitSec') for j in done])
+    row('processing (record)', [j.get('processingSec') for j in done])
+
+    counts = {}
+    for j in recorder.jobs:
+        counts[j['status']] = counts.get(j['status'], 0) + 1
+    jobs_per_hour = len(done) / wall_sec * 3600 if wall_sec > 0 else 0.0
+
+    print(f"\n{args.users} user(s) x {args.jobs_per_user} job(s), compute {args.compute}, "
+          f"segment {args.segment_sec}s, {args.structures} structure(s), cold start {args.cold_start_sec}s"
+          f"{f', packing <= {args.pack_mb} MB' if args.pack_mb else ''}", file=out)
+    print(f"{'':22} {'n':>5} {'p50':>9} {'p99':>9} {'max':>9}", file=out)
+    for r in rows:
+        fmt = lambda v: f"{v * 1000:8.1f}ms" if v is not None and v < 1 else (f"{v:8.2f}s " if v is not None else f"{'-':>9}")
+        print(f"{r['name']:22} {r['count']:>5} {fmt(r['p50'])} {fmt(r['p99'])} {fmt(r['max'])}", file=out)
+    print(f"\njobs: {', '.join(f'{k} {v}' for k, v in sorted(counts.items()))}; "
+          f"{jobs_per_hour:.1f} jobs/hour over {wall_sec:.1f}s; "
+          f"peak {batch.max_running} Batch job(s) running; call errors {sum(recorder.errors.values())}", file=out)
+    for j in recorder.jobs:
+        if j['status'] != 'completed':
+            print(f"  {j['jobId'] or j['userId']}: {j['status']} {j['error'] or ''}", file=out)
+
+    summary = {'config': vars(args) | {'work_dir': str(args.work_dir), 'out': str(args.out) if args.out else None},
+               'wallSec': round(wall_sec, 2), 'jobsPerHour': round(jobs_per_hour, 1), 'jobs': counts,
+               'latencies': rows, 'errors': recorder.errors, 'outcomes': recorder.jobs,
+               'peakBatchJobs': batch.max_running}
+    if args.out:
+        args.out.write_text(json.dumps(summary, indent=2, default=str))
+        print(f"report written to {args.out}", file=out)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='local end-to-end load test with AWS stand-ins')
+    parser.add_argument('--users', type=int, default=4, help='concurrent users (default 4)')
+    parser.add_argument('--jobs-per-user', type=int, default=1)
+    parser.add_argument('--think-sec', type=float, default=1.0, help='max random pause before each upload')
+    parser.add_argument('--compute', type=int, default=2, help='Batch jobs running at once (default 2)')
+    parser.add_argument('--cold-start-sec', type=float, default=0.0, help='container start delay per Batch job')
+    parser.add_argument('--segment-sec', type=float, default=5.0, help='replayed inference time (default 5)')
+    parser.add_argument('--structures', type=int, default=8, help='fixture masks replayed per job (default 8)')
+    parser.add_argument('--fixture', type=Path, help='finished job folder with segmentations/ (default: first in jobs/)')
+    parser.add_argument('--input', type=Path, help='volume to upload (default: a fixture mask)')
+    parser.add_argument('--same-input', action='store_true', help='upload identical bytes so dedup can reuse results')
+    parser.add_argument('--s3-mbps', type=float, default=0.0, help='throttle S3 transfers (0 = disk speed)')
+    parser.add_argument('--pack-mb', type=float, default=0.0, help='pack inputs up to this size (PACK_MAX_INPUT_MB)')
+    parser.add_argument('--pack-wait-sec', type=int, default=10, help='PACK_MAX_WAIT_SEC when packing')
+    parser.add_argument('--poll-sec', type=float, default=1.0)
+    parser.add_argument('--timeout', type=float, default=900.0, help='give up on unfinished jobs after this many seconds')
+    parser.add_argument('--work-dir', type=Path, help='keep the S3 tree, SQLite file and logs here')
+    parser.add_argument('--out', type=Path, help='write the report as JSON')
+    args = parser.parse_args()
+
+    fixture = args.fixture or next((d for d in sorted((BACKEND_DIR / 'jobs').iterdir())
+                                    if (d / 'segmentations').is_dir()), None)
+    if fixture is None:
+        print('No finished job with segmentations/ in jobs/; pass --fixture')
+        return 1
+    seg_fixture = fixture / 'segmentations' if (fixture / 'segmentations').is_dir() else fixture
+    source = args.input or sorted(seg_fixture.glob('*.nii*'))[0]
+
+    temp = None
+    if args.work_dir is None:
+        temp = tempfile.mkdtemp(prefix='load-local-')
+        args.work_dir = Path(temp)
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    db_path = args.work_dir / 'dynamodb.sqlite'
+    db_path.unlink(missing_ok=True)
+    db = LocalDynamoDB(db_path, SCHEMAS)
+    s3 = LocalS3(args.work_dir / 's3', args.s3_mbps)
+
+    env = {
+        'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+        'S3_BUCKET': BUCKET,
+        'DYNAMODB_TABLE': TABLE,
+        'RESULTS_INDEX_TABLE': INDEX_TABLE,
+        'BATCH_JOB_QUEUE': 'local-queue',
+        'BATCH_JOB_DEFINITION': 'local-totalseg',
+        'JOB_QUEUE_URL': '',
+        'PACK_MAX_INPUT_MB': str(args.pack_mb),
+        'PACK_MAX_WAIT_SEC': str(args.pack_wait_sec),
+        'EMIT_EMF': 'false',
+        'PROGRESS_INTERVAL_SEC': '1',
+    }
+    os.environ.update(env)
+
+    real_stdout = sys.stdout
+    lambda_log = open(args.work_dir / 'lambdas.log', 'w', buffering=1)
+    with contextlib.redirect_stdout(lambda_log):
+        handlers = {name: load_handler(name) for name in LAMBDAS}
+    h = handlers
+    h['upload'].s3, h['upload'].table = s3, db.Table(TABLE)
+    h['process'].s3, h['process'].dynamodb, h['process'].table = s3, db, db.Table(TABLE)
+    h['process'].index_table = db.Table(INDEX_TABLE)
+    h['get-job-status'].s3, h['get-job-status'].dynamodb, h['get-job-status'].table = s3, db, db.Table(TABLE)
+    h['my-images'].s3, h['my-images'].table = s3, db.Table(TABLE)
+    h['batch-events'].dynamodb, h['batch-events'].table = db, db.Table(TABLE)
+
+    def on_event(event):
+        with contextlib.redirect_stdout(lambda_log):
+            h['batch-events'].lambda_handler(event, None)
+
+    worker_config = {
+        'env': env, 'batch_dir': str(BACKEND_DIR / 'batch'), 'log': str(args.work_dir / 'batch.log'),
+        'db': str(db_path), 'schemas': SCHEMAS, 's3_root': str(args.work_dir / 's3'), 's3_mbps': args.s3_mbps,
+        'fixture': str(seg_fixture), 'structures': args.structures, 'segment_sec': args.segment_sec,
+    }
+    batch = LocalBatch(args.compute, run_batch_job, initializer=batch_worker_init, initargs=(worker_config,),
+                       on_event=on_event, cold_start_sec=args.cold_start_sec)
+    h['process'].batch_client = batch
+    h['get-job-status']._batch_client = batch
+
+    shared_input = make_input(source, unique=False)
+    input_bytes = (lambda: shared_input) if args.same_input else (lambda: make_input(source, unique=True))
+    print(f"[load] {args.users} user(s), input {source.name} ({len(shared_input) / 1e6:.1f} MB), "
+          f"fixture {seg_fixture}, work dir {args.work_dir}")
+
+    recorder = Recorder()
+    stop = threading.Event()
+    start = time.time()
+    deadline = start + args.timeout
+    with contextlib.redirect_stdout(lambda_log):
+        flusher = None
+        if args.pack_mb:
+            flusher = threading.Thread(target=pack_flusher, args=(h['process'], 2.0, stop), daemon=True)
+            flusher.start()
+        users = [threading.Thread(target=user_session,
+                                  args=(f'user-{i}', args, handlers, s3, recorder, input_bytes, deadline))
+                 for i in range(args.users)]
+        for t in users:
+            t.start()
+        for t in users:
+            t.join()
+        stop.set()
+    wall = time.time() - start
+    batch.shutdown()
+
+    summary = report(args, recorder, batch, wall, real_stdout)
+    lambda_log.close()
+    if temp:
+        shutil.rmtree(temp, ignore_errors=True)
+    return 0 if summary['jobs'].get('completed', 0) == len(recorder.jobs) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,795 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the AWS services used by the upload -> process -> Batch
+-> status flow, for scripts/load-local.py. They expose the subset of the
+boto3 client/resource API the Lambdas and the Batch worker call.
+
+  LocalDynamoDB  SQLite file shared across processes; conditions, updates,
+                 GSI queries (Limit before FilterExpression, like DynamoDB)
+  LocalS3        a directory tree, with ETag/Metadata sidecars
+  LocalBatch     a compute pool of worker processes running batch_processor,
+                 emitting 'Batch Job State Change' events like EventBridge
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import pickle
+import shutil
+import sqlite3
+import queue
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+
+# ----------------------------------------------------------------------------
+# DynamoDB expressions
+# ----------------------------------------------------------------------------
+TOKEN_RE = re.compile(r'\s*(?:(#\w+)|(:\w+)|(<>|<=|>=|=|<|>)|([(),.\[\]+-])|(\d+)|([A-Za-z_]\w*))')
+KEYWORDS = {'AND', 'OR', 'NOT', 'IN', 'BETWEEN', 'SET', 'REMOVE', 'ADD', 'DELETE'}
+MISSING = object()
+
+
+class ConditionalCheckFailedException(ClientError):
+    def __init__(self, message: str = 'The conditional request failed'):
+        super().__init__({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': message}}, 'UpdateItem')
+
+
+def _tokenize(expression: str) -> List[Tuple[str, str]]:
+    tokens, pos = [], 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = TOKEN_RE.match(expression, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"Cannot parse expression at: {expression[pos:]!r}")
+        pos = match.end()
+        name, value, op, punct, number, word = match.groups()
+        if name:
+            tokens.append(('name', name))
+        elif value:
+            tokens.append(('value', value))
+        elif op:
+            tokens.append(('op', op))
+        elif punct:
+            tokens.append(('punct', punct))
+        elif number:
+            tokens.append(('number', number))
+        elif word.upper() in KEYWORDS:
+            tokens.append(('kw', word.upper()))
+        else:
+            tokens.append(('ident', word))
+    return tokens
+
+
+class _Parser:
+    """Recursive descent over condition, update and projection expressions"""
+
+    def __init__(self, expression: str, names: Dict[str, str], values: Dict[str, Any]):
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self, offset: int = 0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, text=None):
+        token = self.peek()
+        if (kind and token[0] != kind) or (text and token[1] != text):
+            raise ValueError(f"Expected {text or kind}, got {token[1]!r}")
+        self.pos += 1
+        return token
+
+    def at(self, kind, text=None) -> bool:
+        token = self.peek()
+        return token[0] == kind and (text is None or token[1] == text)
+
+    # paths ------------------------------------------------------------------
+    def path(self) -> List[Any]:
+        parts = [self._name()]
+        while True:
+            if self.at('punct', '.'):
+                self.take()
+                parts.append(self._name())
+            elif self.at('punct', '['):
+                self.take()
+                parts.append(int(self.take('number')[1]))
+                self.take('punct', ']')
+            else:
+                return parts
+
+    def _name(self) -> str:
+        kind, text = self.take()
+        if kind == 'name':
+            return self.names[text]
+        if kind == 'ident':
+            return text
+        raise ValueError(f"Expected attribute name, got {text!r}")
+
+    # operands ---------------------------------------------------------------
+    def operand(self):
+        """Callable item -> value"""
+        kind, text = self.peek()
+        if kind == 'value':
+            self.take()
+            value = self.values[text]
+            return lambda item: value
+        if kind == 'ident' and self.peek(1) == ('punct', '('):
+            return self._function_operand()
+        path = self.path()
+        return lambda item: _get(item, path)
+
+    def _function_operand(self):
+        name = self.take('ident')[1]
+        self.take('punct', '(')
+        if name == 'size':
+            path = self.path()
+            self.take('punct', ')')
+            return lambda item: Decimal(len(_get(item, path))) if _get(item, path) is not MISSING else MISSING
+        if name == 'if_not_exists':
+            path = self.path()
+            self.take('punct', ',')
+            default = self.operand()
+            self.take('punct', ')')
+            return lambda item: default(item) if _get(item, path) is MISSING else _get(item, path)
+        if name == 'list_append':
+            first = self.operand()
+            self.take('punct', ',')
+            second = self.operand()
+            self.take('punct', ')')
+            return lambda item: list(first(item)) + list(second(item))
+        raise ValueError(f"Unsupported function {name}")
+
+    # conditions -------------------------------------------------------------
+    def condition(self):
+        left = self._and()
+        while self.at('kw', 'OR'):
+            self.take()
+            right = self._and()
+            left = (lambda a, b: lambda item: a(item) or b(item))(left, right)
+        return left
+
+    def _and(self):
+        left = self._not()
+        while self.at('kw', 'AND'):
+            self.take()
+            right = self._not()
+            left = (lambda a, b: lambda item: a(item) and b(item))(left, right)
+        return left
+
+    def _not(self):
+        if self.at('kw', 'NOT'):
+            self.take()
+            inner = self._not()
+            return lambda item: not inner(item)
+        return self._primary()
+
+    def _primary(self):
+        if self.at('punct', '('):
+            self.take()
+            inner = self.condition()
+            self.take('punct', ')')
+            return inner
+        kind, text = self.peek()
+        if kind == 'ident' and text in ('attribute_exists', 'attribute_not_exists', 'begins_with', 'contains') \
+                and self.peek(1) == ('punct', '('):
+            self.take()
+            self.take('punct', '(')
+            if text in ('attribute_exists', 'attribute_not_exists'):
+                path = self.path()
+                self.take('punct', ')')
+                exists = text == 'attribute_exists'
+                return lambda item: (_get(item, path) is not MISSING) == exists
+            path = self.path()
+            self.take('punct', ',')
+            arg = self.operand()
+            self.take('punct', ')')
+            if text == 'begins_with':
+                return lambda item: isinstance(_get(item, path), str) and _get(item, path).startswith(arg(item))
+            return lambda item: _get(item, path) is not MISSING and arg(item) in _get(item, path)
+        left = self.operand()
+        if self.at('kw', 'IN'):
+            self.take()
+            self.take('punct', '(')
+            options = [self.operand()]
+            while self.at('punct', ','):
+                self.take()
+                options.append(self.operand())
+            self.take('punct', ')')
+            return lambda item: any(_equal(left(item), o(item)) for o in options)
+        if self.at('kw', 'BETWEEN'):
+            self.take()
+            low = self.operand()
+            self.take('kw', 'AND')
+            high = self.operand()
+            return lambda item: _compare('>=', left(item), low(item)) and _compare('<=', left(item), high(item))
+        op = self.take('op')[1]
+        right = self.operand()
+        return lambda item: _compare(op, left(item), right(item))
+
+    # update -----------------------------------------------------------------
+    def update(self):
+        """List of (action, path, value callable) applied in order"""
+        actions = []
+        while self.peek()[0] is not None:
+            clause = self.take('kw')[1]
+            while True:
+                path = self.path()
+                if clause == 'SET':
+                    self.take('op', '=')
+                    value = self.operand()
+                    if self.at('punct', '+') or self.at('punct', '-'):
+                        sign = self.take()[1]
+                        other = self.operand()
+                        value = (lambda a, b, s: lambda item: a(item) + b(item) if s == '+' else a(item) - b(item))(
+                            value, other, sign)
+                    actions.append(('SET', path, value))
+                elif clause == 'REMOVE':
+                    actions.append(('REMOVE', path, None))
+                elif clause == 'ADD':
+                    actions.append(('ADD', path, self.operand()))
+                else:
+                    actions.append(('DELETE', path, self.operand()))
+                if not self.at('punct', ','):
+                    break
+                self.take()
+        return actions
+
+    def projection(self) -> List[List[Any]]:
+        paths = [self.path()]
+        while self.at('punct', ','):
+            self.take()
+            paths.append(self.path())
+        return paths
+
+
+def _get(item: Dict[str, Any], path: List[Any]):
+    value = item
+    for part in path:
+        if isinstance(part, int):
+            if not isinstance(value, list) or part >= len(value):
+                return MISSING
+            value = value[part]
+        else:
+            if not isinstance(value, dict) or part not in value:
+                return MISSING
+            value = value[part]
+    return value
+
+
+def _set(item: Dict[str, Any], path: List[Any], value):
+    target = item
+    for part in path[:-1]:
+        target = target[part]
+    target[path[-1]] = value
+
+
+def _remove(item: Dict[str, Any], path: List[Any]):
+    target = _get(item, path[:-1]) if len(path) > 1 else item
+    if isinstance(target, dict):
+        target.pop(path[-1], None)
+    elif isinstance(target, list) and path[-1] < len(target):
+        del target[path[-1]]
+
+
+def _equal(a, b) -> bool:
+    return a is not MISSING and b is not MISSING and a == b
+
+
+def _compare(op: str, a, b) -> bool:
+    if op == '=':
+        return _equal(a, b)
+    if op == '<>':
+        return not _equal(a, b)
+    if a is MISSING or b is MISSING or type(a) is not type(b) and not (
+            isinstance(a, (int, Decimal)) and isinstance(b, (int, Decimal))):
+        return False
+    return {'<': a < b, '<=': a <= b, '>': a > b, '>=': a >= b}[op]
+
+
+def to_stored(value):
+    """Python value as DynamoDB returns it: numbers as Decimal; floats rejected like boto3"""
+    if isinstance(value, bool) or value is None or isinstance(value, (str, bytes, Decimal)):
+        return value
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        raise TypeError('Float types are not supported. Use Decimal types instead.')
+    if isinstance(value, dict):
+        return {k: to_stored(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_stored(v) for v in value]
+    if isinstance(value, set):
+        return {to_stored(v) for v in value}
+    raise TypeError(f"Unsupported type {type(value).__name__}")
+
+
+def project(item: Dict[str, Any], expression: Optional[str], names: Dict[str, str]) -> Dict[str, Any]:
+    if not expression:
+        return item
+    out = {}
+    for path in _Parser(expression, names, {}).projection():
+        value = _get(item, path)
+        if value is not MISSING:
+            _set_nested(out, path, value)
+    return out
+
+
+def _set_nested(out, path, value):
+    for part in path[:-1]:
+        out = out.setdefault(part, {})
+    out[path[-1]] = value
+
+
+# ----------------------------------------------------------------------------
+# DynamoDB
+# ----------------------------------------------------------------------------
+class LocalDynamoDB:
+    """
+    boto3 'dynamodb' resource stand-in over one SQLite file. Every call opens
+    its own connection, so handlers in threads and workers in other processes
+    share the tables; writes run in an IMMEDIATE transaction, which makes
+    conditional updates atomic.
+    """
+
+    def __init__(self, path: Path, schemas: Dict[str, Dict[str, Any]]):
+        """schemas: table -> {'key': [attr, ...], 'indexes': {name: (hash attr, range attr or None)}}"""
+        self.path = str(path)
+        self.schemas = schemas
+        self.meta = _Meta()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS items (tbl TEXT, pk TEXT, data BLOB, PRIMARY KEY (tbl, pk))')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level='IMMEDIATE')
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def Table(self, name: str) -> 'LocalTable':
+        return LocalTable(self, name)
+
+    def batch_get_item(self, RequestItems: Dict[str, Dict[str, Any]]):
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.Table(name)
+            items = [table.get_item(Key=key).get('Item') for key in request['Keys']]
+            responses[name] = [item for item in items if item]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+
+class _Meta:
+    def __init__(self):
+        self.client = self
+
+    @property
+    def exceptions(self):
+        return self
+
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+
+
+class LocalTable:
+    def __init__(self, db: LocalDynamoDB, name: str):
+        self.db = db
+        self.name = name
+        self.key_attrs = db.schemas.get(name, {}).get('key', ['jobId'])
+        self.indexes = db.schemas.get(name, {}).get('indexes', {})
+
+    def _pk(self, key: Dict[str, Any]) -> str:
+        return json.dumps([str(key[a]) for a in self.key_attrs])
+
+    def _load(self, conn, key):
+        row = conn.execute('SELECT data FROM items WHERE tbl = ? AND pk = ?', (self.name, self._pk(key))).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def _store(self, conn, item):
+        conn.execute('INSERT OR REPLACE INTO items (tbl, pk, data) VALUES (?, ?, ?)',
+                     (self.name, self._pk(item), pickle.dumps(item)))
+
+    def _check(self, item, condition, names, values):
+        if condition and not _Parser(condition, names, values).condition()(item or {}):
+            raise ConditionalCheckFailedException()
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **_):
+        with self.db._connect() as conn:
+            item = self._load(conn, Key)
+        if item is None:
+            return {}
+        return {'Item': project(item, ProjectionExpression, ExpressionAttributeNames or {})}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, **_):
+        item = to_stored(Item)
+        with self.db._connect() as conn:
+            self._check(self._load(conn, item), ConditionExpression, ExpressionAttributeNames,
+                        to_stored(ExpressionAttributeValues or {}))
+            self._store(conn, item)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues=None, **_):
+        names = ExpressionAttributeNames or {}
+        values = to_stored(ExpressionAttributeValues or {})
+        actions = _Parser(UpdateExpression, names, values).update()
+        with self.db._connect() as conn:
+            current = self._load(conn, Key)
+            self._check(current, ConditionExpression, names, values)
+            item = current if current is not None else to_stored(dict(Key))
+            for action, path, value in actions:
+                if action == 'SET':
+                    _set(item, path, value(item))
+                elif action == 'REMOVE':
+                    _remove(item, path)
+                elif action == 'ADD':
+                    existing = _get(item, path)
+                    delta = value(item)
+                    if isinstance(delta, set):
+                        _set(item, path, (existing if existing is not MISSING else set()) | delta)
+                    else:
+                        _set(item, path, (existing if existing is not MISSING else Decimal(0)) + delta)
+                else:
+                    existing = _get(item, path)
+                    if existing is not MISSING:
+                        _set(item, path, existing - value(item))
+            self._store(conn, item)
+        return {'Attributes': item} if ReturnValues in ('ALL_NEW', 'UPDATED_NEW') else {}
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, **_):
+        with self.db._connect() as conn:
+            self._check(self._load(conn, Key), ConditionExpression, ExpressionAttributeNames,
+                        to_stored(ExpressionAttributeValues or {}))
+            conn.execute('DELETE FROM items WHERE tbl = ? AND pk = ?', (self.name, self._pk(Key)))
+        return {}
+
+    def _all(self) -> List[Dict[str, Any]]:
+        with self.db._connect() as conn:
+            rows = conn.execute('SELECT data FROM items WHERE tbl = ?', (self.name,)).fetchall()
+        return [pickle.loads(row[0]) for row in rows]
+
+    def query(self, KeyConditionExpression, IndexName=None, FilterExpression=None, ProjectionExpression=None,
+              ExpressionAttributeNames=None, ExpressionAttributeValues=None, ScanIndexForward=True,
+              Limit=None, ExclusiveStartKey=None, **_):
+        names = ExpressionAttributeNames or {}
+        values = to_stored(ExpressionAttributeValues or {})
+        hash_attr, range_attr = self.indexes[IndexName] if IndexName else (self.key_attrs[0], (self.key_attrs[1:] or [None])[0])
+        key_condition = _Parser(KeyConditionExpression, names, values).condition()
+        # Sparse index: items without the index keys are not in it
+        items = [i for i in self._all() if hash_attr in i and (range_attr is None or range_attr in i) and key_condition(i)]
+        sort_key = lambda i: (i.get(range_attr, Decimal(0)) if range_attr else 0, self._pk(i))
+        items.sort(key=sort_key, reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            start = (ExclusiveStartKey.get(range_attr) if range_attr else 0, self._pk(ExclusiveStartKey))
+            if range_attr:
+                start = (to_stored(start[0]), start[1])
+            items = [i for i in items if (sort_key(i) > start if ScanIndexForward else sort_key(i) < start)]
+        # Limit counts items read, before the filter, like DynamoDB
+        page = items[:Limit] if Limit else items
+        last_key = None
+        if Limit and len(items) > Limit:
+            last = page[-1]
+            last_key = {a: last[a] for a in set(self.key_attrs) | {hash_attr} | ({range_attr} if range_attr else set())}
+        if FilterExpression:
+            keep = _Parser(FilterExpression, names, values).condition()
+            page = [i for i in page if keep(i)]
+        result = {'Items': [project(i, ProjectionExpression, names) for i in page], 'Count': len(page)}
+        if last_key:
+            result['LastEvaluatedKey'] = last_key
+        return result
+
+    def scan(self, FilterExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, **_):
+        items = self._all()
+        if FilterExpression:
+            keep = _Parser(FilterExpression, ExpressionAttributeNames or {},
+                           to_stored(ExpressionAttributeValues or {})).condition()
+            items = [i for i in items if keep(i)]
+        return {'Items': items, 'Count': len(items)}
+
+
+# ----------------------------------------------------------------------------
+# S3
+# ----------------------------------------------------------------------------
+class LocalS3:
+    """boto3 's3' client stand-in over a directory; mbps > 0 throttles transfers"""
+
+    def __init__(self, root: Path, mbps: float = 0.0):
+        self.root = Path(root)
+        self.mbps = mbps
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, bucket: str, key: str) -> Path:
+        return self.root / bucket / key
+
+    def _meta_path(self, bucket: str, key: str) -> Path:
+        return self.root / '.meta' / bucket / (key + '.json')
+
+    def _throttle(self, size: int):
+        if self.mbps > 0:
+            time.sleep(size / (self.mbps * 1024 * 1024))
+
+    def _not_found(self, operation: str):
+        return ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, operation)
+
+    def _write_meta(self, bucket: str, key: str, content_type: Optional[str], metadata: Optional[Dict[str, str]]):
+        digest = hashlib.md5()
+        with open(self._path(bucket, key), 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        meta = self._meta_path(bucket, key)
+        meta.parent.mkdir(parents=True, exist_ok=True)
+        meta.write_text(json.dumps({'ETag': f'"{digest.hexdigest()}"', 'ContentType': content_type,
+                                    'Metadata': metadata or {}}))
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600, **_):
+        return f"http://s3.local/{Params['Bucket']}/{Params['Key']}?X-Amz-Expires={ExpiresIn}&op={ClientMethod}"
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, Metadata=None, **_):
+        path = self._path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = Body if isinstance(Body, bytes) else Body.read()
+        self._throttle(len(data))
+        path.write_bytes(data)
+        self._write_meta(Bucket, Key, ContentType, Metadata)
+        return {'ETag': json.loads(self._meta_path(Bucket, Key).read_text())['ETag']}
+
+    def head_object(self, Bucket, Key, **_):
+        path = self._path(Bucket, Key)
+        if not path.is_file():
+            raise self._not_found('HeadObject')
+        meta = json.loads(self._meta_path(Bucket, Key).read_text())
+        return {'ContentLength': path.stat().st_size, 'ETag': meta['ETag'], 'ContentType': meta.get('ContentType'),
+                'Metadata': meta.get('Metadata', {})}
+
+    def download_file(self, Bucket, Key, Filename, Config=None, Callback=None, **_):
+        path = self._path(Bucket, Key)
+        if not path.is_file():
+            raise self._not_found('HeadObject')
+        self._throttle(path.stat().st_size)
+        shutil.copyfile(path, Filename)
+        if Callback:
+            Callback(path.stat().st_size)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None, Callback=None, **_):
+        extra = ExtraArgs or {}
+        path = self._path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size = Path(Filename).stat().st_size
+        self._throttle(size)
+        shutil.copyfile(Filename, path)
+        self._write_meta(Bucket, Key, extra.get('ContentType'), extra.get('Metadata'))
+        if Callback:
+            Callback(size)
+
+    def copy_object(self, Bucket, Key, CopySource, **_):
+        source = self._path(CopySource['Bucket'], CopySource['Key'])
+        if not source.is_file():
+            raise self._not_found('CopyObject')
+        path = self._path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source, path)
+        meta = self._meta_path(Bucket, Key)
+        meta.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(self._meta_path(CopySource['Bucket'], CopySource['Key']), meta)
+        return {'CopyObjectResult': {'ETag': json.loads(meta.read_text())['ETag']}}
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, **_):
+        base = self.root / Bucket
+        keys = sorted(str(p.relative_to(base)) for p in base.rglob('*') if p.is_file()) if base.is_dir() else []
+        keys = [k for k in keys if k.startswith(Prefix) and not (Delimiter and Delimiter in k[len(Prefix):])]
+        return {'Contents': [{'Key': k, 'Size': (base / k).stat().st_size} for k in keys],
+                'KeyCount': len(keys), 'IsTruncated': False}
+
+    def delete_object(self, Bucket, Key, **_):
+        self._path(Bucket, Key).unlink(missing_ok=True)
+        self._meta_path(Bucket, Key).unlink(missing_ok=True)
+        return {}
+
+    def exists(self, bucket: str, key: str) -> bool:
+        return self._path(bucket, key).is_file()
+
+
+# ----------------------------------------------------------------------------
+# Batch
+# ----------------------------------------------------------------------------
+class LocalBatch:
+    """
+    boto3 'batch' client stand-in. Submitted jobs wait for one of `compute`
+    slots (the compute environment's capacity), pay cold_start_sec, then run
+    worker(environment) in a process pool. State changes are passed to
+    on_event as EventBridge 'Batch Job State Change' events, in order and
+    event_delay_sec later: like EventBridge, never inside submit_job itself.
+    """
+
+    def __init__(self, compute: int, worker: Callable[[Dict[str, str]], int],
+                 initializer: Optional[Callable] = None, initargs: tuple = (),
+                 on_event: Optional[Callable[[Dict[str, Any]], None]] = None, cold_start_sec: float = 0.0,
+                 event_delay_sec: float = 0.5):
+        self.worker = worker
+        self.on_event = on_event
+        self.cold_start_sec = cold_start_sec
+        self.event_delay_sec = event_delay_sec
+        self._events: 'queue.Queue' = queue.Queue()
+        self._delivery = threading.Thread(target=self._deliver, name='batch-events', daemon=True)
+        self._delivery.start()
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._slots = ThreadPoolExecutor(max_workers=compute, thread_name_prefix='batch')
+        self._pool = ProcessPoolExecutor(max_workers=compute, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=initializer, initargs=initargs)
+        self.running = 0
+        self.max_running = 0
+
+    def submit_job(self, jobName, jobQueue, jobDefinition, containerOverrides=None, tags=None, **_):
+        batch_job_id = str(uuid.uuid4())
+        environment = (containerOverrides or {}).get('environment', [])
+        with self._lock:
+            self.jobs[batch_job_id] = {'jobId': batch_job_id, 'jobName': jobName, 'jobQueue': jobQueue,
+                                       'status': 'SUBMITTED', 'environment': environment,
+                                       'createdAt': int(time.time() * 1000)}
+        self._transition(batch_job_id, 'SUBMITTED')
+        self._slots.submit(self._run, batch_job_id)
+        return {'jobId': batch_job_id, 'jobName': jobName}
+
+    def describe_jobs(self, jobs: List[str], **_):
+        with self._lock:
+            return {'jobs': [{'jobId': j['jobId'], 'jobName': j['jobName'], 'status': j['status'],
+                              'statusReason': j.get('statusReason', '')}
+                             for j in (self.jobs.get(i) for i in jobs) if j]}
+
+    def list_jobs(self, jobQueue, filters=None, **_):
+        prefixes = [v.rstrip('*') for f in (filters or []) if f.get('name') == 'JOB_NAME' for v in f['values']]
+        with self._lock:
+            return {'jobSummaryList': [{'jobId': j['jobId'], 'jobName': j['jobName'], 'status': j['status']}
+                                       for j in self.jobs.values()
+                                       if j['jobQueue'] == jobQueue and
+                                       (not prefixes or any(j['jobName'].startswith(p) for p in prefixes))]}
+
+    def shutdown(self):
+        # Events already emitted are still delivered
+        self._events.put(None)
+        self._delivery.join(timeout=self.event_delay_sec + 10)
+        self._slots.shutdown(wait=False, cancel_futures=True)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _transition(self, batch_job_id: str, status: str, reason: str = ''):
+        with self._lock:
+            job = self.jobs[batch_job_id]
+            job['status'] = status
+            if reason:
+                job['statusReason'] = reason
+            event = {
+                'version': '0',
+                'detail-type': 'Batch Job State Change',
+                'source': 'aws.batch',
+                'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'detail': {
+                    'jobId': batch_job_id,
+                    'jobName': job['jobName'],
+                    'jobQueue': job['jobQueue'],
+                    'status': status,
+                    'statusReason': reason,
+                    'container': {'environment': job['environment']},
+                },
+            }
+        self._events.put((time.time() + self.event_delay_sec, event))
+
+    def _deliver(self):
+        while True:
+            entry = self._events.get()
+            if entry is None:
+                return
+            due, event = entry
+            time.sleep(max(0.0, due - time.time()))
+            if self.on_event:
+                try:
+                    self.on_event(event)
+                except Exception as e:
+                    print(f"[local-batch] event handler failed: {e}")
+
+    def _run(self, batch_job_id: str):
+        self._transition(batch_job_id, 'RUNNABLE')
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            self._transition(batch_job_id, 'STARTING')
+            if self.cold_start_sec:
+                time.sleep(self.cold_start_sec)
+            self._transition(batch_job_id, 'RUNNING')
+            env = {e['name']: e['value'] for e in self.jobs[batch_job_id]['environment']}
+            try:
+                code = self._pool.submit(self.worker, env).result()
+            except Exception as e:
+                self._transition(batch_job_id, 'FAILED', f'Worker crashed: {e}')
+                return
+            if code == 0:
+                self._transition(batch_job_id, 'SUCCEEDED', 'Essential container in task exited')
+            else:
+                self._transition(batch_job_id, 'FAILED', f'Essential container in task exited with code {code}')
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+# ----------------------------------------------------------------------------
+# Batch worker processes
+# ----------------------------------------------------------------------------
+class ReplayRunner:
+    """
+    TotalSegmentatorRunner stand-in: links the first `structures` masks of a
+    finished job into seg_dir after segment_sec, reporting progress meanwhile
+    """
+
+    def __init__(self, fixture_dir: Path, structures: int, segment_sec: float):
+        self.masks = sorted(Path(fixture_dir).glob('*.nii*'))[:structures]
+        if not self.masks:
+            raise ValueError(f"No masks in {fixture_dir}")
+        self.segment_sec = segment_sec
+
+    def run(self, input_path: Path, seg_dir: Path, task: str = 'total', fast: bool = True,
+            device: str = 'gpu', on_progress=None):
+        from totalseg_runner import Segmentation
+        steps = max(1, int(self.segment_sec))
+        for step in range(steps):
+            time.sleep(self.segment_sec / steps)
+            if on_progress:
+                on_progress((step + 1) / steps, f'replay {step + 1}/{steps}')
+        seg_dir.mkdir(parents=True, exist_ok=True)
+        for mask in self.masks:
+            (seg_dir / mask.name).symlink_to(mask.resolve())
+        print(f"[replay] {len(self.masks)} mask(s) after {self.segment_sec:.1f}s")
+        return Segmentation.from_directory(seg_dir)
+
+    def start_warm_up(self):
+        pass
+
+
+def batch_worker_init(config: Dict[str, Any]):
+    """ProcessPoolExecutor initializer: batch_processor wired to the local stand-ins"""
+    os.environ.update(config['env'])
+    sys.path.insert(0, config['batch_dir'])
+    log = open(config['log'], 'a', buffering=1)
+    sys.stdout = sys.stderr = log
+
+    import batch_processor
+    import s3_transfer
+    batch_processor.dynamodb = LocalDynamoDB(Path(config['db']), config['schemas'])
+    s3_transfer.s3 = LocalS3(Path(config['s3_root']), config['s3_mbps'])
+    batch_processor.runner = ReplayRunner(Path(config['fixture']), config['structures'], config['segment_sec'])
+
+
+def run_batch_job(env: Dict[str, str]) -> int:
+    """One Batch job in a worker process: a single study or a pack (JOBS_JSON); returns the exit code"""
+    import batch_processor
+    if env.get('JOBS_JSON'):
+        bodies = json.loads(env['JOBS_JSON'])
+    else:
+        bodies = [{
+            'jobId': env['JOB_ID'],
+            's3Bucket': env.get('S3_BUCKET'),
+            's3InputKey': env['S3_INPUT_KEY'],
+            's3OutputPrefix': env.get('S3_OUTPUT_PREFIX', f"results/{env['JOB_ID']}/"),
+            'device': env.get('DEVICE', 'gpu'),
+            'fast': env.get('FAST', 'true'),
+            'reductionPercent': env.get('REDUCTION_PERCENT', '90'),
+            'taskOverride': env.get('TASK_OVERRIDE', ''),
+            'dedupKey': env.get('DEDUP_KEY', ''),
+            'profile': env.get('PROFILE', ''),
+        }]
+    return batch_processor.run_jobs([batch_processor.job_from_message(b) for b in bodies])
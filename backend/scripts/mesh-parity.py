@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Check that the installed backends of mesh_processing.py agree with each other
+and that the pipeline keeps its invariants, on synthetic shapes and a few of
+the bundled job masks.
+
+  marching  bounding-box crop gives the same surface as the full volume
+  cleanup   no degenerate/duplicate faces or unreferenced vertices, same volume
+  smooth    every backend matches the first one on closed meshes
+  decimate  every backend lands near the target face count, volume and shape
+  export    vectorised OBJ text equals the per-row formatting it replaced
+  copies    backend/, batch/ and sagemaker/ mesh_processing.py are identical
+
+    python3 scripts/mesh-parity.py
+    python3 scripts/mesh-parity.py --match kidney --fixtures 4
+"""
+
+import io
+import sys
+import argparse
+import tempfile
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+COPIES = ['mesh_processing.py', 'batch/mesh_processing.py', 'sagemaker/mesh_processing.py']
+
+# Relative to the bounding-box diagonal
+SMOOTH_TOLERANCE = 1e-6
+DECIMATE_SHAPE_TOLERANCE = 0.01
+DECIMATE_VOLUME_TOLERANCE = 0.03
+DECIMATE_FACES_TOLERANCE = 0.1
+
+
+def load_mesh_module():
+    spec = importlib.util.spec_from_file_location('mesh_processing', BACKEND_DIR / 'mesh_processing.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def sphere(n: int) -> np.ndarray:
+    grid = np.indices((n, n, n), dtype=np.float32) - (n - 1) / 2
+    return (np.sqrt((grid ** 2).sum(axis=0)) < n * 0.4).astype(np.uint8)
+
+
+def tube(n: int) -> np.ndarray:
+    yz = np.indices((n, n), dtype=np.float32) - (n - 1) / 2
+    r = np.sqrt((yz ** 2).sum(axis=0))
+    volume = np.zeros((n, n, n), dtype=np.uint8)
+    volume[n // 8:n - n // 8] = (r < n * 0.25) & (r > n * 0.15)
+    return volume
+
+
+def cases(fixtures: int, match: str):
+    yield 'sphere_64', sphere(64), (1.0, 1.0, 1.0)
+    yield 'tube_64', tube(64), (0.8, 0.8, 1.5)
+    # Touches the volume border, so the surface is open there
+    edge = sphere(48)
+    yield 'sphere_cut', edge[:30], (1.0, 1.0, 1.0)
+    import nibabel as nib
+    paths = sorted((BACKEND_DIR / 'jobs').glob('*/segmentations/*.nii.gz'))
+    seen = set()
+    for path in paths:
+        if len(seen) >= fixtures:
+            break
+        if path.name in seen or (match and match not in path.name):
+            continue
+        seen.add(path.name)
+        img = nib.load(str(path))
+        yield path.name[:-len('.nii.gz')], img.get_fdata(), img.header.get_zooms()[:3]
+
+
+def diagonal(mesh) -> float:
+    return float(np.linalg.norm(mesh.vertices.max(axis=0) - mesh.vertices.min(axis=0)))
+
+
+def nearest_distance(points: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    from scipy.spatial import cKDTree
+    return cKDTree(reference).query(points)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='mesh_processing backend parity checks')
+    parser.add_argument('--fixtures', type=int, default=3, help='job masks to include (default 3)')
+    parser.add_argument('--match', help='only job masks whose name contains this')
+    args = parser.parse_args()
+
+    mp = load_mesh_module()
+    problems = []
+
+    def expect(label, ok, detail=''):
+        if not ok:
+            problems.append(label)
+        print(f"{'ok  ' if ok else 'FAIL'} {label}{f': {detail}' if detail else ''}")
+
+    sources = [(BACKEND_DIR / p).read_bytes() for p in COPIES]
+    expect('copies identical', all(s == sources[0] for s in sources[1:]), ', '.join(COPIES))
+
+    smoothers = mp.available_backends('smooth')
+    decimators = mp.available_backends('decimate')
+    print(f"smooth: {[n for n, _ in smoothers]}  decimate: {[n for n, _ in decimators]}")
+    if not decimators:
+        print("note: no decimation backend installed, decimation checks skipped")
+
+    for name, data, spacing in cases(args.fixtures, args.match):
+        # marching: crop vs full volume
+        mesh = mp.marching_cubes(data, spacing)
+        if mesh is None:
+            print(f"skip {name}: empty")
+            continue
+        full_verts, full_faces = mp.select_backend('marching_cubes')[1](
+            data.astype(np.uint8) if data.dtype == bool else data, spacing, 0.5)
+        same = (len(full_faces) == len(mesh)
+                and np.allclose(np.sort(full_verts, axis=0), np.sort(mesh.vertices, axis=0), atol=1e-9))
+        expect(f'{name} marching crop', same, f'{len(mesh)} faces')
+
+        # cleanup invariants
+        before = abs(mp.signed_volume(mesh.vertices, mesh.faces))
+        mesh = mp.cleanup_mesh(mesh)
+        f = mesh.faces
+        tri = mesh.vertices[f]
+        area = np.linalg.norm(np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0]), axis=1)
+        clean = (len(np.unique(np.sort(f, axis=1), axis=0)) == len(f)
+                 and (area > mp.MIN_FACE_AREA).all()
+                 and len(np.unique(f)) == len(mesh.vertices))
+        after = abs(mp.signed_volume(mesh.vertices, mesh.faces))
+        expect(f'{name} cleanup', clean and np.isclose(before, after, rtol=1e-6), f'{len(mesh)} faces')
+
+        # smooth: every backend against the first
+        diag = diagonal(mesh)
+        closed = mp.is_closed(mesh.faces)
+        reference = None
+        for backend, fn in smoothers:
+            out = fn(mesh, mp.MESH_SMOOTH_LAMBDA, mp.MESH_SMOOTH_ITERATIONS)
+            if reference is None:
+                reference = (backend, out)
+                continue
+            err = float(np.abs(out.vertices - reference[1].vertices).max()) / diag
+            if not closed:
+                # trimesh >= 4 builds boundary neighbours from directed edges only
+                print(f"note {name} smooth {backend} vs {reference[0]} on an open mesh: max error {err:.2e}")
+                continue
+            expect(f'{name} smooth {backend} == {reference[0]}', err < SMOOTH_TOLERANCE, f'max error {err:.2e}')
+        smoothed = reference[1] if reference else mesh
+
+        # decimate: target count, volume and distance back to the smoothed surface
+        target = max(mp.MIN_DECIMATED_FACES, int(len(smoothed) * mp.MESH_DECIMATE_RATIO))
+        volume = abs(mp.signed_volume(smoothed.vertices, smoothed.faces))
+        for backend, fn in decimators:
+            out = mp.cleanup_mesh(fn(smoothed, target))
+            faces_ok = abs(len(out) - target) <= target * DECIMATE_FACES_TOLERANCE
+            vol_err = abs(abs(mp.signed_volume(out.vertices, out.faces)) - volume) / volume if volume else 0.0
+            dist = float(nearest_distance(out.vertices, smoothed.vertices).mean()) / diag
+            expect(f'{name} decimate {backend}',
+                   faces_ok and vol_err < DECIMATE_VOLUME_TOLERANCE and dist < DECIMATE_SHAPE_TOLERANCE,
+                   f'{len(out)}/{target} faces, volume {vol_err:.2%}, mean distance {dist:.2e}')
+
+        oriented = mp.orient_outward(smoothed)
+        expect(f'{name} outward', mp.signed_volume(oriented.vertices, oriented.faces) > 0)
+
+        # export: vectorised text == per-row formatting
+        rows = io.StringIO()
+        for vx, vy, vz in oriented.vertices:
+            rows.write(f"v {vx} {vy} {vz}\n")
+        for tri in oriented.faces:
+            rows.write(f"f {int(tri[0]) + 1} {int(tri[1]) + 1} {int(tri[2]) + 1}\n")
+        with tempfile.TemporaryDirectory() as tmp:
+            obj_path, _, _ = mp.export_obj_with_submeshes([oriented], [name], Path(tmp), center=False)
+            lines = obj_path.read_text().splitlines(keepends=True)
+        body = ''.join(line for line in lines if line[:2] in ('v ', 'f '))
+        expect(f'{name} export text', body == rows.getvalue())
+
+    print(f"{'FAILED' if problems else 'passed'}: {len(problems)} problem(s)")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
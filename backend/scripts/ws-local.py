@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Run the WebSocket Lambdas (lambdas/ws) in-process against the in-memory
+registry and poster, and check what each client receives.
+
+Connect -> subscribe -> metadata stream records -> disconnect, including a
+client that vanished without $disconnect and another user's job.
+
+    python3 scripts/ws-local.py
+"""
+
+import os
+import sys
+import importlib.util
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+WS_DIR = BACKEND_DIR / 'lambdas' / 'ws'
+
+
+def load_handler():
+    # The handler builds its boto3 resources at import; no AWS call is made here
+    os.environ.setdefault('DYNAMODB_TABLE', 'iris-oculus-metadata')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    sys.path.insert(0, str(WS_DIR))
+    spec = importlib.util.spec_from_file_location('ws_handler', WS_DIR / 'handler.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def stream_record(old, new):
+    """DynamoDB stream record (MODIFY) in the low-level attribute format"""
+    from boto3.dynamodb.types import TypeSerializer
+    ser = TypeSerializer()
+    return {'eventName': 'MODIFY', 'dynamodb': {
+        'OldImage': {k: ser.serialize(v) for k, v in old.items()},
+        'NewImage': {k: ser.serialize(v) for k, v in new.items()},
+    }}
+
+
+def ctx(connection_id, **extra):
+    return {'requestContext': {'connectionId': connection_id}, **extra}
+
+
+def main():
+    handler = load_handler()
+    from registry import MemoryRegistry, MemoryPoster
+
+    jobs = {
+        'job-a': {'jobId': 'job-a', 'userId': 'alice', 'status': 'processing', 'progress': 15},
+        'job-b': {'jobId': 'job-b', 'userId': 'bob', 'status': 'queued'},
+    }
+    handler.registry = MemoryRegistry()
+    handler.poster = poster = MemoryPoster()
+    handler.authenticate = {'token-alice': 'alice', 'token-bob': 'bob'}.get
+    handler.load_jobs = lambda ids: {i: dict(jobs[i]) for i in ids if i in jobs}
+
+    problems = []
+
+    def expect(label, actual, wanted):
+        status = 'ok  ' if actual == wanted else 'FAIL'
+        if actual != wanted:
+            problems.append(label)
+        print(f"{status} {label}: {actual!r}")
+
+    expect('bad token rejected',
+           handler.connect_handler(ctx('c0', queryStringParameters={'token': 'nope'}), None)['statusCode'], 401)
+    for conn, token in (('c1', 'token-alice'), ('c2', 'token-alice'), ('c3', 'token-bob')):
+        handler.connect_handler(ctx(conn, queryStringParameters={'token': token}), None)
+
+    body = '{"action": "subscribe", "jobIds": ["job-a", "job-b"]}'
+    for conn in ('c1', 'c2', 'c3'):
+        handler.subscribe_handler(ctx(conn, body=body), None)
+    expect('snapshot on subscribe', [m['jobId'] for m in poster.sent.get('c1', [])], ['job-a'])
+    expect('other users\' jobs not subscribed', [m['jobId'] for m in poster.sent.get('c3', [])], ['job-b'])
+
+    old, new = jobs['job-a'], dict(jobs['job-a'], progress=40, stage='segmenting')
+    unchanged = dict(new, updatedAt=123)
+    poster.gone.add('c2')
+    result = handler.fanout_handler({'Records': [
+        stream_record(old, new),
+        stream_record(new, unchanged),  # updatedAt only: not pushed
+    ]}, None)
+    expect('pushed to live subscriber', poster.sent['c1'][-1].get('progress'), 40)
+    expect('push count', result['pushed'], 1)
+    expect('gone connection dropped', 'c2' in handler.registry.connections, False)
+
+    handler.disconnect_handler(ctx('c1'), None)
+    result = handler.fanout_handler({'Records': [stream_record(new, dict(new, status='completed'))]}, None)
+    expect('no push after disconnect', result['pushed'], 0)
+
+    print(f"{'FAILED' if problems else 'passed'}: {len(problems)} problem(s)")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
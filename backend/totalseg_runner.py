@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+TotalSegmentator execution backends
+'inprocess' calls the Python API and keeps loaded model weights between calls,
+'subprocess' shells out to the CLI (previous behaviour, used as fallback)
+"""
+
+import os
+import re
+import time
+import threading
+import subprocess
+import importlib.util
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+
+# auto | inprocess | subprocess
+BACKEND = os.environ.get('TOTALSEG_BACKEND', 'auto').lower()
+
+_predictor_cache_installed = False
+
+# CLI output markers used for progress: nnU-Net predicts large tasks in parts and
+# draws a tqdm bar per part (carriage-return updates become separate lines here)
+PART_RE = re.compile(r'Predicting part (\d+) of (\d+)')
+PERCENT_RE = re.compile(r'(\d{1,3})%\|')
+
+# Log lines kept for the error message when the CLI fails
+OUTPUT_TAIL_LINES = 50
+
+ProgressCallback = Callable[[float, Optional[str]], None]
+
+
+def _install_predictor_cache():
+    """
+    Memoize nnU-Net model loading so that repeated calls in the same process
+    reuse the network and checkpoint parameters instead of reading them again.
+    TotalSegmentator builds a fresh nnUNetPredictor per call; we intercept
+    initialize_from_trained_model_folder and hand cached objects to
+    manual_initialization.
+    """
+    global _predictor_cache_installed
+    if _predictor_cache_installed:
+        return
+    try:
+        from nnunetv2.inference.predict_from_raw_data import nnUNetPredictor
+    except ImportError as e:
+        print(f"[totalseg] Predictor cache unavailable: {e}")
+        return
+
+    original = nnUNetPredictor.initialize_from_trained_model_folder
+    cache = {}
+
+    def cached_initialize(self, model_training_output_dir, use_folds, checkpoint_name='checkpoint_final.pth'):
+        key = (str(model_training_output_dir), tuple(use_folds) if use_folds else None,
+               checkpoint_name, str(self.device))
+        entry = cache.get(key)
+        if entry is None:
+            original(self, model_training_output_dir, use_folds, checkpoint_name)
+            cache[key] = (self.network, self.plans_manager, self.configuration_manager,
+                          self.list_of_parameters, self.dataset_json, self.trainer_name,
+                          self.allowed_mirroring_axes)
+            print(f"[totalseg] Loaded model {Path(str(model_training_output_dir)).name} (cached for reuse)")
+        else:
+            self.manual_initialization(*entry)
+            print(f"[totalseg] Reused cached model {Path(str(model_training_output_dir)).name}")
+
+    nnUNetPredictor.initialize_from_trained_model_folder = cached_initialize
+    _predictor_cache_installed = True
+
+
+def _inprocess_available() -> bool:
+    # find_spec only locates the package; importing it pulls in torch and is left to warm_up()
+    return importlib.util.find_spec('totalsegmentator') is not None
+
+
+class Segmentation:
+    """
+    TotalSegmentator output, either a multilabel array held in memory or a
+    directory of per-structure NIfTI masks written by the CLI
+    """
+
+    def __init__(self, affine: np.ndarray, spacing: Tuple[float, ...],
+                 labels: Optional[np.ndarray] = None, label_names: Optional[Dict[int, str]] = None,
+                 seg_dir: Optional[Path] = None):
+        self.affine = affine
+        self.spacing = spacing
+        self.labels = labels
+        self.label_names = label_names or {}
+        self.seg_dir = seg_dir
+
+    @classmethod
+    def from_directory(cls, seg_dir: Path) -> 'Segmentation':
+        import nibabel as nib
+        nii_files = sorted(p for p in Path(seg_dir).glob('*.nii*') if p.is_file())
+        if not nii_files:
+            return cls(np.eye(4), (1.0, 1.0, 1.0), seg_dir=Path(seg_dir))
+        ref = nib.load(str(nii_files[0]))
+        return cls(ref.affine, tuple(float(z) for z in ref.header.get_zooms()[:3]), seg_dir=Path(seg_dir))
+
+    def names(self):
+        if self.labels is not None:
+            return [self.label_names[i] for i in sorted(self.label_names)]
+        return [p.name.replace('.nii.gz', '').replace('.nii', '')
+                for p in sorted(self.seg_dir.glob('*.nii*')) if p.is_file()]
+
+    def iter_masks(self) -> Iterator[Tuple[str, np.ndarray]]:
+        """Yield (structure name, boolean mask) for every non-empty structure"""
+        import nibabel as nib
+        if self.labels is not None:
+            counts = np.bincount(self.labels.ravel(), minlength=max(self.label_names) + 1)
+            for label_id in sorted(self.label_names):
+                if counts[label_id] > 0:
+                    yield self.label_names[label_id], self.labels == label_id
+            return
+        for nii in sorted(self.seg_dir.glob('*.nii*')):
+            if not nii.is_file():
+                continue
+            name = nii.name.replace('.nii.gz', '').replace('.nii', '')
+            mask = np.asanyarray(nib.load(str(nii)).dataobj) > 0.5
+            if mask.any():
+                yield name, mask
+
+    def label_volume(self) -> Tuple[np.ndarray, Dict[str, int]]:
+        """Combined uint8 label volume and its name -> id map"""
+        import nibabel as nib
+        if self.labels is not None:
+            return self.labels.astype(np.uint8, copy=False), {n: i for i, n in self.label_names.items()}
+        combined, label_map = None, {}
+        for i, nii in enumerate(sorted(self.seg_dir.glob('*.nii*'))):
+            name = nii.name.replace('.nii.gz', '').replace('.nii', '')
+            data = np.asanyarray(nib.load(str(nii)).dataobj)
+            if combined is None:
+                combined = np.zeros(data.shape, dtype=np.uint8)
+            label_map[name] = i + 1
+            combined[data > 0.5] = i + 1
+        return combined, label_map
+
+
+class TotalSegmentatorRunner:
+    """Runs TotalSegmentator with the configured backend; one instance per worker process"""
+
+    def __init__(self, backend: str = BACKEND, nr_thr_resamp: Optional[Union[int, str]] = None,
+                 nr_thr_saving: Optional[Union[int, str]] = None, timeout: Optional[int] = None,
+                 executable: str = 'TotalSegmentator'):
+        if backend == 'auto':
+            backend = 'inprocess' if _inprocess_available() else 'subprocess'
+        self.backend = backend
+        # None (or '') keeps TotalSegmentator's own thread counts
+        self.nr_thr_resamp = int(nr_thr_resamp) if nr_thr_resamp not in (None, '') else None
+        self.nr_thr_saving = int(nr_thr_saving) if nr_thr_saving not in (None, '') else None
+        self.timeout = timeout
+        self.executable = executable
+        self._warm_lock = threading.Lock()
+        self._warm = False
+        print(f"[totalseg] Using '{self.backend}' backend")
+
+    def warm_up(self):
+        """
+        Import TotalSegmentator/torch and install the predictor cache.
+        Safe to call from a background thread while the input downloads;
+        run() calls it too, so concurrent callers simply wait for the first.
+        """
+        if self.backend != 'inprocess':
+            return
+        with self._warm_lock:
+            if self._warm:
+                return
+            start = time.time()
+            import totalsegmentator.python_api  # noqa: F401
+            _install_predictor_cache()
+            self._warm = True
+            print(f"[totalseg] Imported TotalSegmentator in {time.time() - start:.1f}s")
+
+    def start_warm_up(self) -> threading.Thread:
+        """Run warm_up() in a daemon thread"""
+        thread = threading.Thread(target=self.warm_up, name='totalseg-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def build_command(self, input_path: Path, seg_dir: Path, task: str, fast: bool, device: str):
+        cmd = [
+            self.executable,
+            '-i', str(input_path),
+            '-o', str(seg_dir),
+        ]
+        if self.nr_thr_resamp is not None:
+            cmd.extend(['--nr_thr_resamp', str(self.nr_thr_resamp)])
+        if self.nr_thr_saving is not None:
+            cmd.extend(['--nr_thr_saving', str(self.nr_thr_saving)])
+        if task != 'total':
+            cmd.extend(['--task', task])
+        if device != 'cpu':
+            cmd.extend(['-d', device])
+        if fast and task == 'total':
+            cmd.append('--fast')
+        return cmd
+
+    def run(self, input_path: Path, seg_dir: Path, task: str = 'total', fast: bool = True,
+            device: str = 'gpu', on_progress: Optional[ProgressCallback] = None) -> Segmentation:
+        """
+        Segment input_path. The in-process backend returns masks in memory and
+        writes nothing; the subprocess backend writes masks into seg_dir.
+        on_progress(fraction, detail) is called as the CLI reports progress.
+        Raises subprocess.CalledProcessError / TimeoutExpired like subprocess.run.
+        """
+        start = time.time()
+        if self.backend == 'inprocess':
+            seg = self._run_inprocess(input_path, task, fast, device)
+        else:
+            seg = self._run_subprocess(input_path, seg_dir, task, fast, device, on_progress)
+        if on_progress:
+            on_progress(1.0, None)
+        print(f"[totalseg] Task '{task}' finished in {time.time() - start:.1f}s")
+        return seg
+
+    def _run_inprocess(self, input_path: Path, task: str, fast: bool, device: str) -> Segmentation:
+        self.warm_up()
+        from totalsegmentator.python_api import totalsegmentator
+        from totalsegmentator.map_to_binary import class_map
+
+        threads = {}
+        if self.nr_thr_resamp is not None:
+            threads['nr_thr_resamp'] = self.nr_thr_resamp
+        if self.nr_thr_saving is not None:
+            threads['nr_thr_saving'] = self.nr_thr_saving
+        # Pass the path, not a loaded image: TotalSegmentator converts DICOM zips/folders itself
+        seg_img = totalsegmentator(
+            input_path, None, ml=True, task=task, fast=fast and task == 'total',
+            device=device, quiet=True, **threads,
+        )
+        labels = np.asanyarray(seg_img.dataobj).astype(np.uint8, copy=False)
+        return Segmentation(
+            seg_img.affine,
+            tuple(float(z) for z in seg_img.header.get_zooms()[:3]),
+            labels=labels,
+            label_names=dict(class_map[task]),
+        )
+
+    def _run_subprocess(self, input_path: Path, seg_dir: Path, task: str, fast: bool, device: str,
+                        on_progress: Optional[ProgressCallback] = None) -> Segmentation:
+        env = os.environ.copy()
+        env['PYTHONUNBUFFERED'] = '1'  # otherwise the CLI's stdout arrives in 8 KB blocks
+        if device == 'cpu':
+            env['CUDA_VISIBLE_DEVICES'] = ''
+        elif device.startswith('gpu:'):
+            # Pin the child to that GPU, mapping through our own CUDA_VISIBLE_DEVICES if set
+            index = int(device.split(':', 1)[1])
+            visible = [v.strip() for v in env.get('CUDA_VISIBLE_DEVICES', '').split(',') if v.strip()]
+            env['CUDA_VISIBLE_DEVICES'] = visible[index] if index < len(visible) else str(index)
+            device = 'gpu'
+        cmd = self.build_command(input_path, seg_dir, task, fast, device)
+        print(f"[totalseg] Running: {' '.join(cmd)}")
+
+        # Stream stdout and stderr line by line instead of buffering the whole log
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, bufsize=1, env=env)
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(self.timeout, kill) if self.timeout else None
+        if timer:
+            timer.start()
+        tail = deque(maxlen=OUTPUT_TAIL_LINES)
+        tracker = CliProgress(on_progress)
+        try:
+            for line in proc.stdout:
+                line = line.rstrip()
+                if not line:
+                    continue
+                if not tracker.feed(line):
+                    # Bar updates are only progress; everything else is the log
+                    print(f"[totalseg] {line}")
+                tail.append(line)
+            returncode = proc.wait()
+        finally:
+            if timer:
+                timer.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, self.timeout, output='\n'.join(tail))
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, output='\n'.join(tail), stderr='\n'.join(tail))
+        return Segmentation.from_directory(seg_dir)
+
+
+class CliProgress:
+    """Turns TotalSegmentator CLI output into on_progress(fraction, detail) calls"""
+
+    def __init__(self, on_progress: Optional[ProgressCallback] = None):
+        self.on_progress = on_progress
+        self.part, self.parts = 1, 1
+        self.detail = None
+
+    def feed(self, line: str) -> bool:
+        """Consume one output line; True when it was a progress bar update"""
+        match = PART_RE.search(line)
+        if match:
+            self.part, self.parts = int(match.group(1)), max(int(match.group(2)), 1)
+            self.detail = f"AI is segmenting your study (part {self.part} of {self.parts})..."
+            self._report(0)
+            return False
+        match = PERCENT_RE.search(line)
+        if match:
+            self._report(min(int(match.group(1)), 100))
+            return True
+        return False
+
+    def _report(self, percent: int):
+        if self.on_progress:
+            self.on_progress(((self.part - 1) + percent / 100) / self.parts, self.detail)
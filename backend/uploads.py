@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Streaming multipart uploads for the local FastAPI server (app.py)
+The file part is written to the job directory chunk by chunk as the request
+body arrives, so an upload never sits in memory (or in a spooled temp file)
+in full. The size cap is enforced while streaming, the content is hashed on
+the way through and the first bytes are checked for a NIfTI header or a zip
+(a DICOM series) so a wrong file is rejected before the rest is transferred.
+"""
+
+import os
+import zlib
+import struct
+import hashlib
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+APP_MAX_UPLOAD_MB = int(os.environ.get('APP_MAX_UPLOAD_MB', '2048'))
+# Streaming hash of the upload ('' disables it)
+APP_UPLOAD_HASH = os.environ.get('APP_UPLOAD_HASH', 'sha256').lower()
+
+FILE_FIELD = 'file'
+MAX_FIELD_BYTES = 1024
+# Decompressed bytes needed to see a NIfTI-2 header (NIfTI-1 needs 348)
+HEADER_BYTES = 540
+DICOM_PREAMBLE = 128
+# The upload is saved as input<ext>, never under the client's file name
+INPUT_STEM = 'input'
+FORMAT_SUFFIXES = {'nifti': '.nii', 'nifti-gz': '.nii.gz', 'zip': '.zip'}
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """'nifti', 'nifti-gz', 'dicom' or 'zip' from the first bytes; None when unrecognised"""
+    if head[:2] == b'\x1f\x8b':
+        try:
+            inner = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head, HEADER_BYTES)
+        except zlib.error:
+            return None
+        return 'nifti-gz' if _is_nifti(inner) else None
+    if _is_nifti(head):
+        return 'nifti'
+    if head[DICOM_PREAMBLE:DICOM_PREAMBLE + 4] == b'DICM':
+        return 'dicom'
+    if head[:4] == b'PK\x03\x04':
+        # DICOM series are uploaded zipped; the members are checked by the reader
+        return 'zip'
+    return None
+
+
+def _is_nifti(header: bytes) -> bool:
+    if len(header) >= 348:
+        for order in '<>':
+            if struct.unpack(order + 'i', header[:4])[0] == 348 and header[344:348] in (b'n+1\0', b'ni1\0'):
+                return True
+    if len(header) >= 8:
+        for order in '<>':
+            if struct.unpack(order + 'i', header[:4])[0] == 540 and header[4:8] in (b'n+2\0', b'ni2\0'):
+                return True
+    return False
+
+
+class _FileSink:
+    """
+    Writes the file part to disk, hashing and checking the header as it goes.
+    The data lands in input.part and is renamed to input<ext> once the format is known.
+    """
+
+    def __init__(self, dest_dir: Path, max_bytes: int, hash_name: str):
+        self.path = dest_dir / f"{INPUT_STEM}.part"
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.format: Optional[str] = None
+        self.head = b''
+        self.hash = hashlib.new(hash_name) if hash_name else None
+        self.file = open(self.path, 'wb')
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadError(413, f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB")
+        if self.format is None:
+            self.head += data
+            if len(self.head) >= 4096:
+                self._check_header()
+        if self.hash:
+            self.hash.update(data)
+        self.file.write(data)
+
+    def _check_header(self):
+        self.format = sniff_format(self.head)
+        self.head = b''
+        if self.format is None:
+            raise UploadError(415, "Not a NIfTI (.nii/.nii.gz) or DICOM file")
+        if self.format == 'dicom':
+            # Neither local backend can segment a lone slice: the series must come zipped
+            raise UploadError(415, "Single DICOM files are not supported; upload the series as a .zip")
+
+    def close(self):
+        self.file.close()
+        if self.format is None and self.size:
+            self._check_header()
+        if self.format:
+            self.path = self.path.replace(self.path.with_name(INPUT_STEM + FORMAT_SUFFIXES[self.format]))
+
+
+class UploadResult:
+    def __init__(self, path: Path, size: int, file_format: str, digest: Optional[str], fields: Dict[str, str]):
+        self.path = path
+        self.size = size
+        self.format = file_format
+        self.digest = digest
+        self.fields = fields
+
+
+async def receive_upload(headers, stream: AsyncIterator[bytes], dest_dir: Path,
+                         max_bytes: int = APP_MAX_UPLOAD_MB * 1024 * 1024,
+                         hash_name: str = APP_UPLOAD_HASH) -> UploadResult:
+    """
+    Parse a multipart/form-data body from stream, writing the 'file' part into
+    dest_dir and returning it with the other form fields. Raises UploadError.
+    """
+    content_type, params = parse_options_header(headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in params:
+        raise UploadError(400, "Expected multipart/form-data")
+    declared = headers.get('content-length')
+    if declared and declared.isdigit() and int(declared) > max_bytes + 64 * 1024:
+        raise UploadError(413, f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+
+    fields: Dict[str, str] = {}
+    state = {'header_field': b'', 'header_value': b'', 'headers': {}, 'name': None, 'value': b'', 'sink': None}
+    sinks = []
+
+    def on_part_begin():
+        state.update(headers={}, name=None, value=b'', sink=None)
+
+    def on_header_field(data, start, end):
+        state['header_field'] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state['header_value'] += data[start:end]
+
+    def on_header_end():
+        state['headers'][state['header_field'].lower()] = state['header_value']
+        state['header_field'] = state['header_value'] = b''
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state['headers'].get(b'content-disposition', b''))
+        name = disposition.get(b'name', b'').decode('utf-8', 'replace')
+        state['name'] = name
+        if name == FILE_FIELD:
+            if sinks:
+                raise UploadError(400, "Only one file per request")
+            state['sink'] = _FileSink(dest_dir, max_bytes, hash_name)
+            sinks.append(state['sink'])
+
+    def on_part_data(data, start, end):
+        if state['sink']:
+            state['sink'].write(data[start:end])
+        else:
+            state['value'] += data[start:end]
+            if len(state['value']) > MAX_FIELD_BYTES:
+                raise UploadError(400, f"Form field '{state['name']}' is too long")
+
+    def on_part_end():
+        if state['sink'] is None and state['name']:
+            fields[state['name']] = state['value'].decode('utf-8', 'replace')
+
+    parser = MultipartParser(params[b'boundary'], {
+        'on_part_begin': on_part_begin,
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': on_part_end,
+    })
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+        parser.finalize()
+    finally:
+        for sink in sinks:
+            sink.file.close()
+
+    if not sinks:
+        raise UploadError(400, f"Missing '{FILE_FIELD}' part")
+    sink = sinks[0]
+    sink.close()
+    if sink.size == 0:
+        raise UploadError(400, "Empty upload")
+    return UploadResult(sink.path, sink.size, sink.format, sink.hash.hexdigest() if sink.hash else None, fields)
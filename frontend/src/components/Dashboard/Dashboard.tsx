@@ -2,12 +2,15 @@ import { useState, useEffect, useRef } from 'react'
 import { fetchAuthSession, signOut } from 'aws-amplify/auth'
 import { Upload, Eye, Download, LogOut, Trash2, Smartphone, Copy, Check } from 'lucide-react'
 import { ProcessingStatus } from '../ProcessingStatus'
+import { WSClient, WSMessage } from '../../services/ws'
 import './Dashboard.css'
 
 interface Image {
   jobId: string
   filename: string
   status: string
+  progress?: number
+  message?: string
   createdAt: number
   downloadUrl?: string
   inputFile: string
@@ -32,6 +35,8 @@ interface DashboardProps {
 export function Dashboard({ onUploadNewStudy, onViewStudy }: DashboardProps) {
   const [images, setImages] = useState<Image[]>([])
   const [loading, setLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [selectedImage, setSelectedImage] = useState<Image | null>(null)
   const [imageToDelete, setImageToDelete] = useState<Image | null>(null)
   const [deleting, setDeleting] = useState(false)
@@ -39,6 +44,14 @@ export function Dashboard({ onUploadNewStudy, onViewStudy }: DashboardProps) {
   const [generatingCode, setGeneratingCode] = useState(false)
   const [copied, setCopied] = useState(false)
   const pollingIntervalRef = useRef<number | null>(null)
+  // The polling interval callback is created once, so it reads the latest list through a ref
+  const imagesRef = useRef<Image[]>([])
+  imagesRef.current = images
+  // Status pushes over WebSocket (VITE_WS_URL); polling below is the fallback while it is down
+  const wsRef = useRef<WSClient | null>(null)
+  const subscribedRef = useRef<Set<string>>(new Set())
+  const [wsEpoch, setWsEpoch] = useState(0)
+  const hasActiveJobs = images.some(img => img.status === 'queued' || img.status === 'processing')
 
   useEffect(() => {
     const controller = new AbortController()
@@ -63,8 +76,9 @@ export function Dashboard({ onUploadNewStudy, onViewStudy }: DashboardProps) {
       // Start polling every 30 seconds
       console.log('[Dashboard] Starting polling for processing jobs')
       pollingIntervalRef.current = window.setInterval(() => {
+        if (wsRef.current?.connected) return
         console.log('[Dashboard] Polling for status updates')
-        loadImages(undefined, true)
+        refreshActiveStatuses()
       }, 30000) // 30 seconds
     } else if (!hasProcessingJobs && pollingIntervalRef.current) {
       // Stop polling when no processing jobs
@@ -81,17 +95,75 @@ export function Dashboard({ onUploadNewStudy, onViewStudy }: DashboardProps) {
     }
   }, [images])
 
-  async function loadImages(signal?: AbortSignal, isPolling = false) {
+  // Open the status socket while jobs are active; reconnect a few seconds after it drops
+  useEffect(() => {
+    const wsUrl = import.meta.env.VITE_WS_URL
+    if (!wsUrl || !hasActiveJobs) return
+    let cancelled = false
+    let retryTimer: number | undefined
+
+    ;(async () => {
+      const session = await fetchAuthSession()
+      const token = session.tokens?.accessToken?.toString()
+      if (cancelled || !token) return
+      const client = new WSClient(wsUrl, token)
+      client.connect(handleStatusPush, () => {
+        if (wsRef.current === client) wsRef.current = null
+        subscribedRef.current = new Set()
+        if (!cancelled) retryTimer = window.setTimeout(() => setWsEpoch(e => e + 1), 5000)
+      })
+      wsRef.current = client
+      subscribeActiveJobs()
+    })().catch(error => console.error('[Dashboard] WebSocket setup failed:', error))
+
+    return () => {
+      cancelled = true
+      window.clearTimeout(retryTimer)
+      wsRef.current?.close()
+      wsRef.current = null
+      subscribedRef.current = new Set()
+    }
+  }, [hasActiveJobs, wsEpoch])
+
+  // Subscribe jobs that became active (new uploads, next pages) on the open socket
+  useEffect(() => {
+    subscribeActiveJobs()
+  }, [images])
+
+  function subscribeActiveJobs() {
+    if (!wsRef.current) return
+    const newIds = imagesRef.current
+      .filter(img => (img.status === 'queued' || img.status === 'processing') && !subscribedRef.current.has(img.jobId))
+      .map(img => img.jobId)
+    if (!newIds.length) return
+    newIds.forEach(id => subscribedRef.current.add(id))
+    wsRef.current.subscribe(newIds)
+  }
+
+  function handleStatusPush(m: WSMessage) {
+    if (m.type !== 'job') return
+    setImages(prev => prev.map(img => img.jobId !== m.jobId ? img : {
+      ...img,
+      status: m.status ?? img.status,
+      progress: m.progress ?? img.progress,
+      message: m.message ?? img.message
+    }))
+  }
+
+  async function loadImages(signal?: AbortSignal, isPolling = false, cursor?: string) {
     try {
-      if (!isPolling) setLoading(true)
+      if (cursor) setLoadingMore(true)
+      else if (!isPolling) setLoading(true)
       const session = await fetchAuthSession()
       const token = session.tokens?.idToken?.toString()
       const userId = session.tokens?.idToken?.payload?.sub
 
       console.log('[Dashboard] Loading images for user:', userId)
 
+      const query = new URLSearchParams({ limit: '25' })
+      if (cursor) query.set('cursor', cursor)
       const response = await fetch(
-        `${import.meta.env.VITE_BACKEND_URL}/my-images`,
+        `${import.meta.env.VITE_BACKEND_URL}/my-images?${query}`,
         {
           signal,
           headers: {
@@ -116,7 +188,8 @@ export function Dashboard({ onUploadNewStudy, onViewStudy }: DashboardProps) {
           createdAt: img.createdAt
         }))
       })
-      setImages(data.images || [])
+      setImages(prev => cursor ? [...prev, ...(data.images || [])] : (data.images || []))
+      setNextCursor(data.nextCursor || null)
     } catch (error: any) {
       if (error.name === 'AbortError') {
         console.log('[Dashboard] Request aborted')
@@ -127,7 +200,96 @@ export function Dashboard({ onUploadNewStudy, onViewStudy }: DashboardProps) {
           alert(`Failed to load studies: ${error instanceof Error ? error.message : 'Unknown error'}`)
       }
     } finally {
-      if (!isPolling) setLoading(false)
+      if (cursor) setLoadingMore(false)
+      else if (!isPolling) setLoading(false)
+    }
+  }
+
+  // The list is not presigned; fetch one study's input/artifact URLs when they are needed
+  async function fetchStudyUrls(img: Image): Promise<Image> {
+    try {
+      const session = await fetchAuthSession()
+      const token = session.tokens?.idToken?.toString()
+
+      const response = await fetch(
+        `${import.meta.env.VITE_BACKEND_URL}/my-images/${img.jobId}/artifacts`,
+        {
+          headers: {
+            'Authorization': `Bearer ${token}`
+          }
+        }
+      )
+
+      if (!response.ok) {
+        throw new Error(`Error: ${response.status}`)
+      }
+
+      const data = await response.json()
+      const updated: Image = {
+        ...img,
+        status: data.status ?? img.status,
+        downloadUrl: data.downloadUrl ?? undefined,
+        artifacts: data.artifacts ?? img.artifacts,
+        artifactUrls: data.artifactUrls && Object.keys(data.artifactUrls).length ? data.artifactUrls : img.artifactUrls
+      }
+      setImages(prev => prev.map(i => i.jobId === img.jobId ? updated : i))
+      return updated
+    } catch (error) {
+      console.error('[Dashboard] Error loading study URLs:', error)
+      return img
+    }
+  }
+
+  async function openDetails(img: Image) {
+    setSelectedImage(img)
+    const updated = await fetchStudyUrls(img)
+    setSelectedImage(current => current?.jobId === img.jobId ? updated : current)
+  }
+
+  // Poll only the active jobs, all in one request to the bulk status endpoint
+  async function refreshActiveStatuses() {
+    const activeIds = imagesRef.current
+      .filter(img => img.status === 'queued' || img.status === 'processing')
+      .map(img => img.jobId)
+      .slice(0, 100)
+    if (!activeIds.length) return
+
+    try {
+      const session = await fetchAuthSession()
+      const token = session.tokens?.idToken?.toString()
+
+      const response = await fetch(
+        `${import.meta.env.VITE_BACKEND_URL}/jobs/status`,
+        {
+          method: 'POST',
+          headers: {
+            'Authorization': `Bearer ${token}`,
+            'Content-Type': 'application/json'
+          },
+          body: JSON.stringify({ jobIds: activeIds })
+        }
+      )
+
+      if (!response.ok) {
+        throw new Error(`Error: ${response.status}`)
+      }
+
+      const data = await response.json()
+      const jobs: { [jobId: string]: Partial<Image> } = data.jobs || {}
+      setImages(prev => prev.map(img => {
+        const job = jobs[img.jobId]
+        if (!job) return img
+        return {
+          ...img,
+          status: job.status ?? img.status,
+          progress: job.progress ?? img.progress,
+          message: job.message ?? img.message,
+          artifacts: job.artifacts ?? img.artifacts,
+          artifactUrls: job.artifactUrls && Object.keys(job.artifactUrls).length ? job.artifactUrls : img.artifactUrls
+        }
+      }))
+    } catch (error) {
+      console.error('[Dashboard] Error refreshing job statuses:', error)
     }
   }
 
@@ -314,7 +476,7 @@ export function Dashboard({ onUploadNewStudy, onViewStudy }: DashboardProps) {
             <div
               key={img.jobId}
               className="image-card"
-              onClick={() => setSelectedImage(img)}
+              onClick={() => openDetails(img)}
             >
               <div className="image-card-header">
                 <h3>{img.filename}</h3>
@@ -332,7 +494,9 @@ export function Dashboard({ onUploadNewStudy, onViewStudy }: DashboardProps) {
                   <ProcessingStatus 
                     jobId={img.jobId} 
                     status={img.status}
-                    onComplete={() => loadImages()}
+                    progress={img.progress}
+                    message={img.message}
+                    onComplete={() => refreshActiveStatuses()}
                   />
                 </div>
               )}
@@ -358,13 +522,14 @@ export function Dashboard({ onUploadNewStudy, onViewStudy }: DashboardProps) {
                 )}
                 <button 
                   className="btn-view"
-                  onClick={(e) => {
+                  onClick={async (e) => {
                     e.stopPropagation()
-                    if (onViewStudy && img.downloadUrl) {
+                    const study = await fetchStudyUrls(img)
+                    if (onViewStudy && study.downloadUrl) {
                       // Prefer artifactUrls (signed), fallback to expectedArtifacts (s3:// - useless for frontend fetch but kept for metadata)
-                      onViewStudy(img.downloadUrl, img.jobId, img.filename, img.artifactUrls || img.expectedArtifacts)
+                      onViewStudy(study.downloadUrl, study.jobId, study.filename, study.artifactUrls || study.expectedArtifacts)
                     } else {
-                      setSelectedImage(img)
+                      setSelectedImage(study)
                     }
                   }}
                 >
@@ -387,6 +552,17 @@ export function Dashboard({ onUploadNewStudy, onViewStudy }: DashboardProps) {
         </div>
       )}
 
+      {nextCursor && (
+        <div className="load-more">
+          <button
+            onClick={() => loadImages(undefined, false, nextCursor)}
+            disabled={loadingMore}
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
+
       {/* VR Code Modal */}
       {vrCode && (
         <div className="modal-overlay" onClick={() => setVrCode(null)}>
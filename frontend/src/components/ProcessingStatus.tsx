@@ -4,10 +4,12 @@ import { Loader2, CheckCircle, XCircle, Clock, Cpu } from 'lucide-react'
 interface ProcessingStatusProps {
   jobId: string
   status: string
+  progress?: number
+  message?: string
   onComplete?: () => void
 }
 
-export function ProcessingStatus({ jobId, status, onComplete }: ProcessingStatusProps) {
+export function ProcessingStatus({ jobId, status, progress, message, onComplete }: ProcessingStatusProps) {
   const [currentStatus, setCurrentStatus] = useState(status)
   const [elapsedTime, setElapsedTime] = useState(0)
   const [estimatedTimeRemaining, setEstimatedTimeRemaining] = useState('15-25 min')
@@ -102,6 +104,8 @@ export function ProcessingStatus({ jobId, status, onComplete }: ProcessingStatus
 
   const statusDisplay = getStatusDisplay()
   const isProcessing = currentStatus === 'queued' || currentStatus === 'processing'
+  // Real progress is reported by the worker once it starts; until then show the placeholder bar
+  const hasProgress = currentStatus === 'processing' && typeof progress === 'number'
 
   return (
     <div className={`rounded-lg border p-4 ${statusDisplay.bg}`}>
@@ -121,7 +125,7 @@ export function ProcessingStatus({ jobId, status, onComplete }: ProcessingStatus
             )}
           </div>
           <p className="text-xs text-muted-foreground mb-2">
-            {statusDisplay.description}
+            {hasProgress && message ? message : statusDisplay.description}
           </p>
           
           {isProcessing && (
@@ -129,9 +133,9 @@ export function ProcessingStatus({ jobId, status, onComplete }: ProcessingStatus
               {/* Progress bar */}
               <div className="w-full bg-muted rounded-full h-2 mb-2 overflow-hidden">
                 <div 
-                  className={`h-full ${statusDisplay.color.replace('text-', 'bg-')} transition-all duration-1000 animate-pulse`}
+                  className={`h-full ${statusDisplay.color.replace('text-', 'bg-')} transition-all duration-1000 ${hasProgress ? '' : 'animate-pulse'}`}
                   style={{ 
-                    width: currentStatus === 'queued' ? '30%' : '70%',
+                    width: hasProgress ? `${progress}%` : currentStatus === 'queued' ? '30%' : '70%',
                     transition: 'width 2s ease-in-out'
                   }}
                 />
@@ -140,7 +144,7 @@ export function ProcessingStatus({ jobId, status, onComplete }: ProcessingStatus
               {/* Estimated time */}
               <div className="flex items-center justify-between text-xs">
                 <span className="text-muted-foreground">
-                  {currentStatus === 'queued' ? 'Starting up...' : 'Processing...'}
+                  {currentStatus === 'queued' ? 'Starting up...' : hasProgress ? `${progress}%` : 'Processing...'}
                 </span>
                 <span className="text-muted-foreground">
                   ~{estimatedTimeRemaining} remaining
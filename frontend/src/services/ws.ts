@@ -1,14 +1,19 @@
-type WSMessage = {
+export type WSMessage = {
+  type: 'job' | 'error'
   jobId: string
-  status: 'PENDING' | 'RUNNING' | 'SUCCEEDED' | 'FAILED'
-  progress: number
+  status?: 'pending' | 'queued' | 'processing' | 'completed' | 'failed'
+  progress?: number
+  stage?: string
   message?: string
+  errorMessage?: string
+  error?: string
 }
 
 export class WSClient {
   private ws?: WebSocket
   private url: string
   private token?: string
+  private pending: string[] = []
 
   constructor(url: string, token?: string) {
     this.url = url
@@ -19,6 +24,10 @@ export class WSClient {
     const url = new URL(this.url)
     if (this.token) url.searchParams.set('token', this.token)
     this.ws = new WebSocket(url.toString())
+    this.ws.onopen = () => {
+      this.pending.forEach(data => this.ws?.send(data))
+      this.pending = []
+    }
     this.ws.onmessage = (ev) => {
       try {
         const data = JSON.parse(ev.data) as WSMessage
@@ -30,6 +39,17 @@ export class WSClient {
     this.ws.onclose = () => onClose?.()
   }
 
+  // The current state of each job is pushed back right after subscribing
+  subscribe(jobIds: string[]) {
+    const data = JSON.stringify({ action: 'subscribe', jobIds })
+    if (this.ws?.readyState === WebSocket.OPEN) this.ws.send(data)
+    else this.pending.push(data)
+  }
+
+  get connected() {
+    return this.ws?.readyState === WebSocket.OPEN
+  }
+
   close() {
     this.ws?.close()
   }